@@ -4,6 +4,38 @@ import { useAuth } from './AuthContext';
 
 const CartContext = createContext();
 
+// Attach product details to compact cart lines (Cart/Checkout read item.product)
+const withProducts = (items, products) =>
+    items.map((item) => ({ ...item, product: products[item.product_id] }));
+
+const fromCompact = (data) => {
+    const products = data.products || {};
+    return { ...data, products, items: withProducts(data.items, products) };
+};
+
+// Merge a mutation delta into the current cart without refetching it
+const applyDelta = (cart, delta) => {
+    const products = delta.product
+        ? { ...(cart?.products || {}), [delta.product.id]: delta.product }
+        : cart?.products || {};
+    let items = (cart?.items || []).filter((item) => item.id !== delta.removed);
+    if (delta.line) {
+        const exists = items.some((item) => item.id === delta.line.id);
+        items = exists
+            ? items.map((item) => (item.id === delta.line.id ? delta.line : item))
+            : [...items, delta.line];
+    }
+    return {
+        ...cart,
+        id: delta.id,
+        version: delta.version,
+        item_count: delta.item_count,
+        total: delta.total,
+        products,
+        items: withProducts(items, products)
+    };
+};
+
 export const useCart = () => {
     const context = useContext(CartContext);
     if (!context) {
@@ -29,7 +61,7 @@ export const CartProvider = ({ children }) => {
         try {
             setLoading(true);
             const cartData = await cartService.getCart();
-            setCart(cartData);
+            setCart(fromCompact(cartData));
         } catch (error) {
             console.error('Error fetching cart:', error);
         } finally {
@@ -39,8 +71,8 @@ export const CartProvider = ({ children }) => {
 
     const addToCart = async (productId, quantity = 1, selectedColor = null, selectedSize = null) => {
         try {
-            const updatedCart = await cartService.addToCart(productId, quantity, selectedColor, selectedSize);
-            setCart(updatedCart);
+            const delta = await cartService.addToCart(productId, quantity, selectedColor, selectedSize);
+            setCart((current) => applyDelta(current, delta));
             return { success: true };
         } catch (error) {
             return { success: false, error: error.response?.data?.error || 'Failed to add to cart' };
@@ -49,8 +81,8 @@ export const CartProvider = ({ children }) => {
 
     const updateCartItem = async (itemId, quantity) => {
         try {
-            const updatedCart = await cartService.updateCartItem(itemId, quantity);
-            setCart(updatedCart);
+            const delta = await cartService.updateCartItem(itemId, quantity);
+            setCart((current) => applyDelta(current, delta));
             return { success: true };
         } catch (error) {
             return { success: false, error: error.response?.data?.error || 'Failed to update cart' };
@@ -59,18 +91,28 @@ export const CartProvider = ({ children }) => {
 
     const removeFromCart = async (itemId) => {
         try {
-            const updatedCart = await cartService.removeFromCart(itemId);
-            setCart(updatedCart);
+            const delta = await cartService.removeFromCart(itemId);
+            setCart((current) => applyDelta(current, delta));
             return { success: true };
         } catch (error) {
             return { success: false, error: error.response?.data?.error || 'Failed to remove item' };
         }
     };
 
+    const applyCartOperations = async (operations) => {
+        try {
+            const cartData = await cartService.batchUpdate(operations);
+            setCart(fromCompact(cartData));
+            return { success: true };
+        } catch (error) {
+            return { success: false, error: error.response?.data?.error || 'Failed to update cart' };
+        }
+    };
+
     const clearCart = async () => {
         try {
             await cartService.clearCart();
-            setCart({ items: [], total: 0 });
+            setCart((current) => ({ ...current, items: [], item_count: 0, total: 0 }));
             return { success: true };
         } catch (error) {
             return { success: false, error: error.response?.data?.error || 'Failed to clear cart' };
@@ -93,6 +135,7 @@ export const CartProvider = ({ children }) => {
         addToCart,
         updateCartItem,
         removeFromCart,
+        applyCartOperations,
         clearCart,
         refreshCart: fetchCart,
         cartItemCount: getCartItemCount(),
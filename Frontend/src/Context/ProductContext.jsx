@@ -4,6 +4,9 @@ import { categoryService } from '../services/categoryService';
 
 const ProductContext = createContext();
 
+// Fields rendered by ProductCard; detail-only fields (images, options) are skipped
+const LISTING_FIELDS = ['id', 'name', 'description', 'price', 'old_price', 'image_url', 'stock', 'category_id'];
+
 export const useProducts = () => {
     const context = useContext(ProductContext);
     if (!context) {
@@ -17,6 +20,8 @@ export const ProductProvider = ({ children }) => {
     const [categories, setCategories] = useState([]);
     const [featuredProducts, setFeaturedProducts] = useState([]);
     const [loading, setLoading] = useState(false);
+    const [facets, setFacets] = useState(null);
+    const [listing, setListing] = useState({ categorySlug: null, filters: {}, nextCursor: null, hasMore: false });
 
     useEffect(() => {
         fetchCategories();
@@ -32,11 +37,13 @@ export const ProductProvider = ({ children }) => {
         }
     };
 
-    const fetchProducts = async (categorySlug = null) => {
+    const fetchProducts = async (categorySlug = null, filters = {}) => {
         try {
             setLoading(true);
-            const data = await productService.getProducts(categorySlug);
+            const data = await productService.getProducts(categorySlug, { fields: LISTING_FIELDS, filters, facets: true });
             setProducts(data.products || []);
+            setFacets(data.facets || null);
+            setListing({ categorySlug, filters, nextCursor: data.next_cursor, hasMore: !!data.has_more });
         } catch (error) {
             console.error('Error fetching products:', error);
         } finally {
@@ -44,6 +51,24 @@ export const ProductProvider = ({ children }) => {
         }
     };
 
+    const fetchMoreProducts = async () => {
+        if (!listing.hasMore) return;
+        try {
+            setLoading(true);
+            const data = await productService.getProducts(listing.categorySlug, {
+                cursor: listing.nextCursor,
+                fields: LISTING_FIELDS,
+                filters: listing.filters
+            });
+            setProducts((current) => [...current, ...(data.products || [])]);
+            setListing({ ...listing, nextCursor: data.next_cursor, hasMore: !!data.has_more });
+        } catch (error) {
+            console.error('Error fetching more products:', error);
+        } finally {
+            setLoading(false);
+        }
+    };
+
     const fetchFeaturedProducts = async () => {
         try {
             const data = await productService.getFeaturedProducts();
@@ -68,7 +93,10 @@ export const ProductProvider = ({ children }) => {
         categories,
         featuredProducts,
         loading,
+        facets,
+        hasMoreProducts: listing.hasMore,
         fetchProducts,
+        fetchMoreProducts,
         fetchFeaturedProducts,
         getProductById
     };
@@ -24,6 +24,7 @@ export default function Checkout() {
     const [loading, setLoading] = useState(false);
     const [orderId, setOrderId] = useState(null);
     const [paymentStatus, setPaymentStatus] = useState('pending');
+    const [stopWatching, setStopWatching] = useState(null);
 
     useEffect(() => {
         if (!isAuthenticated) {
@@ -34,6 +35,9 @@ export default function Checkout() {
         }
     }, [isAuthenticated, cart]);
 
+    // Close the payment status stream when leaving the page
+    useEffect(() => () => stopWatching?.(), [stopWatching]);
+
     const handleChange = (e) => {
         setFormData({
             ...formData,
@@ -68,17 +72,26 @@ export default function Checkout() {
     const handlePayment = async () => {
         setLoading(true);
         try {
-            const response = await paymentService.initiateMpesaPayment(orderId, formData.phone_number);
+            await paymentService.initiateMpesaPayment(orderId, formData.phone_number);
+
+            // The server pushes the outcome once the M-Pesa callback settles it
+            const stop = paymentService.watchPaymentStatus(orderId, (status) => {
+                if (status.payment_status === 'completed') {
+                    setPaymentStatus('success');
+
+                    // Redirect to home after 3 seconds
+                    setTimeout(() => {
+                        navigate('/');
+                    }, 3000);
+                } else {
+                    setPaymentStatus('failed');
+                }
+            });
+            setStopWatching(() => stop);
 
             // Simulate payment success after 2 seconds (placeholder)
-            setTimeout(async () => {
-                await paymentService.simulatePaymentSuccess(orderId);
-                setPaymentStatus('success');
-
-                // Redirect to home after 3 seconds
-                setTimeout(() => {
-                    navigate('/');
-                }, 3000);
+            setTimeout(() => {
+                paymentService.simulatePaymentSuccess(orderId);
             }, 2000);
         } catch (error) {
             setPaymentStatus('failed');
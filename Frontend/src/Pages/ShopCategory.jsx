@@ -1,15 +1,29 @@
-import React, { useEffect } from 'react';
+import React, { useEffect, useState } from 'react';
 import { useProducts } from '../Context/ProductContext';
 import ProductCard from '../components/ProductCard/ProductCard';
 import './ShopCategory.css';
 
 export default function ShopCategory({ category }) {
-    const { products, fetchProducts, loading } = useProducts();
+    const { products, facets, fetchProducts, fetchMoreProducts, hasMoreProducts, loading } = useProducts();
+    const [filters, setFilters] = useState({ colors: [], sizes: [], in_stock: null });
 
     useEffect(() => {
-        fetchProducts(category);
+        setFilters({ colors: [], sizes: [], in_stock: null });
     }, [category]);
 
+    useEffect(() => {
+        fetchProducts(category, filters);
+    }, [category, filters]);
+
+    const toggleValue = (key, value) => {
+        setFilters((current) => ({
+            ...current,
+            [key]: current[key].includes(value)
+                ? current[key].filter((item) => item !== value)
+                : [...current[key], value]
+        }));
+    };
+
     const getCategoryTitle = () => {
         switch (category) {
             case 'makeup': return 'Makeup';
@@ -32,22 +46,58 @@ export default function ShopCategory({ category }) {
             {/* Products Grid */}
             <div className="container">
                 <div className="category-content">
+                    {facets && (facets.colors.length > 0 || facets.sizes.length > 0 || facets.in_stock > 0) && (
+                        <div className="category-filters">
+                            {[['colors', 'Color'], ['sizes', 'Size']].map(([key, label]) => facets[key].length > 0 && (
+                                <div className="filter-group" key={key}>
+                                    <span className="filter-label">{label}</span>
+                                    {facets[key].map(({ value, count }) => (
+                                        <button
+                                            key={value}
+                                            className={`filter-chip ${filters[key].includes(value) ? 'active' : ''}`}
+                                            onClick={() => toggleValue(key, value)}
+                                        >
+                                            {value} ({count})
+                                        </button>
+                                    ))}
+                                </div>
+                            ))}
+                            <label className="filter-group filter-checkbox">
+                                <input
+                                    type="checkbox"
+                                    checked={filters.in_stock === true}
+                                    onChange={(e) => setFilters({ ...filters, in_stock: e.target.checked ? true : null })}
+                                />
+                                In stock only ({facets.in_stock})
+                            </label>
+                        </div>
+                    )}
+
                     <div className="category-header">
                         <p className="results-count">
-                            {loading ? 'Loading...' : `${products.length} products`}
+                            {loading && products.length === 0 ? 'Loading...' : `${products.length}${hasMoreProducts ? '+' : ''} products`}
                         </p>
                     </div>
 
-                    {loading ? (
+                    {loading && products.length === 0 ? (
                         <div className="loading-container">
                             <div className="spinner"></div>
                         </div>
                     ) : products.length > 0 ? (
-                        <div className="products-grid">
-                            {products.map((product) => (
-                                <ProductCard key={product.id} product={product} />
-                            ))}
-                        </div>
+                        <>
+                            <div className="products-grid">
+                                {products.map((product) => (
+                                    <ProductCard key={product.id} product={product} />
+                                ))}
+                            </div>
+                            {hasMoreProducts && (
+                                <div className="load-more">
+                                    <button className="btn btn-outline" onClick={fetchMoreProducts} disabled={loading}>
+                                        {loading ? 'Loading...' : 'Load more'}
+                                    </button>
+                                </div>
+                            )}
+                        </>
                     ) : (
                         <div className="no-products">
                             <p>No products found in this category.</p>
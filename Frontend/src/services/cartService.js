@@ -1,28 +1,37 @@
 import api from '../config/api';
 
 export const cartService = {
+    // Compact cart: lines (ids, quantities, unit prices) plus product details keyed by id
     async getCart() {
-        const response = await api.get('/cart');
+        const response = await api.get('/cart', { params: { view: 'compact', expand: 'products' } });
         return response.data.cart;
     },
 
+    // Mutations return a delta: { version, line, removed, item_count, total, product? }
     async addToCart(productId, quantity = 1, selectedColor = null, selectedSize = null) {
         const response = await api.post('/cart/add', {
             product_id: productId,
             quantity,
             selected_color: selectedColor,
             selected_size: selectedSize
-        });
-        return response.data.cart;
+        }, { params: { view: 'delta' } });
+        return response.data.delta;
     },
 
     async updateCartItem(itemId, quantity) {
-        const response = await api.put(`/cart/update/${itemId}`, { quantity });
-        return response.data.cart;
+        const response = await api.put(`/cart/update/${itemId}`, { quantity }, { params: { view: 'delta' } });
+        return response.data.delta;
     },
 
     async removeFromCart(itemId) {
-        const response = await api.delete(`/cart/remove/${itemId}`);
+        const response = await api.delete(`/cart/remove/${itemId}`, { params: { view: 'delta' } });
+        return response.data.delta;
+    },
+
+    // Apply many changes in one request:
+    // [{ op: 'add', product_id, quantity }, { op: 'update', item_id, quantity }, { op: 'remove', item_id }]
+    async batchUpdate(operations) {
+        const response = await api.post('/cart/batch', { operations }, { params: { expand: 'products' } });
         return response.data.cart;
     },
 
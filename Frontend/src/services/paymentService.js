@@ -14,6 +14,43 @@ export const paymentService = {
         return response.data;
     },
 
+    // Server-Sent Events: onStatus is called once when the payment settles.
+    // EventSource cannot send headers, so the stream is opened with a short-lived
+    // token for this order only; the session token never goes in a URL.
+    watchPaymentStatus(orderId, onStatus) {
+        let source = null;
+        let stopped = false;
+
+        const stop = () => {
+            stopped = true;
+            if (source) source.close();
+        };
+
+        const connect = async () => {
+            const { data } = await api.post(`/payments/${orderId}/events/token`);
+            if (stopped) return;
+            source = new EventSource(
+                `${api.defaults.baseURL}/payments/${orderId}/events?token=${encodeURIComponent(data.token)}`
+            );
+            source.addEventListener('status', (event) => {
+                stop();
+                onStatus(JSON.parse(event.data));
+            });
+            // The browser would reconnect with the same, by then expired, token
+            source.onerror = () => {
+                source.close();
+                if (!stopped) setTimeout(reconnect, 3000);
+            };
+        };
+
+        const reconnect = () => connect().catch(() => {
+            if (!stopped) setTimeout(reconnect, 3000);
+        });
+
+        reconnect();
+        return stop;
+    },
+
     async simulatePaymentSuccess(orderId) {
         const response = await api.post(`/payments/mpesa/simulate-success/${orderId}`);
         return response.data;
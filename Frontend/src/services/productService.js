@@ -1,12 +1,36 @@
 import api from '../config/api';
 
 export const productService = {
-    async getProducts(categorySlug = null) {
-        const params = categorySlug ? { category: categorySlug } : {};
+    // Returns one page: { products, next_cursor, has_more, facets? }
+    // filters: { min_price, max_price, colors: [], sizes: [], in_stock, featured }
+    async getProducts(categorySlug = null, { cursor = null, limit = null, sort = null, fields = null, filters = {}, facets = false } = {}) {
+        const params = {};
+        if (categorySlug) params.category = categorySlug;
+        Object.entries(filters).forEach(([key, value]) => {
+            if (value === null || value === undefined || value === '') return;
+            if (Array.isArray(value)) {
+                if (value.length) params[key] = value.join(',');
+            } else {
+                params[key] = value;
+            }
+        });
+        if (facets) params.facets = true;
+        if (cursor) params.cursor = cursor;
+        if (limit) params.limit = limit;
+        if (sort) params.sort = sort;
+        if (fields) params.fields = Array.isArray(fields) ? fields.join(',') : fields;
         const response = await api.get('/products', { params });
         return response.data;
     },
 
+    async searchProducts(query, { category = null, limit = null } = {}) {
+        const params = { q: query };
+        if (category) params.category = category;
+        if (limit) params.limit = limit;
+        const response = await api.get('/products/search', { params });
+        return response.data;
+    },
+
     async getProductById(id) {
         const response = await api.get(`/products/${id}`);
         return response.data.product;
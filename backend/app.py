@@ -1,25 +1,56 @@
+from importlib import import_module
 from flask import Flask, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from config import Config
 from models import db
 from services.mpesa import mpesa_service
+from services.cache import catalog_cache
+from services.identity import claims_cache
+from services.passwords import password_hasher
+from services.ratelimit import rate_limiter
+from services.instrumentation import instrumentation
+from services.http_cache import apply_cache_control
+from services.jobs import queue_stats
+from services.events import event_broker
+from services.replicas import replica_router
+from services import db_pool
 
-# Import blueprints
-from routes.auth import auth_bp
-from routes.products import products_bp
-from routes.categories import categories_bp
-from routes.cart import cart_bp
-from routes.orders import orders_bp
-from routes.payments import payments_bp
+# API blueprints ('module:attribute'), imported only when an app serves HTTP
+BLUEPRINTS = (
+    'routes.auth:auth_bp',
+    'routes.products:products_bp',
+    'routes.categories:categories_bp',
+    'routes.cart:cart_bp',
+    'routes.orders:orders_bp',
+    'routes.payments:payments_bp',
+)
 
-def create_app(config_class=Config):
-    """Application factory"""
+
+def register_blueprints(app, blueprints=BLUEPRINTS):
+    """Import and register blueprints by name"""
+    for path in blueprints:
+        module, attribute = path.split(':')
+        app.register_blueprint(getattr(import_module(module), attribute))
+
+
+def create_app(config_class=Config, blueprints=BLUEPRINTS):
+    """
+    Application factory
+    
+    Construction does no database or network I/O: engines connect on first
+    use and the schema is managed by migrate.py, not created here. Scripts
+    that only need the app context (worker, migrations, seeding) pass
+    blueprints=() and skip importing the routes.
+    """
     app = Flask(__name__)
     app.config.from_object(config_class)
     
     # Initialize extensions
+    db_pool.configure_engine(app)
     db.init_app(app)
+    db_pool.init_app(app)
+    instrumentation.init_app(app)  # first, so its timing covers the other request hooks
     CORS(
         app,
         origins=app.config.get('CORS_ORIGINS', "*"),  # list of allowed origins or '*' for all
@@ -27,30 +58,73 @@ def create_app(config_class=Config):
         methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"]
     )
     JWTManager(app)
+    catalog_cache.init_app(app)
+    claims_cache.init_app(app)
+    password_hasher.init_app(app)
+    rate_limiter.init_app(app)
+    event_broker.init_app(app)
+    replica_router.init_app(app)
+    app.after_request(apply_cache_control)
     
     # Initialize M-Pesa service
-    with app.app_context():
-        mpesa_service.initialize(app)
+    mpesa_service.initialize(app)
     
     # Register blueprints
-    app.register_blueprint(auth_bp)
-    app.register_blueprint(products_bp)
-    app.register_blueprint(categories_bp)
-    app.register_blueprint(cart_bp)
-    app.register_blueprint(orders_bp)
-    app.register_blueprint(payments_bp)
+    register_blueprints(app, blueprints)
     
     # Health check endpoint
     @app.route('/api/health', methods=['GET'])
     def health_check():
         return jsonify({'status': 'healthy', 'message': 'AfroChic API is running'}), 200
     
+    # Catalog and identity cache counters
+    @app.route('/api/health/cache', methods=['GET'])
+    def cache_stats():
+        return jsonify({'cache': catalog_cache.stats(), 'identity': claims_cache.stats()}), 200
+    
+    # Connection pool usage and checkout waits (this worker)
+    @app.route('/api/health/pool', methods=['GET'])
+    def pool_stats():
+        return jsonify({'pool': db_pool.pool_stats(db.engine)}), 200
+    
+    # Read replica lag and routing counters (this worker)
+    @app.route('/api/health/replicas', methods=['GET'])
+    def replica_stats():
+        return jsonify({'replicas': replica_router.stats()}), 200
+    
+    # Event subscribers and delivery counters
+    @app.route('/api/health/events', methods=['GET'])
+    def event_stats():
+        return jsonify({'events': event_broker.stats()}), 200
+    
+    # Rate limit policies and rejections (this worker)
+    @app.route('/api/health/ratelimit', methods=['GET'])
+    def rate_limit_stats():
+        return jsonify({'ratelimit': rate_limiter.stats()}), 200
+    
+    # Slowest normalized SQL statements (this worker; Bearer METRICS_TOKEN)
+    @app.route('/api/health/slow-queries', methods=['GET'])
+    def slow_query_stats():
+        instrumentation.authorize()
+        return jsonify({'sql': instrumentation.top_slow_queries()}), 200
+    
+    # Per-route request, SQL and rate limit metrics, Prometheus text format (this worker; Bearer METRICS_TOKEN)
+    @app.route('/api/metrics', methods=['GET'])
+    def metrics():
+        return instrumentation.metrics_view()
+    
+    # Background job queue depth
+    @app.route('/api/health/jobs', methods=['GET'])
+    def job_stats():
+        return jsonify({'jobs': queue_stats()}), 200
+    
     # Seed database endpoint (for initial setup without shell access)
     @app.route('/api/seed', methods=['POST'])
     def seed_database():
         """Seed the database with initial data. Remove this endpoint after first use for security."""
         try:
-            from models import Category, Product
+            from models import Category
+            from services.catalog_import import import_catalog
             
             # Check if data already exists
             if Category.query.first() is not None:
@@ -63,46 +137,42 @@ def create_app(config_class=Config):
                 {'name': 'Shoes & Clothes', 'slug': 'shoes-clothes', 'description': 'Fashion and apparel'}
             ]
             
-            categories = {}
-            for cat_data in categories_data:
-                category = Category(**cat_data)
-                db.session.add(category)
-                db.session.flush()
-                categories[cat_data['slug']] = category.id
+            db.session.add_all(Category(**cat_data) for cat_data in categories_data)
+            db.session.flush()
             
             # Create sample products
             products_data = [
                 {
+                    'sku': 'AFC-SEED-1',
                     'name': 'Luxury Lipstick Set',
                     'description': 'Premium matte lipstick collection',
                     'price': 29.99,
-                    'category_id': categories['makeup'],
+                    'category': 'makeup',
                     'image_url': 'https://images.unsplash.com/photo-1586495777744-4413f21062fa',
                     'stock': 50
                 },
                 {
+                    'sku': 'AFC-SEED-2',
                     'name': 'Wireless Phone Charger',
                     'description': 'Fast charging wireless pad',
                     'price': 24.99,
-                    'category_id': categories['mobile-accessories'],
+                    'category': 'mobile-accessories',
                     'image_url': 'https://images.unsplash.com/photo-1591290619762-d2c9e0a4e7e3',
                     'stock': 100
                 },
                 {
+                    'sku': 'AFC-SEED-3',
                     'name': 'Designer Sneakers',
                     'description': 'Comfortable running shoes',
                     'price': 89.99,
-                    'category_id': categories['shoes-clothes'],
+                    'category': 'shoes-clothes',
                     'image_url': 'https://images.unsplash.com/photo-1542291026-7eec264c27ff',
                     'stock': 30
                 }
             ]
             
-            for prod_data in products_data:
-                product = Product(**prod_data)
-                db.session.add(product)
-            
-            db.session.commit()
+            # Commits the categories along with the products
+            import_catalog(products_data)
             
             return jsonify({
                 'message': 'Database seeded successfully',
@@ -114,12 +184,24 @@ def create_app(config_class=Config):
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
     
-    # Create database tables
-    with app.app_context():
-        db.create_all()
+    return app
+
 
+def reset_after_fork(app):
+    """
+    Drop process-local state a forked worker inherited from a preloaded master
     
-    return app
+    Pooled database connections, the M-Pesa HTTP session, the password
+    hashing pool and file-backed cache/event/rate-limit stores must not be shared
+    between processes, so each worker rebuilds them on first use.
+    """
+    with app.app_context():
+        db.engine.dispose(close=False)
+    mpesa_service.initialize(app)
+    password_hasher.reset()
+    rate_limiter.reset()
+    catalog_cache.init_app(app)
+    event_broker.init_app(app)
 
 if __name__ == '__main__':
     app = create_app()
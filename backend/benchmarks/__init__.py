@@ -0,0 +1,6 @@
+"""
+Benchmarks and query-budget checks for the AfroChic API
+
+Run from the backend directory, e.g.:
+    python -m benchmarks.catalog_queries
+"""
@@ -0,0 +1,149 @@
+"""
+Replay bursts of duplicate M-Pesa callbacks
+
+Creates `payments` pending payments (each with an order holding one unit of
+stock), then posts every Daraja callback `copies` times, shuffled, from a
+thread pool through POST /api/payments/mpesa/callback, the way Safaricom
+retries deliveries it considers lost. Every payment must settle exactly
+once: one ledger row per CheckoutRequestID, paid orders keep their stock,
+cancelled ones return it, and repeats change nothing. A callback posted
+without the callback secret, or paying the wrong amount, must settle nothing.
+
+Uses a file-backed SQLite database by default; set BENCH_DATABASE_URI to run
+against PostgreSQL.
+
+    python -m benchmarks.callback_replay [--payments 2000] [--copies 3] [--threads 16]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from models import db, Category, MpesaCallback, Order, Payment, Product, StockReservation, User
+from benchmarks.common import BenchmarkConfig, CALLBACK_URL, QueryCounter, make_app, timer
+from benchmarks.fake_daraja import callback_payload
+from benchmarks.stock_race import CHECKOUT
+
+
+def seed(payments):
+    """One buyer with `payments` unpaid orders, each holding one unit and awaiting its callback"""
+    category = Category(name='Flash Sale', slug='flash-sale')
+    product = Product(name='Flash Sale Sneakers', price=2500, category=category, stock=0,
+                      image_url='https://example.com/products/flash.jpg')
+    user = User(email='buyer@example.com', password_hash='-', full_name='Buyer',
+                phone_number=CHECKOUT['phone_number'])
+    db.session.add_all([product, user])
+    db.session.flush()
+    
+    details = {key: value for key, value in CHECKOUT.items() if key != 'delivery_fee'}
+    db.session.execute(Order.__table__.insert(), [
+        {'user_id': user.id, 'total_amount': 2500, 'delivery_fee': 0, **details} for _ in range(payments)
+    ])
+    order_ids = db.session.execute(db.select(Order.id).order_by(Order.id)).scalars().all()
+    expires_at = datetime.utcnow() + timedelta(hours=1)
+    db.session.execute(StockReservation.__table__.insert(), [
+        {'order_id': order_id, 'product_id': product.id, 'quantity': 1, 'status': 'held', 'expires_at': expires_at}
+        for order_id in order_ids
+    ])
+    pushes = [{
+        'merchant_request_id': f'replay-mr-{order_id}',
+        'checkout_request_id': f'ws_CO_REPLAY_{order_id:08d}',
+        'amount': 2500,
+        'phone_number': CHECKOUT['phone_number'],
+    } for order_id in order_ids]
+    db.session.execute(Payment.__table__.insert(), [
+        {'order_id': order_id, 'phone_number': push['phone_number'], 'amount': push['amount'], 'status': 'pending',
+         'checkout_request_id': push['checkout_request_id'], 'merchant_request_id': push['merchant_request_id'],
+         'transaction_id': f'TXNREPLAY{order_id:08d}'}
+        for order_id, push in zip(order_ids, pushes)
+    ])
+    db.session.commit()
+    return product.id, pushes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--payments', type=int, default=2000)
+    parser.add_argument('--copies', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args(argv)
+    
+    database_uri = os.getenv('BENCH_DATABASE_URI')
+    if not database_uri or database_uri == 'sqlite://':
+        database_uri = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'callback_replay.db')
+    
+    class ReplayConfig(BenchmarkConfig):
+        SQLALCHEMY_DATABASE_URI = database_uri
+        MPESA_ENABLED = True
+    
+    app = make_app(ReplayConfig)
+    with app.app_context():
+        product_id, pushes = seed(args.payments + 1)
+    extra = pushes.pop()  # left pending for the forged callbacks
+    
+    # Every tenth customer cancels the prompt
+    rng = random.Random(7)
+    callbacks = [
+        callback_payload(push, result_code=1032 if i % 10 == 0 else 0)
+        for i, push in enumerate(pushes)
+    ]
+    deliveries = [body for body in callbacks for _ in range(args.copies)]
+    rng.shuffle(deliveries)
+    
+    def deliver(body):
+        with timer() as elapsed:
+            response = app.test_client().post(CALLBACK_URL, json=body)
+        return response.get_json()['ResultCode'], elapsed['elapsed'] * 1000
+    
+    with ThreadPoolExecutor(max_workers=args.threads) as pool, timer() as elapsed:
+        results = list(pool.map(deliver, deliveries))
+    latencies = sorted(ms for _, ms in results)
+    print(f'{len(deliveries)} callbacks ({args.payments} payments x {args.copies}) on {args.threads} threads '
+          f'in {elapsed["elapsed"]:.2f}s ({len(deliveries) / elapsed["elapsed"]:.0f}/s)')
+    print(f'  p50 {statistics.median(latencies):.1f}ms, p99 {latencies[int(len(latencies) * 0.99)]:.1f}ms')
+    
+    client = app.test_client()
+    with app.app_context():
+        with QueryCounter(db.engine) as duplicate:
+            client.post(CALLBACK_URL, json=callbacks[1])
+        print(f'  statements per duplicate callback: {duplicate.count}')
+        
+        cancelled = len(callbacks[::10])
+        paid = args.payments - cancelled
+        statuses = dict(db.session.query(Payment.status, db.func.count(Payment.id)).group_by(Payment.status).all())
+        completed = Order.query.filter_by(payment_status='completed', status='processing').count()
+        reservations = dict(
+            db.session.query(StockReservation.status, db.func.count(StockReservation.id))
+            .group_by(StockReservation.status).all()
+        )
+        checks = [
+            ('every callback acknowledged', all(code == 0 for code, _ in results)),
+            ('one ledger row per payment', MpesaCallback.query.count() == args.payments),
+            ('ledger linked to payments', MpesaCallback.query.filter(MpesaCallback.payment_id.is_(None)).count() == 0),
+            ('payments settled once', statuses == {'success': paid, 'failed': cancelled, 'pending': 1}),
+            ('paid orders processing', completed == paid),
+            ('paid stock kept, cancelled stock returned',
+             reservations == {'committed': paid, 'released': cancelled, 'held': 1}
+             and db.session.get(Product, product_id).stock == cancelled),
+            ('duplicate is a single no-op insert', duplicate.count <= 2),
+        ]
+        
+        # Knowing a CheckoutRequestID is not enough to mark an order paid
+        forged = client.post('/api/payments/mpesa/callback', json=callback_payload(extra))
+        underpaid = client.post(CALLBACK_URL, json=callback_payload({**extra, 'amount': 1}))
+        status = db.session.execute(db.select(Payment.status).filter_by(checkout_request_id=extra['checkout_request_id'])).scalar()
+        checks += [
+            ('callback without the secret refused', forged.status_code == 403),
+            ('callback for the wrong amount not applied', underpaid.get_json()['ResultCode'] == 0 and status == 'pending'),
+        ]
+    
+    for name, ok in checks:
+        print(f"  {'ok' if ok else 'FAILED':6} {name}")
+    return 0 if all(ok for _, ok in checks) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
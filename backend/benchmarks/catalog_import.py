@@ -0,0 +1,172 @@
+"""
+Streaming catalog import throughput and memory
+
+Writes a synthetic supplier feed of `--rows` products (JSON Lines, with an
+invalid row every 1000) and imports it into a file-backed SQLite database
+with services/catalog_import.py, then re-imports a refreshed feed with new
+prices and some renamed products. Reports rows/s for both passes against
+the one-ORM-object-per-row load seed.py used to do, and compares the
+importer's peak traced memory on the full feed with a tenth of it to check
+that memory does not grow with the file.
+
+    python -m benchmarks.catalog_import [--rows 50000] [--batch-size 1000] [--baseline-rows 5000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+from models import db, Category, Product, ProductAttribute
+from services.catalog_import import import_catalog, read_catalog
+from services.search import ensure_search_schema, ranked_product_ids
+from benchmarks.common import BenchmarkConfig, COLORS, make_app, synthetic_brands, synthetic_product, timer
+
+CATEGORIES = ['makeup', 'mobile-accessories', 'shoes-clothes', 'bags', 'watches']
+SIZES = ['XS', 'S', 'M', 'L', 'XL']
+RENAMED = 'Zanzibar'  # token only the refreshed feed puts in product names
+
+
+def feed_row(i, rng, brands, refreshed=False):
+    name, description = synthetic_product(i, rng, brands)
+    if refreshed and i % 100 == 0:
+        name = f'{RENAMED} {name}'
+    row = {
+        'sku': f'SKU-{i:07d}',
+        'name': name,
+        'description': description,
+        'price': 100 + i % 500 + (50 if refreshed else 0),
+        'category': CATEGORIES[i % len(CATEGORIES)],
+        'image_url': f'https://example.com/products/{i}.jpg',
+        'stock': i % 50,
+        'color_options': rng.sample(COLORS, 2),
+        'size_options': SIZES[:i % 4],
+        'is_featured': i % 10 == 0,
+    }
+    if i % 1000 == 999:
+        del row['price']  # reported and skipped
+    return row
+
+
+def write_feed(path, rows, refreshed=False):
+    """Stream a JSON Lines feed to `path`; returns the number of invalid rows"""
+    rng = random.Random(7)
+    brands = synthetic_brands(400, rng)
+    invalid = 0
+    with open(path, 'w') as feed:
+        for i in range(rows):
+            row = feed_row(i, rng, brands, refreshed)
+            invalid += 'price' not in row
+            feed.write(json.dumps(row) + '\n')
+    return invalid
+
+
+def fresh_app(path):
+    class ImportConfig(BenchmarkConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+        CATALOG_CACHE_ENABLED = False
+    
+    app = make_app(ImportConfig)
+    with app.app_context():
+        ensure_search_schema(db.engine)
+    return app
+
+
+def orm_baseline(path, rows):
+    """The old seed.py load: one Product object per row, one commit; returns rows/s"""
+    app = fresh_app(path)
+    rng = random.Random(7)
+    brands = synthetic_brands(400, rng)
+    with app.app_context():
+        categories = [Category(name=slug.title(), slug=slug) for slug in CATEGORIES]
+        db.session.add_all(categories)
+        db.session.flush()
+        with timer() as timing:
+            for i in range(rows):
+                row = feed_row(i, rng, brands)
+                row.pop('sku')
+                row['price'] = row.get('price', 1)
+                row['category_id'] = categories[i % len(categories)].id
+                del row['category']
+                db.session.add(Product(**row))
+            db.session.commit()
+    return rows / timing['elapsed']
+
+
+def traced_import(path, feed, batch_size):
+    """Import `feed` into a fresh database under tracemalloc; returns peak bytes"""
+    app = fresh_app(path)
+    with app.app_context():
+        tracemalloc.start()
+        import_catalog(read_catalog(feed), batch_size=batch_size, create_categories=True)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--baseline-rows', type=int, default=5000)
+    args = parser.parse_args(argv)
+    
+    directory = tempfile.mkdtemp()
+    feed = os.path.join(directory, 'feed.jsonl')
+    refreshed_feed = os.path.join(directory, 'refreshed.jsonl')
+    small_feed = os.path.join(directory, 'small.jsonl')
+    invalid = write_feed(feed, args.rows)
+    write_feed(refreshed_feed, args.rows, refreshed=True)
+    write_feed(small_feed, args.rows // 10)
+    valid = args.rows - invalid
+    
+    failures = []
+    
+    def check(name, ok):
+        print(f'  {"ok" if ok else "FAILED"}: {name}')
+        if not ok:
+            failures.append(name)
+    
+    baseline = orm_baseline(os.path.join(directory, 'baseline.db'), args.baseline_rows)
+    
+    app = fresh_app(os.path.join(directory, 'catalog.db'))
+    with app.app_context():
+        first = import_catalog(read_catalog(feed), batch_size=args.batch_size, create_categories=True)
+        created = {sku: created_at for sku, created_at in db.session.query(Product.sku, Product.created_at).limit(100)}
+        second = import_catalog(read_catalog(refreshed_feed), batch_size=args.batch_size)
+        products = Product.query.count()
+        repriced = Product.query.filter(Product.price >= 150).count()
+        kept_created = all(
+            created_at == created[sku]
+            for sku, created_at in db.session.query(Product.sku, Product.created_at).filter(Product.sku.in_(list(created)))
+        )
+        attributes = ProductAttribute.query.count()
+        renamed = ranked_product_ids(RENAMED.lower(), limit=args.rows)
+    
+    expected_attributes = sum(2 + i % 4 for i in range(args.rows) if i % 1000 != 999)
+    print(f'{args.rows:,} rows ({invalid} invalid), batches of {args.batch_size}')
+    print(f'{"load":34} {"rows/s":>9} {"seconds":>8}')
+    print(f'{"one ORM object per row (seed.py)":34} {baseline:>9,.0f} {args.baseline_rows / baseline:>8.2f}  ({args.baseline_rows:,} rows)')
+    print(f'{"streaming upsert, new products":34} {first["rows_per_second"]:>9,.0f} {first["seconds"]:>8.2f}')
+    print(f'{"streaming upsert, refreshed feed":34} {second["rows_per_second"]:>9,.0f} {second["seconds"]:>8.2f}')
+    
+    check('every valid row imported', first['upserted'] == valid and products == valid)
+    check('invalid rows skipped and reported', first['skipped'] == invalid and len(first['errors']) == min(invalid, 100))
+    check('unknown category slugs created once', first['categories_created'] == len(CATEGORIES))
+    check('re-import updates in place', second['upserted'] == valid and repriced == valid)
+    check('re-import keeps created_at', kept_created)
+    check('product_attributes mirror the imported options', attributes == expected_attributes)
+    check('search index follows renamed products', len(renamed) == len(range(0, args.rows, 100)))
+    check('streaming upsert beats per-row ORM adds', first['rows_per_second'] > baseline)
+    
+    small_peak = traced_import(os.path.join(directory, 'small.db'), small_feed, args.batch_size)
+    full_peak = traced_import(os.path.join(directory, 'full.db'), feed, args.batch_size)
+    print(f'peak traced memory: {small_peak / 1e6:.1f} MB for {args.rows // 10:,} rows, '
+          f'{full_peak / 1e6:.1f} MB for {args.rows:,} rows')
+    check('memory does not grow with the feed size', full_peak < small_peak * 1.5)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
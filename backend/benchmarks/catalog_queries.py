@@ -0,0 +1,59 @@
+"""
+Query budget for catalog listing endpoints
+
+Seeds catalogs of increasing size and counts the SQL statements each listing
+endpoint issues. The count must not grow with the number of products (no N+1).
+
+    python -m benchmarks.catalog_queries [sizes...]
+"""
+import sys
+from models import db
+from benchmarks.common import make_app, seed_catalog, QueryCounter, timer
+
+ENDPOINTS = [
+    '/api/products',
+    '/api/products?category=category-0',
+    '/api/products/featured',
+    '/api/products/category/category-0',
+    '/api/products/1',
+]
+
+
+def measure(size):
+    """Return {url: (query_count, elapsed_ms)} for a catalog of `size` products"""
+    app = make_app()
+    results = {}
+    
+    with app.app_context():
+        seed_catalog(size)
+        engine = db.engine
+    
+    client = app.test_client()
+    for url in ENDPOINTS:
+        with QueryCounter(engine) as counter, timer() as elapsed:
+            response = client.get(url)
+        assert response.status_code == 200, f'{url} returned {response.status_code}'
+        results[url] = (counter.count, elapsed['elapsed'] * 1000)
+    
+    return results
+
+
+def main(sizes):
+    by_size = {size: measure(size) for size in sizes}
+    failed = False
+    
+    print(f"{'endpoint':45}" + ''.join(f'{size:>18}' for size in sizes))
+    for url in ENDPOINTS:
+        counts = {by_size[size][url][0] for size in sizes}
+        row = ''.join(f'{by_size[size][url][0]:>6} q {by_size[size][url][1]:>7.1f}ms' for size in sizes)
+        print(f'{url:45}{row}')
+        if len(counts) > 1:
+            failed = True
+            print(f'  !! query count grows with catalog size: {sorted(counts)}')
+    
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10, 200, 2000]
+    sys.exit(main(sizes))
@@ -0,0 +1,114 @@
+"""
+Checkout statement budget and latency
+
+Fills a cart with 1, 10 and 100 distinct products and times POST /api/orders,
+counting the SQL statements issued from the cart load through the commit.
+The count must not grow with the number of cart lines. A checkout only
+writes stock, so it must leave cached catalog pages in place; a price change
+must still retire them.
+
+    python -m benchmarks.checkout [lines...] [--repeats 5]
+"""
+import argparse
+import statistics
+import sys
+from flask_jwt_extended import create_access_token
+from models import db, Cart, CartItem, Product, User
+from services.cache import catalog_cache
+from benchmarks.common import BenchmarkConfig, make_app, seed_catalog, QueryCounter, timer
+
+CHECKOUT = {
+    'phone_number': '254700000000',
+    'full_name': 'Bench Buyer',
+    'county': 'Nairobi',
+    'town': 'Nairobi',
+    'address': 'Kenyatta Avenue',
+}
+
+
+class CheckoutConfig(BenchmarkConfig):
+    STOCK_SWEEP_INTERVAL = 3600
+
+
+def fill_cart(user_id, product_ids):
+    """Replace the user's cart with one line per product"""
+    cart = Cart.query.filter_by(user_id=user_id).first()
+    if cart is None:
+        cart = Cart(user_id=user_id)
+        db.session.add(cart)
+    cart.items = [CartItem(product_id=product_id, quantity=1 + product_id % 3) for product_id in product_ids]
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('lines', type=int, nargs='*', default=[1, 10, 100])
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+    
+    app = make_app(CheckoutConfig)
+    with app.app_context():
+        seed_catalog(max(args.lines) * 2)
+        db.session.execute(Product.__table__.update().values(stock=1_000_000))
+        user = User(email='bench@example.com', password_hash='-', full_name='Bench Buyer',
+                    phone_number=CHECKOUT['phone_number'])
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        product_ids = [product_id for product_id, in db.session.query(Product.id).order_by(Product.id)]
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user_id)}'}
+        engine = db.engine
+    
+    client = app.test_client()
+    
+    # Warm-up checkout (runs the once-per-interval reservation sweep)
+    with app.app_context():
+        fill_cart(user_id, product_ids[:1])
+    assert client.post('/api/orders', json=CHECKOUT, headers=headers).status_code == 201
+    
+    print(f"{'lines':>6}{'statements':>12}{'median ms':>12}{'min ms':>10}")
+    counts = set()
+    for lines in args.lines:
+        samples = []
+        for _ in range(args.repeats):
+            with app.app_context():
+                fill_cart(user_id, product_ids[:lines])
+            with QueryCounter(engine) as counter, timer() as elapsed:
+                response = client.post('/api/orders', json=CHECKOUT, headers=headers)
+            assert response.status_code == 201, response.get_json()
+            assert len(response.get_json()['order']['items']) == lines
+            samples.append(elapsed['elapsed'] * 1000)
+        counts.add(counter.count)
+        print(f'{lines:>6}{counter.count:>12}{statistics.median(samples):>12.1f}{min(samples):>10.1f}')
+    
+    if len(counts) > 1:
+        print(f'  !! statement count grows with cart size: {sorted(counts)}')
+        return 1
+    
+    # Stock-only writes (bulk or through the ORM) keep the cache; other product writes retire it
+    def cached_page():
+        with QueryCounter(engine) as counter:
+            client.get('/api/products?limit=20')
+        return counter.count == 0
+    
+    client.get('/api/products?limit=20')
+    invalidations = catalog_cache.invalidations
+    with app.app_context():
+        fill_cart(user_id, product_ids[:10])
+    client.post('/api/orders', json=CHECKOUT, headers=headers)
+    with app.app_context():
+        db.session.get(Product, product_ids[0]).stock -= 1
+        db.session.commit()
+    kept = cached_page() and catalog_cache.invalidations == invalidations
+    with app.app_context():
+        db.session.get(Product, product_ids[0]).price += 1
+        db.session.commit()
+    retired = not cached_page() and catalog_cache.invalidations == invalidations + 1
+    if not (kept and retired):
+        print(f'  !! catalog cache: kept after stock writes {kept}, retired after a price change {retired}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
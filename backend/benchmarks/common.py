@@ -0,0 +1,217 @@
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from config import Config
+from models import db, Category, Order, OrderItem, Product, User
+
+
+class BenchmarkConfig(Config):
+    """Configuration used by benchmarks (in-memory SQLite unless overridden)"""
+    SQLALCHEMY_DATABASE_URI = os.getenv('BENCH_DATABASE_URI', 'sqlite://')
+    TESTING = True
+    RATE_LIMIT_ENABLED = False  # benchmarks/ratelimit.py turns it back on
+    MPESA_CALLBACK_SECRET = 'benchmark-callback-secret'
+
+
+# Where Daraja posts callbacks for pushes sent with BenchmarkConfig
+CALLBACK_URL = f'/api/payments/mpesa/callback?token={BenchmarkConfig.MPESA_CALLBACK_SECRET}'
+
+
+def make_app(config_class=BenchmarkConfig):
+    """Create an app with a fresh schema"""
+    from app import create_app
+    
+    app = create_app(config_class)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+ADJECTIVES = [
+    'velvet', 'matte', 'radiant', 'classic', 'premium', 'wireless', 'leather', 'canvas', 'silk',
+    'vintage', 'bold', 'smart', 'rapid', 'slim', 'shimmer', 'organic', 'rugged', 'luxury', 'sporty',
+]
+COLORS = [
+    'black', 'white', 'navy', 'ruby', 'coral', 'ivory', 'beige', 'caramel', 'espresso', 'olive',
+    'mustard', 'teal', 'burgundy', 'blush', 'charcoal', 'sand', 'gold', 'silver', 'emerald', 'lilac',
+]
+NOUNS = [
+    'lipstick', 'foundation', 'palette', 'mascara', 'serum', 'charger', 'earbuds', 'case', 'cable',
+    'powerbank', 'sneakers', 'sandals', 'dress', 'jacket', 'shirt', 'handbag', 'scarf', 'boots',
+    'concealer', 'primer', 'eyeliner', 'blush', 'headphones', 'adapter', 'tripod', 'holder', 'kitenge',
+    'loafers', 'heels', 'trousers', 'skirt', 'hoodie', 'backpack', 'wallet', 'belt', 'watch',
+]
+DETAILS = [
+    'long-lasting', 'lightweight', 'waterproof', 'handmade', 'kenyan', 'fast charging', 'all-day comfort',
+    'vitamin e', 'breathable', 'durable', 'everyday', 'evening', 'travel', 'gift', 'bestseller',
+    'shea butter', 'spf 30', 'usb-c', 'bluetooth 5.3', 'noise cancelling', 'ankara print', 'genuine leather',
+    'cotton blend', 'slim fit', 'non-slip sole', 'magnetic', 'scratch resistant', 'vegan', 'cruelty free',
+    'hypoallergenic', 'matte finish', 'dewy finish', 'quick dry', 'adjustable strap', 'gift box',
+]
+SYLLABLES = ['ka', 'zu', 'mo', 'ri', 'na', 'te', 'lo', 'vi', 'sa', 'du', 'ne', 'bo', 'ya', 'ki', 'fa', 'ju']
+
+
+def synthetic_brands(count, rng):
+    """Pronounceable brand names, e.g. 'Kazuri'"""
+    return sorted({''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))) for _ in range(count)})
+
+
+def synthetic_product(i, rng, brands):
+    """Deterministic name/description drawn from a shop-like vocabulary"""
+    name = f'{rng.choice(brands).title()} {rng.choice(ADJECTIVES).title()} {rng.choice(COLORS).title()} {rng.choice(NOUNS).title()} {i}'
+    description = ', '.join(rng.sample(DETAILS, 3)) + f' {rng.choice(NOUNS)} in {rng.choice(COLORS)}'
+    return name, description
+
+
+def seed_catalog(n_products, n_categories=3, batch_size=5000, seed=42):
+    """Insert a synthetic catalog; must be called inside an app context"""
+    categories = [
+        Category(name=f'Category {i}', slug=f'category-{i}', description=f'Synthetic category {i}')
+        for i in range(n_categories)
+    ]
+    db.session.add_all(categories)
+    db.session.flush()
+    
+    rng = random.Random(seed)
+    brands = synthetic_brands(400, rng)
+    for start in range(0, n_products, batch_size):
+        rows = []
+        for i in range(start, min(start + batch_size, n_products)):
+            name, description = synthetic_product(i, rng, brands)
+            rows.append({
+                'name': name,
+                'description': description,
+                'price': 100 + (i % 500),
+                'category_id': categories[i % n_categories].id,
+                'image_url': f'https://example.com/products/{i}.jpg',
+                'stock': i % 50,
+                'is_featured': i % 10 == 0,
+            })
+        db.session.execute(Product.__table__.insert(), rows)
+    db.session.commit()
+    return categories
+
+
+def seed_customers(n_users, n_orders, n_products, batch_size=5000, seed=42):
+    """Insert users and a paid order history spread over them; returns the user ids in order"""
+    rng = random.Random(seed)
+    for start in range(0, n_users, batch_size):
+        db.session.execute(User.__table__.insert(), [
+            {
+                'email': f'shopper{i}@example.com',
+                'password_hash': '-',
+                'full_name': f'Shopper {i}',
+                'phone_number': f'2547{i % 100000000:08d}',
+                'created_at': datetime.utcnow(),
+            }
+            for i in range(start, min(start + batch_size, n_users))
+        ])
+    user_ids = [user_id for user_id, in db.session.query(User.id).order_by(User.id)]
+    
+    first_order = (db.session.query(db.func.max(Order.id)).scalar() or 0) + 1
+    since = datetime.utcnow() - timedelta(days=365)
+    for start in range(0, n_orders, batch_size):
+        orders, items = [], []
+        for i in range(start, min(start + batch_size, n_orders)):
+            lines = [(rng.randint(1, n_products), rng.randint(1, 3), 100 + rng.randrange(500))
+                     for _ in range(rng.randint(1, 4))]
+            created_at = since + timedelta(minutes=rng.randrange(365 * 24 * 60))
+            orders.append({
+                'id': first_order + i,
+                'user_id': user_ids[i % len(user_ids)],
+                'total_amount': sum(quantity * price for _, quantity, price in lines) + 500.0,
+                'delivery_fee': 500.0,
+                'status': 'delivered',
+                'phone_number': '254700000000',
+                'full_name': f'Shopper {i % len(user_ids)}',
+                'county': 'Nairobi',
+                'town': 'Nairobi',
+                'address': 'Kenyatta Avenue',
+                'payment_method': 'mpesa',
+                'payment_status': 'completed',
+                'created_at': created_at,
+                'updated_at': created_at,
+            })
+            items.extend({'order_id': first_order + i, 'product_id': product_id, 'quantity': quantity, 'price': price}
+                         for product_id, quantity, price in lines)
+        db.session.execute(Order.__table__.insert(), orders)
+        db.session.execute(OrderItem.__table__.insert(), items)
+    db.session.commit()
+    return user_ids
+
+
+class QueryCounter:
+    """Counts SQL statements executed on an engine"""
+    
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self.statements = []
+    
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+    
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+    
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+        return False
+
+
+@contextmanager
+def timer():
+    """Yield a dict whose 'elapsed' key is set to wall seconds on exit"""
+    result = {}
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result['elapsed'] = time.perf_counter() - start
+
+
+def git_revision():
+    """Short commit hash of the working tree, with '+dirty' when it has local changes"""
+    try:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision + ('+dirty' if dirty else '')
+
+
+def write_results(path, benchmark, database, parameters, results):
+    """
+    Write a benchmark run as JSON for benchmarks.compare
+    
+    `results` maps a metric name to {'value': number, 'unit': str, 'better':
+    'higher'|'lower'}; the run is stamped with the commit, interpreter and
+    database (dialect name) it ran on so two files say what they compare.
+    """
+    payload = {
+        'benchmark': benchmark,
+        'revision': git_revision(),
+        'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'database': database,
+        'parameters': parameters,
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+        f.write('\n')
+    print(f'results written to {path}')
@@ -0,0 +1,64 @@
+"""
+Compare two benchmark result files written with --json
+
+Prints every metric of the baseline and candidate runs with its change, and
+flags the ones that got worse by more than `--threshold` percent (in the
+direction the metric records as better). Exits 1 if any did, so a CI job can
+run a benchmark on two commits and fail on a regression.
+
+    python -m benchmarks.compare BASELINE.json CANDIDATE.json [--threshold 10]
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def describe(run):
+    return f'{run.get("revision") or "unknown revision"} ({run.get("database")}, Python {run.get("python")}, {run.get("timestamp")})'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10, help='percent change counted as a regression')
+    args = parser.parse_args(argv)
+    
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    if baseline['benchmark'] != candidate['benchmark']:
+        print(f'cannot compare {baseline["benchmark"]} results with {candidate["benchmark"]} results')
+        return 2
+    print(f'{baseline["benchmark"]}: {describe(baseline)} -> {describe(candidate)}')
+    if baseline.get('parameters') != candidate.get('parameters'):
+        print(f'  parameters differ: {baseline.get("parameters")} vs {candidate.get("parameters")}')
+    
+    regressions = []
+    print(f'{"metric":34} {"baseline":>12} {"candidate":>12} {"change":>8}')
+    for name, before in baseline['results'].items():
+        after = candidate['results'].get(name)
+        if after is None:
+            print(f'{name:34} {before["value"]:>12g} {"-":>12} {"":>8}')
+            continue
+        change = (after['value'] - before['value']) / before['value'] * 100 if before['value'] else 0.0
+        worse = change if before.get('better') == 'lower' else -change
+        flag = '  REGRESSION' if worse > args.threshold else ''
+        if flag:
+            regressions.append(name)
+        print(f'{name:34} {before["value"]:>12g} {after["value"]:>12g} {change:>+7.1f}%{flag}')
+    for name in sorted(candidate['results'].keys() - baseline['results'].keys()):
+        print(f'{name:34} {"-":>12} {candidate["results"][name]["value"]:>12g} {"":>8}')
+    
+    if regressions:
+        print(f'{len(regressions)} metric(s) regressed by more than {args.threshold:g}%: {", ".join(regressions)}')
+        return 1
+    print(f'no metric regressed by more than {args.threshold:g}%')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
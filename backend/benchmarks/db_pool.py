@@ -0,0 +1,135 @@
+"""
+Connection pool sizing under concurrent requests
+
+Serves product detail requests from `--clients` threads against a
+file-backed SQLite database, with every statement delayed by
+`--query-delay-ms` to stand in for PostgreSQL round trips, once with an
+undersized pool and once with the pool derived from the gthread profile
+(see services/db_pool.py). Reports checkout waits, timeouts and peak
+connections in use from the pool metrics, and checks the derived options
+for each profile, the DB_MAX_CONNECTIONS budget and PgBouncer mode.
+
+    python -m benchmarks.db_pool [--clients 16] [--requests 400] [--query-delay-ms 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool
+from models import db
+from profiles import resolve_profile
+from services.db_pool import TimedQueuePool, engine_options, pool_metrics
+from benchmarks.common import BenchmarkConfig, make_app, seed_catalog, timer
+
+
+def run(database_uri, pool_options, clients, requests, delay):
+    """Drive GET /api/products/<id> through a pool; returns (metrics snapshot, peak in use, errors, seconds)"""
+    class PoolConfig(BenchmarkConfig):
+        SQLALCHEMY_DATABASE_URI = database_uri
+        SQLALCHEMY_ENGINE_OPTIONS = pool_options
+        CATALOG_CACHE_ENABLED = False
+    
+    from app import create_app
+    app = create_app(PoolConfig)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', lambda *args: time.sleep(delay))
+    
+    lock = threading.Lock()
+    peak, errors = [0], [0]
+    
+    def on_checkout(*args):
+        with lock:
+            peak[0] = max(peak[0], engine.pool.checkedout())
+    event.listen(engine, 'checkout', on_checkout)
+    
+    client = app.test_client()
+    
+    def request(i):
+        if client.get(f'/api/products/{i % 50 + 1}').status_code != 200:  # 503 on a pool timeout
+            with lock:
+                errors[0] += 1
+    
+    pool_metrics.reset()
+    with timer() as timing:
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            list(pool.map(request, range(requests)))
+    engine.dispose()
+    return pool_metrics.snapshot(), peak[0], errors[0], timing['elapsed']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--query-delay-ms', type=float, default=5)
+    args = parser.parse_args(argv)
+    
+    database_uri = os.getenv('BENCH_DATABASE_URI')
+    if not database_uri or database_uri == 'sqlite://':
+        database_uri = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'db_pool.db')
+    
+    class SeedConfig(BenchmarkConfig):
+        SQLALCHEMY_DATABASE_URI = database_uri
+    
+    app = make_app(SeedConfig)
+    with app.app_context():
+        seed_catalog(200)
+        db.engine.dispose()
+    
+    gthread = resolve_profile('gthread', cpus=1)
+    sized = engine_options({'SQLALCHEMY_DATABASE_URI': database_uri, 'DB_POOL_TIMEOUT': 1}, gthread)
+    undersized = {**sized, 'pool_size': 2, 'max_overflow': 0}
+    
+    failures = []
+    
+    def check(name, ok):
+        print(f'  {"ok" if ok else "FAILED"}: {name}')
+        if not ok:
+            failures.append(name)
+    
+    print(f'{args.clients} clients, {args.requests} requests, {args.query_delay_ms:g}ms per query')
+    print(f'{"pool":22} {"req/s":>7} {"wait p50":>9} {"wait p95":>9} {"wait max":>9} {"timeouts":>8} {"peak":>5}')
+    results = {}
+    for label, options in (('undersized (2+0)', undersized), (f'gthread ({sized["pool_size"]}+{sized["max_overflow"]})', sized)):
+        snapshot, peak, errors, seconds = run(database_uri, options, args.clients, args.requests, args.query_delay_ms / 1000)
+        waits = snapshot['checkout_wait_ms']
+        results[label.split()[0]] = (snapshot, peak, errors)
+        print(f'{label:22} {args.requests / seconds:>7.0f} {waits["p50"]:>9.2f} {waits["p95"]:>9.2f} '
+              f'{waits["max"]:>9.2f} {snapshot["timeouts"]:>8} {peak:>5}')
+    
+    small, _, _ = results['undersized']
+    snapshot, peak, errors = results['gthread']
+    check('undersized pool makes requests queue for a connection', small['checkout_wait_ms']['p95'] > 1)
+    check('pool sized to the profile serves every request', errors == 0 and snapshot['timeouts'] == 0)
+    check('sized pool cuts the p95 checkout wait', snapshot['checkout_wait_ms']['p95'] < small['checkout_wait_ms']['p95'])
+    check('connections in use never exceed the pool limit', peak <= sized['pool_size'] + sized['max_overflow'])
+    
+    postgres = 'postgresql://shop@db/shop'
+    print('derived options for 4 CPUs on PostgreSQL:')
+    for name in ('sync', 'gthread', 'gevent'):
+        profile = resolve_profile(name, cpus=4)
+        options = engine_options({'SQLALCHEMY_DATABASE_URI': postgres}, profile)
+        budgeted = engine_options({'SQLALCHEMY_DATABASE_URI': postgres, 'DB_MAX_CONNECTIONS': 40}, profile)
+        total = profile['workers'] * (budgeted['pool_size'] + budgeted['max_overflow'])
+        print(f'  {name:8} {profile["workers"]} workers x pool {options["pool_size"]}+{options["max_overflow"]}, '
+              f'DB_MAX_CONNECTIONS=40 -> {budgeted["pool_size"]}+{budgeted["max_overflow"]} ({total} total)')
+        check(f'{name}: pool covers what a worker runs at once (up to DB_POOL_SIZE_MAX)',
+              options['pool_size'] + options['max_overflow'] >= min(profile['concurrency'], 10))
+        check(f'{name}: DB_MAX_CONNECTIONS bounds connections across workers', total <= 40)
+        check(f'{name}: pre-ping and connect timeout set', options['pool_pre_ping'] and 'connect_timeout' in options['connect_args'])
+    
+    bouncer = engine_options({'SQLALCHEMY_DATABASE_URI': postgres, 'DB_PGBOUNCER': True, 'DB_STATEMENT_TIMEOUT_MS': 15000})
+    check('PgBouncer mode leaves pooling to PgBouncer', bouncer['poolclass'] is NullPool)
+    check('PgBouncer mode sends no startup options', 'options' not in bouncer['connect_args'])
+    check('file SQLite gets the timed pool', sized['poolclass'] is TimedQueuePool)
+    
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""
+Local stand-in for the Safaricom Daraja API
+
+Implements the OAuth token, STK push and STK query endpoints closely enough
+to exercise services/mpesa.py without network access, with counters and
+fault injection (forced error statuses, added latency, pending queries).
+
+    python -m benchmarks.fake_daraja [--port 8089]
+
+then run the backend with MPESA_ENABLED=true MPESA_BASE_URL=http://127.0.0.1:8089
+"""
+import argparse
+import base64
+import itertools
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def callback_payload(push, result_code=0, receipt=None):
+    """Daraja-shaped STK callback body for a recorded push"""
+    callback = {
+        'MerchantRequestID': push['merchant_request_id'],
+        'CheckoutRequestID': push['checkout_request_id'],
+        'ResultCode': result_code,
+        'ResultDesc': 'The service request is processed successfully.' if result_code == 0 else 'Request cancelled by user',
+    }
+    if result_code == 0:
+        callback['CallbackMetadata'] = {'Item': [
+            {'Name': 'Amount', 'Value': push['amount']},
+            {'Name': 'MpesaReceiptNumber', 'Value': receipt or f"FAKE{push['checkout_request_id'][-8:]}"},
+            {'Name': 'TransactionDate', 'Value': int(datetime.now().strftime('%Y%m%d%H%M%S'))},
+            {'Name': 'PhoneNumber', 'Value': int(push['phone_number'])},
+        ]}
+    return {'Body': {'stkCallback': callback}}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # room for a burst of concurrent connects
+
+
+class FakeDaraja:
+    """Threaded fake Daraja server; start() returns its base URL"""
+    
+    def __init__(self, host='127.0.0.1', port=0, token_ttl=3599):
+        self.token_ttl = token_ttl
+        self.delay = 0.0
+        self.query_result = '0'  # ResultCode for STK queries, or 'pending'
+        self.pushes = {}
+        self.token_requests = 0
+        self.stk_requests = 0
+        self.query_requests = 0
+        self.connections = set()
+        self._tokens = {}
+        self._failures = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.server = _Server((host, port), self._handler())
+        self._thread = None
+    
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+    
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+    
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def fail_next(self, count=1, status=503):
+        """Answer the next `count` requests with `status`"""
+        with self._lock:
+            self._failures.extend([status] * count)
+    
+    def expire_tokens(self):
+        """Invalidate every issued token (the next authenticated call gets 401)"""
+        with self._lock:
+            self._tokens.clear()
+    
+    def _next_failure(self):
+        with self._lock:
+            return self._failures.pop(0) if self._failures else None
+    
+    def _issue_token(self):
+        with self._lock:
+            self.token_requests += 1
+            token = f'fake-token-{next(self._ids)}'
+            self._tokens[token] = time.monotonic() + self.token_ttl
+            return token
+    
+    def _token_valid(self, header):
+        token = (header or '').removeprefix('Bearer ')
+        with self._lock:
+            return self._tokens.get(token, 0) > time.monotonic()
+    
+    def _stk_push(self, payload):
+        with self._lock:
+            self.stk_requests += 1
+            n = next(self._ids)
+        push = {
+            'merchant_request_id': f'fake-mr-{n}',
+            'checkout_request_id': f'ws_CO_FAKE_{n:08d}',
+            'amount': payload.get('Amount'),
+            'phone_number': str(payload.get('PhoneNumber')),
+            'account_reference': payload.get('AccountReference'),
+            'callback_url': payload.get('CallBackURL'),
+        }
+        with self._lock:
+            self.pushes[push['checkout_request_id']] = push
+        return {
+            'MerchantRequestID': push['merchant_request_id'],
+            'CheckoutRequestID': push['checkout_request_id'],
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing',
+        }
+    
+    def _stk_query(self, payload):
+        with self._lock:
+            self.query_requests += 1
+        if payload.get('CheckoutRequestID') not in self.pushes:
+            return 400, {'requestId': '', 'errorCode': '400.002.02', 'errorMessage': 'Bad Request - Invalid CheckoutRequestID'}
+        if self.query_result == 'pending':
+            return 500, {'requestId': '', 'errorCode': '500.001.1001', 'errorMessage': 'The transaction is being processed'}
+        return 200, {
+            'ResponseCode': '0',
+            'ResponseDescription': 'The service request has been accepted successsfully',
+            'MerchantRequestID': self.pushes[payload['CheckoutRequestID']]['merchant_request_id'],
+            'CheckoutRequestID': payload['CheckoutRequestID'],
+            'ResultCode': self.query_result,
+            'ResultDesc': 'The service request is processed successfully.' if self.query_result == '0' else 'Request cancelled by user',
+        }
+    
+    def _handler(self):
+        fake = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+            
+            def log_message(self, *args):
+                pass
+            
+            def _send(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def _begin(self):
+                fake.connections.add(self.client_address)
+                if fake.delay:
+                    time.sleep(fake.delay)
+                status = fake._next_failure()
+                if status:
+                    self._send(status, {'errorCode': str(status), 'errorMessage': 'Injected failure'})
+                    return False
+                return True
+            
+            def do_GET(self):
+                if not self._begin():
+                    return
+                if not self.path.startswith('/oauth/v1/generate'):
+                    return self._send(404, {'errorMessage': 'Not found'})
+                auth = self.headers.get('Authorization', '')
+                try:
+                    key, secret = base64.b64decode(auth.removeprefix('Basic ')).decode().split(':', 1)
+                except ValueError:
+                    key = secret = ''
+                if not key or not secret:
+                    return self._send(400, {'errorCode': '400.008.01', 'errorMessage': 'Invalid Authentication passed'})
+                self._send(200, {'access_token': fake._issue_token(), 'expires_in': str(fake.token_ttl)})
+            
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                if not self._begin():
+                    return
+                if not fake._token_valid(self.headers.get('Authorization')):
+                    return self._send(401, {'errorCode': '404.001.03', 'errorMessage': 'Invalid Access Token'})
+                if self.path == '/mpesa/stkpush/v1/processrequest':
+                    return self._send(200, fake._stk_push(payload))
+                if self.path == '/mpesa/stkpushquery/v1/query':
+                    return self._send(*fake._stk_query(payload))
+                self._send(404, {'errorMessage': 'Not found'})
+        
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    args = parser.parse_args()
+    
+    fake = FakeDaraja(args.host, args.port)
+    print(f'Fake Daraja listening on {fake.base_url}')
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
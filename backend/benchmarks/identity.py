@@ -0,0 +1,119 @@
+"""
+Request identity: cached user claims and single cart lookups
+
+Serves GET /api/auth/me for `--users` signed-in users with the claims cache
+on and off and reports req/s and statements per request. Then checks that a
+user's own profile change is visible at once, that a change made elsewhere
+(another worker, simulated with raw SQL) is picked up within
+IDENTITY_CACHE_TTL, and lists the statements each cart endpoint runs, none
+of which should read the carts table more than once.
+
+    python -m benchmarks.identity [--users 50] [--requests 2000]
+"""
+import argparse
+import sys
+import time
+from flask_jwt_extended import create_access_token
+from sqlalchemy import text
+from models import db, CartItem, User
+from services.identity import claims_cache
+from benchmarks.common import BenchmarkConfig, QueryCounter, make_app, seed_catalog, timer
+
+
+def seed_users(count):
+    users = [
+        User(email=f'shopper{i}@example.com', password_hash='-', full_name=f'Shopper {i}', phone_number='254712345678')
+        for i in range(count)
+    ]
+    db.session.add_all(users)
+    db.session.commit()
+    return [create_access_token(identity=user.id) for user in users]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args(argv)
+    
+    failures = []
+    
+    def check(name, ok):
+        print(f'  {"ok" if ok else "FAILED"}: {name}')
+        if not ok:
+            failures.append(name)
+    
+    print(f'GET /api/auth/me, {args.requests} requests over {args.users} users')
+    print(f'{"claims cache":14} {"req/s":>8} {"stmts/req":>10}')
+    results = {}
+    for enabled in (False, True):
+        class IdentityConfig(BenchmarkConfig):
+            IDENTITY_CACHE_ENABLED = enabled
+        
+        app = make_app(IdentityConfig)
+        with app.app_context():
+            tokens = seed_users(args.users)
+            engine = db.engine
+        client = app.test_client()
+        with QueryCounter(engine) as counter, timer() as timing:
+            for i in range(args.requests):
+                response = client.get('/api/auth/me', headers={'Authorization': f'Bearer {tokens[i % len(tokens)]}'})
+                assert response.status_code == 200, response.status_code
+        results[enabled] = counter.count / args.requests
+        print(f'{"on" if enabled else "off":14} {args.requests / timing["elapsed"]:>8.0f} {results[enabled]:>10.3f}')
+    
+    check('cached claims answer /me without queries', results[True] <= args.users / args.requests)
+    
+    class ShortTTLConfig(BenchmarkConfig):
+        IDENTITY_CACHE_TTL = 1
+    
+    app = make_app(ShortTTLConfig)
+    with app.app_context():
+        tokens = seed_users(1)
+        engine = db.engine
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {tokens[0]}'}
+    
+    def me():
+        return client.get('/api/auth/me', headers=headers).get_json()['user']['full_name']
+    
+    me()
+    with app.app_context():
+        db.session.get(User, 1).full_name = 'Renamed Here'
+        db.session.commit()
+    check("a user's own change is visible at once", me() == 'Renamed Here')
+    
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE users SET full_name = 'Renamed Elsewhere' WHERE id = 1"))
+    stale = me()
+    time.sleep(1.1)
+    check('a change from another worker waits out the TTL', stale == 'Renamed Here' and me() == 'Renamed Elsewhere')
+    
+    with app.app_context():
+        seed_catalog(10)
+    client.get('/api/cart', headers=headers)  # creates the cart
+    print('statements per cart request (carts table reads):')
+    requests = [
+        ('GET /api/cart?view=compact', 'get', '/api/cart?view=compact', None),
+        ('POST /api/cart/add?view=compact', 'post', '/api/cart/add?view=compact', {'product_id': 1}),
+        ('PUT /api/cart/update?view=compact', 'put', '/api/cart/update/{item}?view=compact', {'quantity': 3}),
+        ('POST /api/cart/batch', 'post', '/api/cart/batch', {'operations': [{'op': 'add', 'product_id': 2}]}),
+        ('DELETE /api/cart/remove?view=compact', 'delete', '/api/cart/remove/{item}?view=compact', None),
+        ('DELETE /api/cart/clear', 'delete', '/api/cart/clear', None),
+    ]
+    for label, method, path, body in requests:
+        if '{item}' in path:
+            with app.app_context():
+                path = path.format(item=CartItem.query.filter_by(product_id=1).first().id)
+        with QueryCounter(engine) as counter:
+            response = getattr(client, method)(path, headers=headers, json=body)
+        cart_reads = sum(1 for statement in counter.statements if statement.lstrip().startswith('SELECT') and 'FROM carts' in statement)
+        print(f'  {label:38} {counter.count:>3} ({cart_reads})')
+        check(f'{label} reads the cart at most once', response.status_code == 200 and cart_reads <= 1)
+    
+    print(f'claims cache: {claims_cache.stats()}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,237 @@
+"""
+Request instrumentation: overhead, Server-Timing accuracy and /api/metrics
+
+Serves `--requests` storefront requests with INSTRUMENTATION_ENABLED off and
+on and reports the cost per request, then checks that the Server-Timing
+statement count of each endpoint matches what a QueryCounter saw on the
+engine and that failing statements still raise their own errors, prints
+where time goes per route from the /api/metrics histograms, and checks the
+slow-query log (normalized statements, one entry per query shape), the
+slow-request log, the exposition format, and that both metrics endpoints
+and Server-Timing stay closed unless configured.
+
+    python -m benchmarks.instrumentation [--requests 2000] [--products 200]
+"""
+import argparse
+import logging
+import re
+import statistics
+import sys
+from flask import jsonify
+from flask.logging import default_handler
+from flask_jwt_extended import create_access_token
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from models import db, User
+from services.instrumentation import RequestTiming, instrumentation
+from benchmarks.common import BenchmarkConfig, QueryCounter, make_app, seed_catalog, timer
+
+SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{[^}]*\})? -?[0-9.e+-]+$')
+SLOW_SQL = ('WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 200000) '
+            'SELECT count(*) FROM c WHERE x > :floor')
+
+
+class InstrumentedConfig(BenchmarkConfig):
+    SLOW_QUERY_MS = 5
+    SLOW_REQUEST_MS = 5
+    SERVER_TIMING_ENABLED = True
+    METRICS_TOKEN = 'bench-metrics-token'
+
+
+def instrumented_app(config, products):
+    app = make_app(config)
+    
+    @app.route('/bench/slow/<int:floor>')
+    def slow(floor):
+        return jsonify({'count': db.session.execute(text(SLOW_SQL), {'floor': floor}).scalar()})
+    
+    with app.app_context():
+        seed_catalog(products)
+        user = User(email='shopper@example.com', password_hash='-', full_name='Shopper', phone_number='254712345678')
+        db.session.add(user)
+        db.session.commit()
+        token = create_access_token(identity=user.id)
+    return app, {'Authorization': f'Bearer {token}'}
+
+
+def parse_metrics(body):
+    """{(name, labels): value} for every sample; raises on a malformed line"""
+    samples = {}
+    for line in body.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        if not SAMPLE_LINE.match(line):
+            raise ValueError(f'bad sample line: {line}')
+        name_labels, value = line.rsplit(' ', 1)
+        name, _, labels = name_labels.partition('{')
+        samples[name, labels.rstrip('}')] = float(value)
+    return samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--products', type=int, default=200)
+    args = parser.parse_args(argv)
+    
+    failures = []
+    
+    def check(name, ok):
+        print(f'  {"ok" if ok else "FAILED"}: {name}')
+        if not ok:
+            failures.append(name)
+    
+    paths = ['/api/products', '/api/products/1', '/api/products/featured', '/api/categories', '/api/cart']
+    apps = {}
+    for enabled in (False, True):
+        class OverheadConfig(BenchmarkConfig):
+            INSTRUMENTATION_ENABLED = enabled
+            SERVER_TIMING_ENABLED = True
+            CATALOG_CACHE_ENABLED = False
+        
+        apps[enabled] = instrumented_app(OverheadConfig, args.products)
+    
+    # Interleaved rounds, so drift on a shared machine hits both modes alike
+    rounds = 10
+    elapsed = {False: [], True: []}
+    for _ in range(rounds):
+        for enabled, (app, headers) in apps.items():
+            instrumentation.enabled = enabled  # the cursor listeners are process-wide
+            client = app.test_client()
+            with timer() as timing:
+                for i in range(args.requests // rounds):
+                    client.get(paths[i % len(paths)], headers=headers)
+            elapsed[enabled].append(timing['elapsed'] / (args.requests // rounds) * 1e6)
+    print(f'{args.requests} requests over {", ".join(paths)}, {rounds} interleaved rounds')
+    print(f'{"instrumentation":16} {"µs/req (median)":>16} {"min":>7}')
+    for enabled, samples in elapsed.items():
+        print(f'{"on" if enabled else "off":16} {statistics.median(samples):>16.0f} {min(samples):>7.0f}')
+    
+    # The end-to-end difference is within run-to-run noise, so time the hooks directly
+    app, headers = apps[True]
+    with app.test_request_context('/api/products'):
+        response = app.response_class('{}')
+        with timer() as request_timing:
+            for _ in range(10000):
+                instrumentation.record_request(response, RequestTiming())
+        with timer() as query_timing:
+            for _ in range(10000):
+                instrumentation.record_query('SELECT 1', 0.0001)
+    client = app.test_client()
+    queries = statistics.mean(
+        int(re.search(r'"(\d+) queries"', client.get(path, headers=headers).headers['Server-Timing']).group(1)) for path in paths
+    )
+    cost = (request_timing['elapsed'] + query_timing['elapsed'] * queries) / 10000 * 1e6
+    print(f'hook cost: {cost:.1f} µs per request ({queries:.1f} statements) = '
+          f'{cost / statistics.median(elapsed[False]):.2%} of a request')
+    check('instrumentation costs under 5% of a request', cost < statistics.median(elapsed[False]) * 0.05)
+    instrumentation.enabled = True
+    
+    app, headers = instrumented_app(InstrumentedConfig, args.products)
+    with app.app_context():
+        engine = db.engine
+    client = app.test_client()
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    app.logger.addHandler(handler)
+    app.logger.removeHandler(default_handler)
+    instrumentation.reset()
+    
+    print('Server-Timing vs statements seen on the engine:')
+    requests = [
+        ('GET', '/api/products?per_page=50', None),
+        ('GET', '/api/products/3', None),
+        ('GET', '/api/products/search?q=leather', None),
+        ('GET', '/api/categories', None),
+        ('POST', '/api/cart/add', {'product_id': 2, 'quantity': 1}),
+        ('GET', '/api/cart', None),
+        ('GET', '/api/auth/me', None),
+        ('GET', '/api/orders', None),
+    ]
+    matched = True
+    for method, path, body in requests:
+        with QueryCounter(engine) as counter:
+            response = client.open(path, method=method, json=body, headers=headers)
+        server_timing = response.headers.get('Server-Timing', '')
+        reported = re.search(r'db;desc="(\d+) queries"', server_timing)
+        reported = int(reported.group(1)) if reported else None
+        matched &= reported == counter.count
+        print(f'  {method} {path:36} {response.status_code} {counter.count:>3} stmts  {server_timing}')
+    check('Server-Timing counts every statement a request runs', matched)
+    
+    def raised(statement, parameters=None):
+        with app.app_context():
+            try:
+                db.session.execute(text(statement), parameters)
+            except Exception as e:
+                return type(e)
+            finally:
+                db.session.rollback()
+    
+    check('a failing statement raises its own error', raised('SELECT * FROM nonexistent') is OperationalError)
+    check('a constraint violation still raises IntegrityError',
+          raised('INSERT INTO users (id, email, password_hash, full_name, phone_number) VALUES (:id, :email, :password_hash, :full_name, :phone_number)',
+                 {'id': 1, 'email': 'shopper@example.com', 'password_hash': '-', 'full_name': 'Shopper', 'phone_number': '254712345678'})
+          is IntegrityError)
+    with QueryCounter(engine) as counter:
+        server_timing = client.get('/api/categories').headers.get('Server-Timing', '')
+    check('statements after a failed one are still timed', f'"{counter.count} queries"' in server_timing)
+    
+    for floor in (10, 20, 30):
+        client.get(f'/bench/slow/{floor}')
+    slow = instrumentation.top_slow_queries()['statements']
+    recursive = [entry for entry in slow if entry['statement'].startswith('WITH RECURSIVE')]
+    print(f'slowest statement: {recursive[0]["statement"] if recursive else None}')
+    check('slow statements are grouped by their normalized text', len(recursive) == 1 and recursive[0]['count'] == 3)
+    check('normalized statements carry no literals or parameters',
+          recursive and '200000' not in recursive[0]['statement'] and ':floor' not in recursive[0]['statement'])
+    check('slow queries are logged with their route',
+          any('Slow query' in record.getMessage() and '/bench/slow/<int:floor>' in record.getMessage() for record in records))
+    check('slow requests are logged with their query count',
+          any(record.getMessage().startswith('Slow request') and 'queries' in record.getMessage() for record in records))
+    
+    check('/api/metrics requires METRICS_TOKEN when set', client.get('/api/metrics').status_code == 401)
+    response = client.get('/api/metrics', headers={'Authorization': f'Bearer {InstrumentedConfig.METRICS_TOKEN}'})
+    try:
+        samples = parse_metrics(response.get_data(as_text=True))
+    except ValueError as e:
+        print(f'  {e}')
+        samples = {}
+    check('/api/metrics is valid Prometheus text', response.status_code == 200 and bool(samples))
+    
+    counts = {labels: value for (name, labels), value in samples.items() if name == 'http_request_duration_seconds_count'}
+    consistent = all(
+        samples.get(('http_request_duration_seconds_bucket', f'{labels},le="+Inf"')) == count for labels, count in counts.items()
+    )
+    check('histogram +Inf buckets equal their counts', bool(counts) and consistent)
+    total = sum(value for (name, _), value in samples.items() if name == 'http_requests_total')
+    check('http_requests_total counts every instrumented request', total == len(requests) + 5)
+    
+    metrics_headers = {'Authorization': f'Bearer {InstrumentedConfig.METRICS_TOKEN}'}
+    check('/api/health/slow-queries requires METRICS_TOKEN',
+          client.get('/api/health/slow-queries').status_code == 401
+          and client.get('/api/health/slow-queries', headers=metrics_headers).status_code == 200)
+    
+    print(f'{"route":42} {"requests":>8} {"ms":>7} {"queries":>8} {"SQL ms":>7}')
+    for labels, count in sorted(counts.items()):
+        route = re.search(r'route="([^"]*)"', labels).group(1)
+        wall = samples['http_request_duration_seconds_sum', labels] / count * 1000
+        queries = samples['http_request_sql_queries_sum', labels] / count
+        sql = samples['http_request_sql_duration_seconds_sum', labels] / count * 1000
+        print(f'{route:42} {count:>8.0f} {wall:>7.2f} {queries:>8.1f} {sql:>7.2f}')
+    
+    # Defaults: no token configured and no Server-Timing
+    app = make_app(BenchmarkConfig)
+    client = app.test_client()
+    check('Server-Timing is off by default', 'Server-Timing' not in client.get('/api/categories').headers)
+    check('metrics endpoints fail closed without METRICS_TOKEN',
+          client.get('/api/metrics').status_code == 403 and client.get('/api/health/slow-queries').status_code == 403)
+    app.debug = True
+    check('metrics endpoints open without METRICS_TOKEN in debug mode',
+          client.get('/api/metrics').status_code == 200 and client.get('/api/health/slow-queries').status_code == 200)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Storefront load test per gunicorn run profile
+
+Seeds a synthetic catalog into a file-backed SQLite database, then for each
+profile (see profiles.py) starts gunicorn with gunicorn_config.py, drives
+the storefront endpoints from `--clients` concurrent keep-alive clients for
+`--duration` seconds, and reports throughput and p50/p95/p99 latency.
+
+Every SQL statement is delayed by `--query-delay-ms` (default 5 ms) to stand
+in for the network round trip to a managed PostgreSQL, which is what makes
+sync workers stall; the catalog cache is off unless --cache is given.
+
+    python -m benchmarks.load_test [--profiles sync,gthread,gevent] [--clients 32] [--duration 10]
+"""
+import argparse
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from sqlalchemy import event
+from benchmarks.common import BenchmarkConfig, make_app, seed_catalog
+from benchmarks.search import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class LoadConfig(BenchmarkConfig):
+    """App configuration for the gunicorn workers, taken from the harness environment"""
+    SQLALCHEMY_DATABASE_URI = os.getenv('LOAD_DATABASE_URI', 'sqlite://')
+    CATALOG_CACHE_ENABLED = os.getenv('LOAD_CACHE', 'false') == 'true'
+    TESTING = False
+
+
+def load_app():
+    """gunicorn entry point: `benchmarks.load_test:load_app()`"""
+    from app import create_app
+    from models import db
+    
+    app = create_app(LoadConfig)
+    delay = float(os.getenv('LOAD_QUERY_DELAY_MS', 0)) / 1000
+    if delay:
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', lambda *args: time.sleep(delay))
+    return app
+
+
+def storefront_paths(product_count, seed=11):
+    """Endless mix of listing, detail, featured, category and search requests"""
+    rng = random.Random(seed)
+    queries = ['lip', 'sneakers', 'black dress', 'wireless', 'kitenge', 'leather bag', 'serum']
+    while True:
+        kind = rng.random()
+        if kind < 0.35:
+            yield f'/api/products?limit=20&sort={rng.choice(["newest", "price_asc", "price_desc"])}'
+        elif kind < 0.6:
+            yield f'/api/products/{rng.randint(1, product_count)}'
+        elif kind < 0.75:
+            yield '/api/products/featured'
+        elif kind < 0.85:
+            yield '/api/categories'
+        else:
+            yield f'/api/products/search?q={rng.choice(queries)}'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(profile, port, env):
+    command = [
+        sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_config.py',
+        '--bind', f'127.0.0.1:{port}', '--access-logfile', os.devnull, '--log-level', 'warning',
+        'benchmarks.load_test:load_app()',
+    ]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env={**env, 'GUNICORN_PROFILE': profile})
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/api/health', timeout=1).ok:
+                return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'gunicorn ({profile}) did not start')
+
+
+def drive(base_url, paths, clients, duration):
+    """Run `clients` request loops for `duration` seconds; returns (latencies ms, errors, elapsed)"""
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+    stop_at = time.monotonic() + duration
+    
+    def loop(_):
+        session = requests.Session()
+        local = []
+        while time.monotonic() < stop_at:
+            with lock:
+                path = next(paths)
+            start = time.perf_counter()
+            try:
+                ok = session.get(base_url + path, timeout=30).status_code == 200
+            except requests.RequestException:
+                ok = False
+            local.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(local)
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(loop, range(clients)))
+    return latencies, errors[0], time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--profiles', default='sync,gthread,gevent')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=2)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--query-delay-ms', type=float, default=5)
+    parser.add_argument('--cache', action='store_true', help='leave the catalog cache on')
+    args = parser.parse_args(argv)
+    
+    database_uri = os.getenv('BENCH_DATABASE_URI')
+    if not database_uri or database_uri == 'sqlite://':
+        database_uri = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'load_test.db')
+    
+    class SeedConfig(BenchmarkConfig):
+        SQLALCHEMY_DATABASE_URI = database_uri
+    
+    app = make_app(SeedConfig)
+    with app.app_context():
+        seed_catalog(args.products)
+    
+    env = {
+        **os.environ,
+        'LOAD_DATABASE_URI': database_uri,
+        'LOAD_QUERY_DELAY_MS': str(args.query_delay_ms),
+        'LOAD_CACHE': 'true' if args.cache else 'false',
+    }
+    print(f'{args.clients} clients for {args.duration:.0f}s per profile, {args.products} products, '
+          f'{args.query_delay_ms:g}ms per query, catalog cache {"on" if args.cache else "off"}')
+    print(f'{"profile":10} {"workers":>7} {"threads":>7} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>7}')
+    
+    from profiles import resolve_profile
+    for name in args.profiles.split(','):
+        profile = resolve_profile(name)
+        port = free_port()
+        server = start_server(name, port, env)
+        base_url = f'http://127.0.0.1:{port}'
+        try:
+            paths = storefront_paths(args.products)
+            drive(base_url, paths, args.clients, args.warmup)
+            latencies, errors, elapsed = drive(base_url, paths, args.clients, args.duration)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+        print(f'{name:10} {profile["workers"]:>7} {profile["threads"]:>7} {len(latencies) / elapsed:>8.0f} '
+              f'{percentile(latencies, 50):>8.1f} {percentile(latencies, 95):>8.1f} '
+              f'{percentile(latencies, 99):>8.1f} {errors:>7}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
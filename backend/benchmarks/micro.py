@@ -0,0 +1,97 @@
+"""
+Micro-benchmarks: Product.to_dict, Cart.to_dict and order creation
+
+Times the serializers on objects already loaded into the session (so only
+the Python work is measured, no lazy loads), and place_order() plus its
+commit for carts of 1 and 10 lines (the cart is refilled outside the
+timing). Each case runs `--repeat` rounds; the median round is reported as
+µs per call and calls/s. --json writes the results for benchmarks.compare.
+
+    python -m benchmarks.micro [--products 1000] [--repeat 7] [--json PATH]
+"""
+import argparse
+import statistics
+import sys
+from sqlalchemy.orm import joinedload
+from models import db, Cart, CartItem, Product, User
+from services.checkout import place_order
+from benchmarks.checkout import CHECKOUT, fill_cart
+from benchmarks.common import BenchmarkConfig, make_app, seed_catalog, timer, write_results
+
+
+class MicroConfig(BenchmarkConfig):
+    STOCK_SWEEP_INTERVAL = 3600
+
+
+def measure(repeat, number, call, setup=None):
+    """Median and best µs per call over `repeat` rounds of `number` calls"""
+    rounds = []
+    for _ in range(repeat):
+        elapsed = 0.0
+        for _ in range(number):
+            if setup is not None:
+                setup()
+            with timer() as timing:
+                call()
+            elapsed += timing['elapsed']
+        rounds.append(elapsed / number * 1e6)
+    return statistics.median(rounds), min(rounds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--json', metavar='PATH', help='write the results as JSON')
+    args = parser.parse_args(argv)
+    
+    app = make_app(MicroConfig)
+    results = {}
+    with app.app_context():
+        seed_catalog(args.products)
+        db.session.execute(Product.__table__.update().values(stock=1_000_000))
+        user = User(email='micro@example.com', password_hash='-', full_name='Micro Buyer', phone_number=CHECKOUT['phone_number'])
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        product_ids = [product_id for product_id, in db.session.query(Product.id).order_by(Product.id).limit(100)]
+        database = db.engine.dialect.name
+        
+        print(f'{args.repeat} rounds per case on {database}, median round')
+        print(f'{"case":34} {"µs/call":>10} {"best":>10} {"calls/s":>10}')
+        
+        def report(name, key, number, call, setup=None, per_call=1):
+            median, best = measure(args.repeat, number, call, setup)
+            median, best = median / per_call, best / per_call
+            print(f'{name:34} {median:>10.1f} {best:>10.1f} {1e6 / median:>10,.0f}')
+            results[key] = {'value': round(median, 3), 'unit': 'µs', 'better': 'lower'}
+        
+        products = Product.query.options(joinedload(Product.category)).order_by(Product.id).limit(100).all()
+        report('Product.to_dict', 'product_to_dict_us', 10, lambda: [product.to_dict() for product in products],
+               per_call=len(products))
+        
+        for lines in (1, 10):
+            fill_cart(user_id, product_ids[:lines])
+            cart = (
+                Cart.query.options(joinedload(Cart.items).joinedload(CartItem.product).joinedload(Product.category))
+                .filter_by(user_id=user_id).one()
+            )
+            report(f'Cart.to_dict, {lines}-line cart', f'cart_to_dict_{lines}_lines_us', 1000, cart.to_dict)
+        
+        def order():
+            place_order(user_id, CHECKOUT)
+            db.session.commit()
+        
+        fill_cart(user_id, product_ids[:1])
+        order()  # warm-up: the first checkout runs the reservation sweep
+        for lines in (1, 10):
+            report(f'place_order + commit, {lines}-line cart', f'place_order_{lines}_lines_us', 50, order,
+                   setup=lambda: fill_cart(user_id, product_ids[:lines]))
+    
+    if args.json:
+        write_results(args.json, 'micro', database, {'products': args.products, 'repeat': args.repeat}, results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
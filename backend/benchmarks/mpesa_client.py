@@ -0,0 +1,84 @@
+"""
+M-Pesa client against a local fake Daraja
+
+Runs concurrent STK pushes through services/mpesa.py and checks that the
+access token is minted once and shared (single-flight refresh), connections
+are pooled, transaction ids are our own, 503s and a revoked token are
+retried transparently, and a stalled server is cut off by the read timeout.
+
+    python -m benchmarks.mpesa_client [--threads 16] [--pushes 200]
+"""
+import argparse
+import statistics
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from services.mpesa import mpesa_service
+from benchmarks.common import BenchmarkConfig, make_app, timer
+from benchmarks.fake_daraja import FakeDaraja
+
+
+def push(n):
+    with timer() as elapsed:
+        response = mpesa_service.initiate_stk_push('0712345678', 100 + n, f'ORDER{n}', f'Order {n}')
+    return response, elapsed['elapsed'] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--pushes', type=int, default=200)
+    args = parser.parse_args()
+    
+    fake = FakeDaraja()
+    base_url = fake.start()
+    
+    class MpesaConfig(BenchmarkConfig):
+        MPESA_ENABLED = True
+        MPESA_BASE_URL = base_url
+        MPESA_POOL_SIZE = args.threads
+        MPESA_READ_TIMEOUT = 0.5
+        MPESA_RETRY_BACKOFF = 0.01
+    
+    make_app(MpesaConfig)
+    checks = []
+    
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(push, range(args.pushes)))
+    latencies = [ms for _, ms in results]
+    print(f'{args.pushes} STK pushes on {args.threads} threads: '
+          f'p50 {statistics.median(latencies):.1f}ms, max {max(latencies):.1f}ms')
+    print(f'  token requests {fake.token_requests}, connections opened {len(fake.connections)}')
+    checks.append(('all pushes accepted', all(response['success'] for response, _ in results)))
+    checks.append(('one token for all threads', fake.token_requests == 1))
+    checks.append(('connections pooled', len(fake.connections) <= args.threads))
+    transaction_ids = {response['transaction_id'] for response, _ in results}
+    checks.append(('transaction ids are unique and not Daraja request ids',
+                   len(transaction_ids) == args.pushes
+                   and not transaction_ids & {response['checkout_request_id'] for response, _ in results}))
+    
+    fake.fail_next(2, status=503)
+    response, _ = push(-1)
+    checks.append(('503s retried', response['success']))
+    
+    fake.expire_tokens()
+    response, _ = push(-2)
+    checks.append(('revoked token refreshed', response['success'] and fake.token_requests == 2))
+    
+    status = mpesa_service.query_stk_status(response['checkout_request_id'])
+    checks.append(('status query', status['status'] == 'success'))
+    
+    fake.delay = 1.0
+    with timer() as elapsed:
+        response, _ = push(-3)
+    fake.delay = 0.0
+    print(f'  stalled push failed after {elapsed["elapsed"] * 1000:.0f}ms: {response.get("error")}')
+    checks.append(('stalled push times out without resending', not response['success'] and elapsed['elapsed'] < 0.9))
+    
+    fake.stop()
+    for name, ok in checks:
+        print(f"  {'ok' if ok else 'FAILED':6} {name}")
+    return 0 if all(ok for _, ok in checks) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
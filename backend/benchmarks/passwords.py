@@ -0,0 +1,151 @@
+"""
+Password hashing cost and login throughput
+
+Times one verification per hash configuration on a single core (logins/s
+per core), then drives POST /api/auth/login from `--clients` threads for
+`--seconds` with the KDF inline on the request threads and in the
+process pool, while a probe thread measures GET /api/categories latency to
+show what a login burst does to the rest of the worker. Checks that
+outdated hashes are upgraded on login and that an overloaded pool sheds
+logins with a 503 instead of queueing them.
+
+    python -m benchmarks.passwords [--clients 8] [--seconds 5] [--methods scrypt:32768:8:1,pbkdf2:sha256:600000]
+"""
+import argparse
+import multiprocessing
+import sys
+import threading
+import time
+from werkzeug.security import check_password_hash, generate_password_hash
+from models import db, User
+from services.passwords import hash_parameters, password_hasher
+from benchmarks.common import BenchmarkConfig, make_app, seed_catalog
+from benchmarks.search import percentile
+
+METHODS = 'scrypt:32768:8:1,scrypt:16384:8:1,pbkdf2:sha256:600000,pbkdf2:sha256:260000'
+PASSWORD = 'correct horse battery staple'
+
+
+def verify_rate(method, rounds=5):
+    """Verifications per second on one core"""
+    password_hash = generate_password_hash(PASSWORD, method)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        check_password_hash(password_hash, PASSWORD)
+    return rounds / (time.perf_counter() - start)
+
+
+def login_app(method, processes, max_pending=16, users=8):
+    class PasswordConfig(BenchmarkConfig):
+        PASSWORD_HASH_METHOD = method
+        PASSWORD_HASH_PROCESSES = processes
+        PASSWORD_HASH_MAX_PENDING = max_pending
+    
+    app = make_app(PasswordConfig)
+    with app.app_context():
+        seed_catalog(20)
+        password_hash = generate_password_hash(PASSWORD, method)
+        db.session.add_all(
+            User(email=f'user{i}@example.com', password_hash=password_hash, full_name=f'User {i}', phone_number='254712345678')
+            for i in range(users)
+        )
+        db.session.commit()
+    return app
+
+
+def login_burst(app, clients, seconds):
+    """(logins/s, probe latencies in ms, statuses) with `clients` threads logging in"""
+    deadline = time.perf_counter() + seconds
+    logins, statuses, latencies = [0], {}, []
+    lock = threading.Lock()
+    
+    def login(i):
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            response = client.post('/api/auth/login', json={'email': f'user{i}@example.com', 'password': PASSWORD})
+            with lock:
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                logins[0] += response.status_code == 200
+    
+    def probe():
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            client.get('/api/categories')
+            latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.01)
+    
+    threads = [threading.Thread(target=login, args=(i,)) for i in range(clients)] + [threading.Thread(target=probe)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return logins[0] / seconds, latencies, statuses
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--methods', default=METHODS)
+    args = parser.parse_args(argv)
+    cpus = multiprocessing.cpu_count()
+    
+    failures = []
+    
+    def check(name, ok):
+        print(f'  {"ok" if ok else "FAILED"}: {name}')
+        if not ok:
+            failures.append(name)
+    
+    methods = [hash_parameters(method) for method in args.methods.split(',')]
+    print(f'KDF cost ({cpus} CPU{"s" if cpus > 1 else ""})')
+    print(f'{"method":24} {"ms/login":>9} {"logins/s/core":>14}')
+    for method in methods:
+        rate = verify_rate(method)
+        print(f'{method:24} {1000 / rate:>9.1f} {rate:>14.1f}')
+    
+    method = methods[0]
+    print(f'POST /api/auth/login with {method}, {args.clients} clients for {args.seconds:g}s, probing GET /api/categories')
+    print(f'{"KDF runs":26} {"logins/s":>9} {"per core":>9} {"probe p50":>10} {"probe p95":>10}')
+    results = {}
+    for label, processes in (('inline (request threads)', 0), (f'process pool ({cpus})', cpus)):
+        app = login_app(method, processes)
+        login_burst(app, 1, 0.5)  # starts the pool
+        rate, latencies, statuses = login_burst(app, args.clients, args.seconds)
+        password_hasher.reset()
+        results[processes] = (rate, percentile(latencies, 95))
+        print(f'{label:26} {rate:>9.1f} {rate / cpus:>9.1f} {percentile(latencies, 50):>10.1f} '
+              f'{percentile(latencies, 95):>10.1f}  {statuses}')
+    check('every login in the pool run succeeded', set(statuses) == {200})
+    check('the pool sustains the inline login rate', results[cpus][0] >= results[0][0] * 0.8)
+    
+    print('rehash on login:')
+    app = login_app('pbkdf2:sha256:1000', 0, users=1)
+    app.config['PASSWORD_HASH_METHOD'] = method
+    password_hasher.init_app(app)
+    client = app.test_client()
+    
+    def stored_hash():
+        with app.app_context():
+            return db.session.get(User, 1).password_hash
+    
+    response = client.post('/api/auth/login', json={'email': 'user0@example.com', 'password': 'wrong'})
+    check('a wrong password is rejected without touching the hash',
+          response.status_code == 401 and stored_hash().startswith('pbkdf2:sha256:1000$'))
+    response = client.post('/api/auth/login', json={'email': 'user0@example.com', 'password': PASSWORD})
+    upgraded = stored_hash()
+    check(f'an outdated hash is upgraded to {method} on login', response.status_code == 200 and upgraded.startswith(method + '$'))
+    response = client.post('/api/auth/login', json={'email': 'user0@example.com', 'password': PASSWORD})
+    check('the upgraded hash verifies and is kept', response.status_code == 200 and stored_hash() == upgraded)
+    
+    print('overload:')
+    app = login_app(method, 1, max_pending=0)
+    _, _, statuses = login_burst(app, 4, 1)
+    password_hasher.reset()
+    check(f'logins beyond the pool are shed with 503 ({statuses})', statuses.get(200) and statuses.get(503))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
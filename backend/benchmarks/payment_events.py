@@ -0,0 +1,114 @@
+"""
+Payment status over Server-Sent Events instead of polling
+
+Opens one GET /api/payments/<order_id>/events stream per waiting shopper
+(a thread each), settles every payment through the M-Pesa callback, and
+measures how long each status event takes to arrive. It also counts the SQL
+statements the waiting clients cost, compared with polling
+GET /api/payments/<order_id>/status every `--poll-interval` seconds for the
+same wait. Streams are opened with the per-order token from POST
+/events/token; the checks at the end cover what such a token does not
+grant.
+
+    python -m benchmarks.payment_events [--clients 200] [--wait 2.0]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask_jwt_extended import create_access_token
+from models import db, User
+from services.events import event_broker
+from services.instrumentation import redact_query
+from benchmarks.callback_replay import seed
+from benchmarks.common import BenchmarkConfig, CALLBACK_URL, QueryCounter, make_app, timer
+from benchmarks.fake_daraja import callback_payload
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--wait', type=float, default=2.0, help='seconds the shoppers wait before the callbacks')
+    parser.add_argument('--poll-interval', type=float, default=2.0)
+    args = parser.parse_args(argv)
+    
+    database_uri = os.getenv('BENCH_DATABASE_URI')
+    if not database_uri or database_uri == 'sqlite://':
+        database_uri = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'payment_events.db')
+    
+    class EventsConfig(BenchmarkConfig):
+        SQLALCHEMY_DATABASE_URI = database_uri
+        MPESA_ENABLED = True
+        SSE_HEARTBEAT = 60
+    
+    app = make_app(EventsConfig)
+    with app.app_context():
+        _, pushes = seed(args.clients)
+        token = create_access_token(identity=User.query.one().id)
+        engine = db.engine
+    
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app.test_client()
+    stream_tokens = {
+        order_id: client.post(f'/api/payments/{order_id}/events/token', headers=headers).get_json()['token']
+        for order_id in range(1, args.clients + 1)
+    }
+    connected = threading.Barrier(args.clients + 1)
+    
+    def wait_for_status(order_id):
+        response = app.test_client().get(f'/api/payments/{order_id}/events?token={stream_tokens[order_id]}', buffered=False)
+        chunks = iter(response.response)
+        next(chunks)  # retry: hint, sent once subscribed
+        connected.wait()
+        body = b''.join(chunks).decode()
+        received = time.perf_counter()
+        response.close()
+        data = json.loads(body.split('data: ', 1)[1])
+        return data['payment_status'], received
+    
+    order_ids = list(range(1, args.clients + 1))
+    with ThreadPoolExecutor(max_workers=args.clients) as pool, QueryCounter(engine) as queries:
+        futures = [pool.submit(wait_for_status, order_id) for order_id in order_ids]
+        connected.wait()
+        time.sleep(args.wait)
+        idle_statements = queries.count
+        
+        sent = {}
+        with timer() as elapsed:
+            for push in pushes:
+                sent[push['checkout_request_id']] = time.perf_counter()
+                client.post(CALLBACK_URL, json=callback_payload(push))
+        results = [future.result() for future in futures]
+    
+    delays = [(received - sent[push['checkout_request_id']]) * 1000 for push, (_, received) in zip(pushes, results)]
+    polling = args.clients * int(args.wait / args.poll_interval + 1) * 2
+    print(f'{args.clients} shoppers waiting {args.wait:.1f}s, callbacks settled in {elapsed["elapsed"] * 1000:.0f}ms')
+    print(f'  event delivery p50 {statistics.median(delays):.1f}ms, max {max(delays):.1f}ms')
+    print(f'  statements while waiting: {idle_statements} with SSE vs ~{polling} polling every {args.poll_interval:.0f}s')
+    
+    stats = event_broker.stats()
+    checks = [
+        ('every shopper told once', [status for status, _ in results] == ['completed'] * args.clients),
+        ('no subscribers left behind', stats['subscribers'] == 0),
+        ('one status query per stream', idle_statements <= args.clients),
+        ('the access token is not accepted in the URL', client.get(f'/api/payments/1/events?jwt={token}').status_code == 401),
+        ("a stream token opens only its own order's stream", client.get(f'/api/payments/2/events?token={stream_tokens[1]}').status_code == 401),
+        ('a stream token is not an access token',
+         client.get('/api/orders', headers={'Authorization': f'Bearer {stream_tokens[1]}'}).status_code != 200),
+        ('tokens in URLs are masked in the logs',
+         stream_tokens[1] not in redact_query(f'GET /api/payments/1/events?token={stream_tokens[1]} HTTP/1.1')),
+    ]
+    app.config['SSE_TOKEN_TTL'] = -1
+    checks.append(('an expired stream token is refused', client.get(f'/api/payments/1/events?token={stream_tokens[1]}').status_code == 401))
+    for name, ok in checks:
+        print(f"  {'ok' if ok else 'FAILED':6} {name}")
+    return 0 if all(ok for _, ok in checks) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
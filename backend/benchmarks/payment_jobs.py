@@ -0,0 +1,180 @@
+"""
+STK pushes through the job queue against a local fake Daraja
+
+Places orders, initiates payment for each through POST /api/payments/mpesa/initiate
+(which must return 202 without waiting on a slow Daraja), drains the queue
+with work_off and checks that every push went out once, 503s are retried,
+an unreachable Daraja dead-letters the job and fails the payment, a
+callback (no callback secret configured) only settles what an STK query
+confirms, and the reconciler settles payments whose callback never arrived.
+With MPESA_ENABLED off, nothing may settle a stale payment as paid. Last,
+a Worker must survive a failed claim, back off and pick up on the next poll.
+
+    python -m benchmarks.payment_jobs [--orders 50]
+"""
+import argparse
+import logging
+import statistics
+import sys
+from datetime import datetime, timedelta
+from flask.logging import default_handler
+from sqlalchemy import text
+from models import db, Job, MpesaCallback, Order, Payment
+from services.jobs import Worker, enqueue, queue_stats, task, work_off
+from services.payments import STK_PUSH_JOB, reconcile_pending_payments
+from benchmarks.common import BenchmarkConfig, make_app, timer
+from benchmarks.fake_daraja import FakeDaraja, callback_payload
+from benchmarks.stock_race import CHECKOUT, seed
+
+
+@task('bench.noop')
+def noop():
+    pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=50)
+    args = parser.parse_args(argv)
+    
+    fake = FakeDaraja()
+    base_url = fake.start()
+    
+    class JobsConfig(BenchmarkConfig):
+        MPESA_ENABLED = True
+        MPESA_BASE_URL = base_url
+        MPESA_RETRIES = 0
+        MPESA_READ_TIMEOUT = 0.5
+        MPESA_CALLBACK_SECRET = ''
+        JOBS_EAGER = False
+        JOB_RETRY_BACKOFF = 0
+        STOCK_SWEEP_INTERVAL = 3600
+    
+    app = make_app(JobsConfig)
+    client = app.test_client()
+    checks = []
+    
+    with app.app_context():
+        _, tokens = seed(args.orders, args.orders)
+    headers = [{'Authorization': f'Bearer {token}'} for token in tokens]
+    order_ids = [client.post('/api/orders', json=CHECKOUT, headers=h).get_json()['order']['id'] for h in headers]
+    
+    # Daraja is slow, but initiating only queues the push
+    fake.delay = 0.2
+    latencies = []
+    for order_id, h in zip(order_ids, headers):
+        with timer() as elapsed:
+            response = client.post('/api/payments/mpesa/initiate', json={'order_id': order_id}, headers=h)
+        latencies.append(elapsed['elapsed'] * 1000)
+        assert response.status_code == 202, response.get_json()
+    fake.delay = 0.0
+    print(f'{args.orders} payments initiated: p50 {statistics.median(latencies):.1f}ms, max {max(latencies):.1f}ms')
+    checks.append(('initiate does not wait for Daraja', max(latencies) < 200))
+    
+    with app.app_context():
+        checks.append(('nothing sent before the worker runs', fake.stk_requests == 0))
+        
+        fake.fail_next(2, status=503)
+        with timer() as elapsed:
+            processed = work_off()
+        print(f'  worker ran {processed} job(s) in {elapsed["elapsed"] * 1000:.0f}ms, stats {queue_stats()}')
+        payments = Payment.query.all()
+        checks.append(('every payment pushed', all(p.checkout_request_id for p in payments)))
+        checks.append(('503s retried by the queue', processed == args.orders + 2))
+        checks.append(('one push per payment', fake.stk_requests == args.orders))
+        
+        # Daraja down for good: the job is dead-lettered and the payment failed
+        order = db.session.get(Order, order_ids[0])
+        payment = Payment(order_id=order.id, phone_number='254700000000', amount=order.total_amount, status='pending')
+        db.session.add(payment)
+        db.session.flush()
+        job = enqueue(STK_PUSH_JOB, {'payment_id': payment.id})
+        db.session.commit()
+        fake.fail_next(job.max_attempts, status=503)
+        work_off()
+        dead = Job.query.filter_by(status='dead').count()
+        checks.append(('dead-lettered push fails the payment', dead == 1 and db.session.get(Payment, payment.id).status == 'failed'))
+        
+        # Without a callback secret, Daraja's STK query decides whether a callback is applied
+        payment = Payment.query.filter_by(status='pending').order_by(Payment.id).first()
+        callback = callback_payload(fake.pushes[payment.checkout_request_id])
+        
+        def status():
+            return db.session.execute(db.select(Payment.status).filter_by(id=payment.id)).scalar()
+        
+        fake.query_result = 'pending'
+        client.post('/api/payments/mpesa/callback', json=callback)
+        fake.query_result = '1032'
+        client.post('/api/payments/mpesa/callback', json=callback)
+        unconfirmed = status() == 'pending' and MpesaCallback.query.count() == 0
+        fake.query_result = '0'
+        client.post('/api/payments/mpesa/callback', json=callback)
+        checks.append(('callbacks settle only what an STK query confirms', unconfirmed and status() == 'success'))
+        
+        # No callbacks arrived: age the payments and let the reconciler poll
+        Payment.query.filter_by(status='pending').update({'created_at': datetime.utcnow() - timedelta(minutes=5)})
+        db.session.commit()
+        with timer() as elapsed:
+            counts = reconcile_pending_payments()
+        print(f'  reconciled {counts} in {elapsed["elapsed"] * 1000:.0f}ms ({fake.query_requests} queries)')
+        paid = Order.query.filter_by(payment_status='completed').count()
+        checks.append(('reconciler settles missing callbacks', counts['success'] == args.orders - 1 and paid == args.orders))
+        checks.append(('settled payments not queried again', reconcile_pending_payments()['checked'] == 0))
+    
+    fake.stop()
+    
+    # Simulated client: no status query may stand in for a payment that never happened
+    class PlaceholderConfig(JobsConfig):
+        MPESA_ENABLED = False
+    
+    app = make_app(PlaceholderConfig)
+    client = app.test_client()
+    with app.app_context():
+        _, tokens = seed(1, 1)
+    order = client.post('/api/orders', json=CHECKOUT, headers={'Authorization': f'Bearer {tokens[0]}'}).get_json()['order']
+    with app.app_context():
+        push = {'checkout_request_id': 'ws_CO_PLACEHOLDER', 'merchant_request_id': 'placeholder-mr',
+                'amount': order['total_amount'], 'phone_number': CHECKOUT['phone_number']}
+        payment = Payment(order_id=order['id'], phone_number=push['phone_number'], amount=push['amount'], status='pending',
+                          checkout_request_id=push['checkout_request_id'], merchant_request_id=push['merchant_request_id'],
+                          created_at=datetime.utcnow() - timedelta(hours=1))
+        db.session.add(payment)
+        db.session.commit()
+        client.post('/api/payments/mpesa/callback', json=callback_payload(push))
+        settled = sum(reconcile_pending_payments()['checked'] for _ in range(20))
+        status = db.session.execute(db.select(Payment.status).filter_by(id=payment.id)).scalar()
+        checks.append(('a disabled client never settles a pending payment', settled == 0 and status == 'pending'))
+        
+        # The jobs table goes away under a polling worker (a database outage, as far as it can tell)
+        enqueue('bench.noop')
+        db.session.execute(text('ALTER TABLE jobs RENAME TO jobs_offline'))
+        db.session.commit()
+    
+    worker = Worker(app, poll_interval=0.01)
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    app.logger.addHandler(handler)
+    app.logger.removeHandler(default_handler)
+    try:
+        failed = worker.run_once()
+        backoff = worker.idle_delay()
+    finally:
+        app.logger.removeHandler(handler)
+        app.logger.addHandler(default_handler)
+    with app.app_context():
+        db.session.execute(text('ALTER TABLE jobs_offline RENAME TO jobs'))
+        db.session.commit()
+    recovered = worker.run_once()
+    print(f'  worker after a failed claim: ran {failed}, backed off {backoff:.2f}s, then ran {recovered}')
+    checks.append(('a failed claim is logged and backed off, not fatal',
+                   failed == 0 and backoff == 0.02 and any('Claiming jobs failed' in r.getMessage() for r in records)))
+    checks.append(('the worker recovers on the next poll', recovered == 1 and worker.failures == 0))
+    
+    for name, ok in checks:
+        print(f"  {'ok' if ok else 'FAILED':6} {name}")
+    return 0 if all(ok for _, ok in checks) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
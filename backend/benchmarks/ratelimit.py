@@ -0,0 +1,192 @@
+"""
+Rate limiting: cost per check, per-client isolation and cross-worker limits
+
+Times a rate limit check with the per-worker token bucket and with each
+shared store, single-threaded and from `--threads` threads, then checks
+the policies through the app: /api/products admits its burst and answers
+429 with Retry-After after that, clients (IPs behind the proxy, signed-in
+users) are counted apart, /api/health/ratelimit reports the rejections and
+a failing store falls back to the per-worker bucket. Finally `--workers`
+processes share one SQLite store file and must admit exactly the policy's
+limit between them, against `--workers` times the limit without it.
+
+    python -m benchmarks.ratelimit [--checks 100000] [--threads 8] [--workers 4]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from flask_jwt_extended import create_access_token
+from models import db, User
+from services.ratelimit import Policy, RateLimiter, rate_limiter
+from benchmarks.common import BenchmarkConfig, make_app, seed_catalog, timer
+
+SHARED_RATE = '50/hour'
+
+
+class RateLimitConfig(BenchmarkConfig):
+    RATE_LIMIT_ENABLED = True
+    RATE_LIMIT_TRUSTED_PROXIES = 1
+    RATE_LIMIT_STORAGE_URL = ''
+    RATE_LIMIT_POLICIES = {
+        'auth.login': {'rate': '5/minute', 'key': 'ip', 'shared': True},
+        'payments.initiate_mpesa_payment': {'rate': '3/minute', 'key': 'user', 'shared': True},
+        'products': {'rate': '10/second', 'burst': 20, 'key': 'user'},
+    }
+
+
+def limiter(storage_url='', rate='1000000/second', shared=False):
+    """A standalone RateLimiter with one 'bench' policy"""
+    instance = RateLimiter()
+    instance.policies = {'bench': Policy('bench', rate, key='ip', shared=shared)}
+    instance.storage_url = storage_url
+    instance.reset()
+    return instance
+
+
+def check_rate(instance, checks, threads=1, clients=1000):
+    """Checks per second from `threads` threads spread over `clients` keys"""
+    policy = instance.policies['bench']
+    keys = [f'ip:10.0.{i // 256}.{i % 256}' for i in range(clients)]
+    per_thread = checks // threads
+    
+    def run(offset):
+        for i in range(per_thread):
+            instance.hit(policy, keys[(offset + i) % clients])
+    
+    workers = [threading.Thread(target=run, args=(i * 7,)) for i in range(threads)]
+    with timer() as timing:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    return per_thread * threads / timing['elapsed']
+
+
+def worker_hits(storage_url, hits, start):
+    """Process body: `hits` checks of one client against the shared policy; returns how many were admitted"""
+    instance = limiter(storage_url, SHARED_RATE, shared=True)
+    start.wait()
+    return sum(not instance.hit(instance.policies['bench'], 'ip:203.0.113.7') for _ in range(hits))
+
+
+def admitted_across_workers(storage_url, workers, hits):
+    context = multiprocessing.get_context('spawn')
+    with context.Manager() as manager:
+        start = manager.Barrier(workers)
+        with context.Pool(workers) as pool:
+            return sum(pool.starmap(worker_hits, [(storage_url, hits, start)] * workers))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--checks', type=int, default=100000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args(argv)
+    
+    failures = []
+    
+    def check(name, ok):
+        print(f'  {"ok" if ok else "FAILED"}: {name}')
+        if not ok:
+            failures.append(name)
+    
+    directory = tempfile.mkdtemp()
+    print(f'rate limit checks/s ({args.checks:,} checks over 1000 clients)')
+    print(f'{"backend":28} {"1 thread":>10} {f"{args.threads} threads":>11}')
+    backends = [
+        ('per-worker token bucket', '', args.checks),
+        ('shared: memory://', 'memory://', args.checks),
+        ('shared: sqlite file', f'sqlite:///{os.path.join(directory, "bench.db")}', args.checks // 10),
+    ]
+    rates = {}
+    for label, url, checks in backends:
+        rates[label] = (
+            check_rate(limiter(url, shared=bool(url)), checks),
+            check_rate(limiter(url, shared=bool(url)), checks, args.threads),
+        )
+        print(f'{label:28} {rates[label][0]:>10,.0f} {rates[label][1]:>11,.0f}')
+    check('a per-worker check costs under 20µs', rates['per-worker token bucket'][0] > 50000)
+    
+    bucket = limiter(rate='100/second')
+    bucket.policies['bench'].burst = 10
+    admitted = [0]
+    
+    def hammer():
+        for _ in range(2000):
+            admitted[0] += not bucket.hit(bucket.policies['bench'], 'ip:198.51.100.1')
+    
+    threads = [threading.Thread(target=hammer) for _ in range(args.threads)]
+    with timer() as timing:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    allowed = 10 + 100 * timing['elapsed']
+    print(f'one client from {args.threads} threads: {admitted[0]} admitted, {allowed:.0f} allowed by 100/s burst 10')
+    check('the lock-free bucket over-admits by at most one per thread', admitted[0] <= allowed + args.threads)
+    
+    print('policies through the app:')
+    app = make_app(RateLimitConfig)
+    with app.app_context():
+        seed_catalog(10)
+        users = [User(email=f'payer{i}@example.com', password_hash='-', full_name=f'Payer {i}', phone_number='254712345678')
+                 for i in range(2)]
+        db.session.add_all(users)
+        db.session.commit()
+        tokens = [create_access_token(identity=user.id) for user in users]
+    client = app.test_client()
+    
+    statuses = [client.get('/api/products', headers={'X-Forwarded-For': '198.51.100.2'}) for _ in range(25)]
+    codes = [response.status_code for response in statuses]
+    check('/api/products admits its burst of 20, then 429', codes[:20] == [200] * 20 and codes[20:] == [429] * 5)
+    check('429 carries Retry-After', all(response.headers.get('Retry-After') == '1' for response in statuses[20:]))
+    time.sleep(0.25)
+    check('the bucket refills at the policy rate',
+          [client.get('/api/products', headers={'X-Forwarded-For': '198.51.100.2'}).status_code for _ in range(3)] == [200, 200, 429])
+    check('another IP has its own bucket', client.get('/api/products', headers={'X-Forwarded-For': '198.51.100.3'}).status_code == 200)
+    
+    def login(ip, spoofed='192.0.2.1'):
+        # the proxy appends the address it saw; anything before it came from the client
+        return client.post('/api/auth/login', json={'email': 'nobody@example.com', 'password': 'x'},
+                           headers={'X-Forwarded-For': f'{spoofed}, {ip}'}).status_code
+    
+    codes = [login('203.0.113.9', spoofed=f'192.0.2.{i}') for i in range(6)]
+    check('login attempts are limited per client IP, whatever X-Forwarded-For it sends',
+          codes == [401] * 5 + [429] and login('203.0.113.10') == 401)
+    
+    def initiate(token):
+        return client.post('/api/payments/mpesa/initiate', json={'order_id': 999},
+                           headers={'Authorization': f'Bearer {token}', 'X-Forwarded-For': '198.51.100.4'}).status_code
+    
+    codes = [initiate(tokens[0]) for _ in range(4)]
+    check('STK pushes are limited per signed-in user on a shared IP',
+          codes == [404] * 3 + [429] and initiate(tokens[1]) == 404)
+    
+    stats = client.get('/api/health/ratelimit').get_json()['ratelimit']
+    rejected = {name: policy['rejected'] for name, policy in stats['policies'].items()}
+    print(f'  rejections: {rejected}')
+    check('/api/health/ratelimit counts every 429', rejected == {'auth.login': 1, 'payments.initiate_mpesa_payment': 1, 'products': 6})
+    
+    rate_limiter.shared = limiter(f'sqlite:///{os.path.join(directory, "broken.db")}').shared
+    rate_limiter.shared._conn.close()
+    app.logger.disabled = True  # one warning per request
+    codes = [login('203.0.113.11') for _ in range(6)]
+    stats = rate_limiter.stats()
+    check('a failing store falls back to the per-worker bucket', codes == [401] * 5 + [429] and stats['store_errors'] == 6)
+    
+    print(f'{SHARED_RATE} for one client from {args.workers} worker processes ({args.workers * 100} requests):')
+    per_worker = admitted_across_workers('', args.workers, 100)
+    shared = admitted_across_workers(f'sqlite:///{os.path.join(directory, "shared.db")}', args.workers, 100)
+    print(f'  admitted: {per_worker} per-worker, {shared} with a shared SQLite store')
+    check('a shared store holds the limit across workers', shared == 50)
+    check('without one each worker admits the limit', per_worker == 50 * args.workers)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
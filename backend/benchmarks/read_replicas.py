@@ -0,0 +1,165 @@
+"""
+Read-replica routing with two SQLite files
+
+A primary and a replica file stand in for PostgreSQL streaming replication:
+`replicate()` copies the primary into the replica with the SQLite backup API,
+so between copies the replica is behind exactly like a lagging standby.
+Checks that read-only endpoints read from the replica, that reads right
+after a cart change, a checkout or a catalog write stay on the primary until
+the replica has caught up, and that a lagging or unreachable replica falls
+back to the primary, each counted under its reason. Statements are counted
+per database; the expected unreachable-replica warnings are captured, not
+printed.
+
+    python -m benchmarks.read_replicas
+"""
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from flask.logging import default_handler
+from sqlalchemy import event
+from models import db, Product
+from services.replicas import beat, replica_router
+from benchmarks.common import BenchmarkConfig, make_app, seed_catalog
+from benchmarks.stock_race import CHECKOUT, seed
+
+
+def main(argv=None):
+    directory = tempfile.mkdtemp()
+    primary_path = os.path.join(directory, 'primary.db')
+    replica_path = os.path.join(directory, 'replica.db')
+    
+    class ReplicaConfig(BenchmarkConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{primary_path}'
+        SQLALCHEMY_BINDS = {'replica_0': f'sqlite:///{replica_path}'}
+        CATALOG_CACHE_ENABLED = False
+        REPLICA_CHECK_INTERVAL = 0
+        REPLICA_RETRY_AFTER = 0
+    
+    app = make_app(ReplicaConfig)
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    app.logger.addHandler(handler)
+    app.logger.removeHandler(default_handler)
+    with app.app_context():
+        seed_catalog(50)
+        product_id, tokens = seed(buyers=2, stock=10)
+        beat()
+        engines = {'primary': db.engines[None], 'replica': db.engines['replica_0']}
+    
+    def replicate():
+        with sqlite3.connect(primary_path) as source, sqlite3.connect(replica_path) as target:
+            source.backup(target)
+    
+    statements = {'primary': 0, 'replica': 0}
+    for name, engine in engines.items():
+        def count(conn, cursor, statement, *args, name=name):
+            if 'replica_heartbeat' not in statement:  # position probes
+                statements[name] += 1
+        event.listen(engine, 'before_cursor_execute', count)
+    
+    client = app.test_client()
+    buyer, other = ({'Authorization': f'Bearer {token}'} for token in tokens)
+    
+    def get(path, headers=None):
+        """GET `path`; returns (json, primary statements, replica statements)"""
+        before = dict(statements)
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200, (path, response.status_code, response.get_data(as_text=True))
+        return response.get_json(), statements['primary'] - before['primary'], statements['replica'] - before['replica']
+    
+    failures = []
+    
+    def check(name, ok):
+        print(f'  {"ok" if ok else "FAILED"}: {name}')
+        if not ok:
+            failures.append(name)
+    
+    def fallbacks_since(before):
+        return {reason: count - before[reason] for reason, count in replica_router.fallbacks.items()}
+    
+    def unreachable_warnings():
+        return sum(record.getMessage().endswith('unreachable; using the primary') and record.exc_info is not None
+                   for record in records)
+    
+    # The replica file is still empty: no heartbeat table, so it counts as down
+    before = dict(replica_router.fallbacks)
+    get('/api/products/search?q=warmup')  # the search backend inspects the primary's schema once
+    check('an empty replica falls back as down, with a logged warning',
+          fallbacks_since(before)['down'] > 0 and unreachable_warnings() > 0)
+    replicate()
+    print('replica in sync:')
+    for path in ('/api/products?limit=20', '/api/products/1', '/api/categories', '/api/products/search?q=sneakers'):
+        _, on_primary, on_replica = get(path)
+        check(f'{path} read from the replica ({on_replica} statements)', on_primary == 0 and on_replica > 0)
+    _, on_primary, on_replica = get('/api/orders', other)
+    check('order history read from the replica', on_primary == 0 and on_replica > 0)
+    
+    print('catalog write not yet replicated:')
+    with app.app_context():
+        db.session.get(Product, 1).price = 4321
+        db.session.commit()
+    before = dict(replica_router.fallbacks)
+    body, on_primary, on_replica = get('/api/products/1')
+    check('product read from the primary, with the new price', on_replica == 0 and body['product']['price'] == 4321)
+    check('counted as behind', fallbacks_since(before) == {'down': 0, 'lagging': 0, 'behind': 1})
+    _, on_primary, on_replica = get('/api/orders', other)
+    check("other scopes still read from the replica", on_primary == 0 and on_replica > 0)
+    
+    print('cart change and checkout not yet replicated:')
+    response = client.post('/api/cart/add', json={'product_id': 2, 'quantity': 1}, headers=buyer)
+    check('item added to the cart', response.status_code in (200, 201))
+    body, on_primary, on_replica = get('/api/cart', buyer)
+    check('cart read from the primary shows the new item',
+          on_replica == 0 and any(item['product']['id'] == 2 for item in body['cart']['items']))
+    response = client.post('/api/orders', json=CHECKOUT, headers=buyer)
+    check('order created', response.status_code == 201)
+    order_id = response.get_json()['order']['id']
+    body, on_primary, on_replica = get('/api/orders', buyer)
+    check('order history read from the primary includes the order',
+          on_replica == 0 and any(order['id'] == order_id for order in body['orders']))
+    _, on_primary, on_replica = get(f'/api/orders/{order_id}', buyer)
+    check('order detail read from the primary', on_replica == 0 and on_primary > 0)
+    
+    print('replica caught up:')
+    with app.app_context():
+        beat()
+    replicate()
+    body, on_primary, on_replica = get('/api/orders', buyer)
+    check('order history back on the replica, order included',
+          on_primary == 0 and any(order['id'] == order_id for order in body['orders']))
+    body, on_primary, on_replica = get('/api/products/1')
+    check('product back on the replica, new price included', on_primary == 0 and body['product']['price'] == 4321)
+    
+    print('replica lagging:')
+    with app.app_context():
+        beat(now=datetime.utcnow() - timedelta(seconds=60))
+    replicate()
+    before = dict(replica_router.fallbacks)
+    _, on_primary, on_replica = get('/api/products?limit=20')
+    check('reads fall back to the primary', on_replica == 0 and on_primary > 0)
+    check('counted as lagging', fallbacks_since(before) == {'down': 0, 'lagging': 1, 'behind': 0})
+    
+    print('replica unreachable:')
+    engines['replica'].dispose()
+    os.remove(replica_path)
+    os.mkdir(replica_path)  # a directory cannot be opened as a database
+    before, warned = dict(replica_router.fallbacks), unreachable_warnings()
+    _, on_primary, on_replica = get('/api/categories')
+    check('reads fall back to the primary', on_replica == 0 and on_primary > 0)
+    check('counted as down, with a logged warning',
+          fallbacks_since(before)['down'] > 0 and fallbacks_since(before)['lagging'] == 0 and unreachable_warnings() > warned)
+    
+    with app.app_context():
+        stats = replica_router.stats()
+    print(f'routed {stats["routed"]}, fallbacks {stats["fallbacks"]}, warnings logged {unreachable_warnings()}')
+    check('every fallback reason seen', all(stats['fallbacks'].values()))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Product search latency
+
+Seeds a synthetic catalog, builds each available search backend and replays
+a mix of type-ahead and multi-word queries, reporting p50/p95/p99 latency
+against the target (20 ms p95 by default).
+
+    python -m benchmarks.search [--products 100000] [--queries 1000] [--target-ms 20]
+"""
+import argparse
+import random
+import sys
+import time
+from models import db, Product
+from services.search import InvertedIndex, SQLiteSearchBackend, ensure_search_schema
+from benchmarks.common import make_app, seed_catalog, timer, ADJECTIVES, COLORS, NOUNS, DETAILS
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def build_queries(count, seed=7):
+    """Type-ahead prefixes, whole words and two-word queries"""
+    rng = random.Random(seed)
+    words = ADJECTIVES + COLORS + NOUNS + [word for detail in DETAILS for word in detail.split() if len(word) > 2]
+    queries = []
+    for _ in range(count):
+        kind = rng.random()
+        word = rng.choice(words)
+        if kind < 0.4:
+            queries.append(word[:rng.randint(2, max(2, len(word) - 1))])
+        elif kind < 0.7:
+            queries.append(word + ' ')
+        else:
+            other = rng.choice(words)
+            queries.append(f'{word} {other[:rng.randint(2, len(other))]}')
+    return queries
+
+
+def measure(search, queries, limit):
+    samples = []
+    for q in queries:
+        start = time.perf_counter()
+        search(q, limit)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--target-ms', type=float, default=20.0)
+    args = parser.parse_args()
+    
+    app = make_app()
+    queries = build_queries(args.queries)
+    results = {}
+    
+    with app.app_context():
+        with timer() as seeded:
+            seed_catalog(args.products)
+        print(f"seeded {args.products} products in {seeded['elapsed']:.1f}s")
+        
+        with timer() as built:
+            index = InvertedIndex()
+            rows = db.session.query(
+                Product.id, Product.name, Product.description, Product.is_featured, Product.category_id
+            ).yield_per(5000)
+            for row in rows:
+                index.add(*row)
+            index.finalize()
+        print(f"memory index built in {built['elapsed']:.1f}s ({len(index.vocabulary)} terms)")
+        results['memory'] = measure(index.search, queries, args.limit)
+        
+        if db.engine.dialect.name == 'sqlite':
+            with timer() as built:
+                ensure_search_schema(db.engine)
+            print(f"fts5 index built in {built['elapsed']:.1f}s")
+            backend = SQLiteSearchBackend()
+            results['sqlite-fts5'] = measure(backend.search, queries, args.limit)
+    
+    failed = False
+    print(f"\n{'backend':14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, samples in results.items():
+        p95 = percentile(samples, 95)
+        print(f'{name:14}{percentile(samples, 50):>10.2f}{p95:>10.2f}{percentile(samples, 99):>10.2f}{max(samples):>10.2f}')
+        if p95 > args.target_ms:
+            failed = True
+            print(f'  !! p95 above {args.target_ms} ms target')
+    
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+App start-up time and boot-time database I/O
+
+Starts fresh interpreters the way a gunicorn worker, the job worker and the
+old boot path (create_app() followed by db.create_all()) would, and reports
+the median over `--runs` of: `import app`, create_app(), statements and
+connections made while booting, and the first request. Every statement is
+delayed by `--query-delay-ms` (default 5 ms) to stand in for the round trip
+to a managed PostgreSQL, where reflecting the schema on each boot costs the
+most.
+
+    python -m benchmarks.startup [--runs 5] [--query-delay-ms 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from benchmarks.common import BenchmarkConfig, make_app, seed_catalog
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; prints one JSON line of timings
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+import app as application
+imported = time.perf_counter()
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+counts = {'statements': 0, 'connections': 0}
+delay = float(sys.argv[2]) / 1000
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_statement(*args):
+    counts['statements'] += 1
+    time.sleep(delay)
+
+@event.listens_for(Pool, 'connect')
+def count_connection(*args):
+    counts['connections'] += 1
+
+mode = sys.argv[1]
+app = application.create_app(blueprints=() if mode == 'worker' else application.BLUEPRINTS)
+if mode == 'create_all':
+    with app.app_context():
+        application.db.create_all()
+booted = time.perf_counter()
+boot = dict(counts)
+
+first_request = None
+if mode != 'worker':
+    response = app.test_client().get('/api/products/1')
+    assert response.status_code == 200, response.status_code
+    first_request = (time.perf_counter() - booted) * 1000
+
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (booted - imported) * 1000,
+    'boot_statements': boot['statements'],
+    'boot_connections': boot['connections'],
+    'first_request_ms': first_request,
+    'routes_imported': sorted(name for name in sys.modules if name.startswith('routes.')),
+}))
+'''
+
+MODES = (
+    ('web', 'gunicorn worker: create_app()'),
+    ('worker', 'job worker: create_app(blueprints=())'),
+    ('create_all', 'old boot: create_app() + db.create_all()'),
+)
+
+
+def run_child(mode, database_uri, delay_ms):
+    env = {**os.environ, 'DATABASE_URI': database_uri, 'CATALOG_CACHE_ENABLED': 'false'}
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD, mode, str(delay_ms)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--query-delay-ms', type=float, default=5)
+    args = parser.parse_args(argv)
+    
+    database_uri = os.getenv('BENCH_DATABASE_URI')
+    if not database_uri or database_uri == 'sqlite://':
+        database_uri = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'startup.db')
+    
+    class SeedConfig(BenchmarkConfig):
+        SQLALCHEMY_DATABASE_URI = database_uri
+    
+    app = make_app(SeedConfig)
+    with app.app_context():
+        seed_catalog(100)
+    
+    print(f'median of {args.runs} fresh interpreters, {args.query_delay_ms:g}ms per statement')
+    print(f'{"boot":44} {"import":>8} {"create":>8} {"stmts":>6} {"conns":>6} {"1st req":>8}')
+    results = {}
+    for mode, label in MODES:
+        runs = [run_child(mode, database_uri, args.query_delay_ms) for _ in range(args.runs)]
+        median = {key: statistics.median(run[key] for run in runs)
+                  for key in ('import_ms', 'create_app_ms', 'boot_statements', 'boot_connections')}
+        first = [run['first_request_ms'] for run in runs if run['first_request_ms'] is not None]
+        median['first_request_ms'] = statistics.median(first) if first else None
+        median['routes_imported'] = runs[0]['routes_imported']
+        results[mode] = median
+        first_request = f'{median["first_request_ms"]:>8.1f}' if first else f'{"-":>8}'
+        print(f'{label:44} {median["import_ms"]:>8.1f} {median["create_app_ms"]:>8.1f} '
+              f'{median["boot_statements"]:>6.0f} {median["boot_connections"]:>6.0f} {first_request}')
+    
+    failures = []
+    
+    def check(name, ok):
+        print(f'  {"ok" if ok else "FAILED"}: {name}')
+        if not ok:
+            failures.append(name)
+    
+    web, worker, old = results['web'], results['worker'], results['create_all']
+    check('create_app() runs no SQL and opens no connection', web['boot_statements'] == 0 and web['boot_connections'] == 0)
+    check('the job worker boots without importing any blueprint', worker['routes_imported'] == [] and worker['boot_statements'] == 0)
+    check('the old boot path reflected the schema', old['boot_statements'] > 0)
+    check('booting without create_all is faster',
+          web['create_app_ms'] < old['create_app_ms'])
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Concurrent checkout race on a single SKU
+
+Gives every buyer a cart holding the same product, then fires all checkouts
+at once from a thread pool through POST /api/orders. Exactly `stock` orders
+must succeed, the rest must get 409, stock must end at zero (never negative),
+and releasing the expired holds must restore it. A cart line with a quantity
+below 1 must be refused, not turned into stock.
+
+Uses a file-backed SQLite database by default (an in-memory one would share a
+single connection between threads); set BENCH_DATABASE_URI to race on PostgreSQL.
+
+    python -m benchmarks.stock_race [--buyers 64] [--stock 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask_jwt_extended import create_access_token
+from models import db, Cart, CartItem, Category, Order, Product, StockReservation, User
+from services.inventory import release_expired
+from benchmarks.common import BenchmarkConfig, make_app, timer
+
+CHECKOUT = {
+    'phone_number': '254700000000',
+    'full_name': 'Race Buyer',
+    'county': 'Nairobi',
+    'town': 'Nairobi',
+    'address': 'Moi Avenue',
+    'delivery_fee': 0,
+}
+
+
+def seed(buyers, stock):
+    """One product with `stock` units and `buyers` users each holding one in their cart"""
+    category = Category(name='Flash Sale', slug='flash-sale')
+    product = Product(name='Flash Sale Sneakers', price=2500, category=category, stock=stock,
+                      image_url='https://example.com/products/flash.jpg')
+    db.session.add(product)
+    db.session.flush()
+    
+    tokens = []
+    for i in range(buyers):
+        user = User(email=f'buyer{i}@example.com', password_hash='-', full_name=f'Buyer {i}',
+                    phone_number=CHECKOUT['phone_number'])
+        user.carts.append(Cart(items=[CartItem(product_id=product.id, quantity=1)]))
+        db.session.add(user)
+        db.session.flush()
+        tokens.append(create_access_token(identity=user.id))
+    db.session.commit()
+    return product.id, tokens
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--buyers', type=int, default=64)
+    parser.add_argument('--stock', type=int, default=20)
+    args = parser.parse_args(argv)
+    
+    database_uri = os.getenv('BENCH_DATABASE_URI')
+    if not database_uri or database_uri == 'sqlite://':
+        database_uri = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'stock_race.db')
+    
+    class RaceConfig(BenchmarkConfig):
+        SQLALCHEMY_DATABASE_URI = database_uri
+        STOCK_SWEEP_INTERVAL = 3600
+    
+    app = make_app(RaceConfig)
+    with app.app_context():
+        product_id, tokens = seed(args.buyers, args.stock)
+    
+    start = threading.Barrier(args.buyers)
+    
+    def checkout(token):
+        client = app.test_client()
+        start.wait()
+        response = client.post('/api/orders', json=CHECKOUT, headers={'Authorization': f'Bearer {token}'})
+        return response.status_code
+    
+    with ThreadPoolExecutor(max_workers=args.buyers) as pool, timer() as elapsed:
+        statuses = list(pool.map(checkout, tokens))
+    
+    with app.app_context():
+        remaining = db.session.get(Product, product_id).stock
+        held = StockReservation.query.filter_by(status='held').count()
+        orders = Order.query.count()
+        released = release_expired(now=datetime.utcnow() + timedelta(days=1))
+        restored = db.session.get(Product, product_id).stock
+    
+    created = statuses.count(201)
+    rejected = statuses.count(409)
+    print(f'{args.buyers} buyers racing for {args.stock} units on {database_uri.split(":")[0]} '
+          f'in {elapsed["elapsed"] * 1000:.0f}ms')
+    print(f'  orders created {created}, sold out {rejected}, other {len(statuses) - created - rejected}')
+    print(f'  stock left {remaining}, held reservations {held}, orders {orders}')
+    print(f'  after expiry: released {released}, stock {restored}')
+    
+    expected = min(args.stock, args.buyers)
+    ok = (
+        created == expected and rejected == args.buyers - expected
+        and remaining == args.stock - expected and held == expected and orders == expected
+        and released == expected and restored == args.stock
+    )
+    print('OK' if ok else 'FAILED: stock oversold or lost')
+    
+    # A negative line would pass the stock >= quantity guard and add units
+    client = app.test_client()
+    with app.app_context():
+        user = User(email='negative@example.com', password_hash='-', full_name='Negative Buyer',
+                    phone_number=CHECKOUT['phone_number'])
+        user.carts.append(Cart(items=[CartItem(product_id=product_id, quantity=-5)]))
+        db.session.add(user)
+        db.session.commit()
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+    added = client.post('/api/cart/add', json={'product_id': product_id, 'quantity': -5}, headers=headers).status_code
+    ordered = client.post('/api/orders', json=CHECKOUT, headers=headers).status_code
+    with app.app_context():
+        unchanged = db.session.get(Product, product_id).stock == restored and Order.query.count() == orders
+    refused = added == 400 and ordered == 400 and unchanged
+    print('OK' if refused else f'FAILED: non-positive quantity accepted (add {added}, checkout {ordered})')
+    return 0 if ok and refused else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
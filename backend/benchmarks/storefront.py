@@ -0,0 +1,160 @@
+"""
+Storefront purchase flow under load: browse, product, cart, checkout, pay, callback
+
+Seeds `--products` products, `--users` users and `--orders` past orders
+(file-backed SQLite by default; set BENCH_DATABASE_URI for PostgreSQL), then
+`--shoppers` threads, each signed in as its own user, run the whole purchase
+`--flows` times against create_app() through the Flask test client: list a
+catalog page, open a product, add it to the cart, check out, start the M-Pesa
+payment (placeholder STK push, sent in the request with JOBS_EAGER) and
+deliver its success callback. Reports purchases/s, requests/s and p50/p95/p99
+per step; every step must succeed and every order must end up paid.
+--json writes the results for benchmarks.compare.
+
+    python -m benchmarks.storefront [--products 1000] [--users 1000] [--orders 5000] [--shoppers 8] [--flows 25] [--json PATH]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask_jwt_extended import create_access_token
+from models import db, Order, Payment, Product
+from benchmarks.checkout import CHECKOUT
+from benchmarks.common import BenchmarkConfig, CALLBACK_URL, make_app, seed_catalog, seed_customers, timer, write_results
+from benchmarks.fake_daraja import callback_payload
+from benchmarks.search import percentile
+
+STEPS = ['browse', 'product', 'add to cart', 'checkout', 'pay', 'callback']
+SORTS = ['newest', 'price_asc', 'price_desc']
+
+
+def shopper(app, token, categories, flows, seed):
+    """Run `flows` purchases as one user; returns ({step: [ms]}, [order ids], [failures])"""
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    rng = random.Random(seed)
+    latencies = {step: [] for step in STEPS}
+    order_ids, failures = [], []
+    
+    def step(name, method, path, expected, body=None, **kwargs):
+        with timer() as timing:
+            response = client.open(path, method=method, json=body, **kwargs)
+        latencies[name].append(timing['elapsed'] * 1000)
+        if response.status_code != expected:
+            failures.append(f'{name}: {method} {path} -> {response.status_code} {response.get_data(as_text=True)[:200]}')
+            return None
+        return response.get_json()
+    
+    for _ in range(flows):
+        category = f'&category_id={rng.randint(1, categories)}' if rng.random() < 0.5 else ''
+        page = step('browse', 'GET', f'/api/products?limit=20&sort={rng.choice(SORTS)}{category}', 200)
+        if not page or not page['products']:
+            continue
+        product_id = rng.choice(page['products'])['id']
+        if step('product', 'GET', f'/api/products/{product_id}', 200) is None:
+            continue
+        if step('add to cart', 'POST', '/api/cart/add', 200, {'product_id': product_id, 'quantity': rng.randint(1, 3)},
+                headers=headers) is None:
+            continue
+        created = step('checkout', 'POST', '/api/orders', 201, CHECKOUT, headers=headers)
+        if created is None:
+            continue
+        order_id = created['order']['id']
+        initiated = step('pay', 'POST', '/api/payments/mpesa/initiate', 202, {'order_id': order_id}, headers=headers)
+        if initiated is None:
+            continue
+        payment = initiated['payment']
+        with app.app_context():
+            # Daraja's request ids are not in the API responses
+            sent = db.session.get(Payment, payment['id'])
+            push = {**payment, 'checkout_request_id': sent.checkout_request_id, 'merchant_request_id': sent.merchant_request_id}
+        if step('callback', 'POST', CALLBACK_URL, 200, callback_payload(push)) is not None:
+            order_ids.append(order_id)
+    return latencies, order_ids, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=5000, help='past orders seeded across the users')
+    parser.add_argument('--shoppers', type=int, default=8, help='concurrent shoppers (threads)')
+    parser.add_argument('--flows', type=int, default=25, help='purchases per shopper')
+    parser.add_argument('--json', metavar='PATH', help='write the results as JSON')
+    args = parser.parse_args(argv)
+    
+    database_uri = os.getenv('BENCH_DATABASE_URI')
+    if not database_uri or database_uri == 'sqlite://':
+        database_uri = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'storefront.db')
+    
+    class StorefrontConfig(BenchmarkConfig):
+        SQLALCHEMY_DATABASE_URI = database_uri
+        JOBS_EAGER = True
+        MPESA_ENABLED = False
+        STOCK_SWEEP_INTERVAL = 3600
+        SLOW_QUERY_MS = SLOW_REQUEST_MS = 10000  # SQLite writers queue on one lock; the percentiles show it
+    
+    app = make_app(StorefrontConfig)
+    with timer() as seeding, app.app_context():
+        categories = seed_catalog(args.products)
+        db.session.execute(Product.__table__.update().values(stock=1_000_000))
+        user_ids = seed_customers(max(args.users, args.shoppers), args.orders, args.products)
+        tokens = [create_access_token(identity=user_id) for user_id in user_ids[:args.shoppers]]
+        database = db.engine.dialect.name
+    print(f'seeded {args.products:,} products, {len(user_ids):,} users, {args.orders:,} orders '
+          f'on {database} in {seeding["elapsed"]:.1f}s')
+    
+    # One warm-up purchase, so first-request setup is not in the numbers
+    shopper(app, tokens[0], len(categories), 1, seed=-1)
+    
+    start = threading.Barrier(args.shoppers)
+    
+    def run(index):
+        start.wait()
+        return shopper(app, tokens[index], len(categories), args.flows, seed=index)
+    
+    with ThreadPoolExecutor(max_workers=args.shoppers) as pool, timer() as elapsed:
+        outcomes = list(pool.map(run, range(args.shoppers)))
+    
+    latencies = {step: [ms for outcome in outcomes for ms in outcome[0][step]] for step in STEPS}
+    order_ids = [order_id for outcome in outcomes for order_id in outcome[1]]
+    failures = [failure for outcome in outcomes for failure in outcome[2]]
+    requests = sum(len(samples) for samples in latencies.values())
+    with app.app_context():
+        paid = Order.query.filter(Order.id.in_(order_ids), Order.payment_status == 'completed').count() if order_ids else 0
+    
+    seconds = elapsed['elapsed']
+    print(f'{args.shoppers} shoppers x {args.flows} purchases in {seconds:.1f}s: '
+          f'{len(order_ids) / seconds:.1f} purchases/s, {requests / seconds:.0f} requests/s')
+    print(f'{"step":12} {"requests":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>8}')
+    results = {
+        'purchases_per_second': {'value': round(len(order_ids) / seconds, 2), 'unit': 'purchases/s', 'better': 'higher'},
+        'requests_per_second': {'value': round(requests / seconds, 1), 'unit': 'req/s', 'better': 'higher'},
+    }
+    for step in STEPS:
+        samples = latencies[step]
+        if not samples:
+            continue
+        p50, p95, p99 = (percentile(samples, pct) for pct in (50, 95, 99))
+        print(f'{step:12} {len(samples):>8} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f} {max(samples):>8.1f}')
+        key = step.replace(' ', '_')
+        for pct, value in (('p50', p50), ('p95', p95), ('p99', p99)):
+            results[f'{key}_{pct}_ms'] = {'value': round(value, 3), 'unit': 'ms', 'better': 'lower'}
+    
+    for failure in failures[:10]:
+        print(f'  {failure}')
+    ok = not failures and len(order_ids) == args.shoppers * args.flows and paid == len(order_ids)
+    print(f'  {"ok" if ok else "FAILED"}: every step succeeded and all {args.shoppers * args.flows} orders were paid '
+          f'({len(failures)} failures, {paid} paid)')
+    
+    if args.json:
+        parameters = {key: getattr(args, key) for key in ('products', 'users', 'orders', 'shoppers', 'flows')}
+        write_results(args.json, 'storefront', database, parameters, results)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
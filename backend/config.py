@@ -13,17 +13,178 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URI', 'sqlite:///ecommerce.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Connection pool (see services/db_pool.py). Sizes default to what the gunicorn
+    # profile can run concurrently; DB_MAX_CONNECTIONS caps the total across workers.
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 0)) or None
+    DB_POOL_SIZE_MAX = int(os.getenv('DB_POOL_SIZE_MAX', 10))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW')) if os.getenv('DB_MAX_OVERFLOW') else None
+    DB_MAX_CONNECTIONS = int(os.getenv('DB_MAX_CONNECTIONS', 0)) or None
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 10))  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', 5))
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 15000))
+    DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', 'false').lower() == 'true'  # transaction-pooling PgBouncer in front
+    
+    # Read replicas (comma-separated URIs) serve the endpoints below, by scope:
+    # 'catalog' reads, or 'user' reads of the signed-in user's cart and orders.
+    # A replica is skipped while it is down, more than REPLICA_MAX_LAG seconds
+    # behind, or has not yet replayed the scope's last write (see services/replicas.py)
+    DATABASE_REPLICA_URIS = [uri.strip() for uri in os.getenv('DATABASE_REPLICA_URIS', '').split(',') if uri.strip()]
+    SQLALCHEMY_BINDS = {f'replica_{i}': uri for i, uri in enumerate(DATABASE_REPLICA_URIS)}
+    READ_REPLICA_ENDPOINTS = {
+        'products.get_products': 'catalog',
+        'products.search_products': 'catalog',
+        'products.get_product': 'catalog',
+        'products.get_featured_products': 'catalog',
+        'products.get_products_by_category': 'catalog',
+        'categories.get_categories': 'catalog',
+        'orders.get_orders': 'user',
+        'orders.get_order': 'user',
+        'cart.get_cart': 'user',
+    }
+    REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', 5))
+    REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', 0.5))  # per-worker cache of replica positions
+    REPLICA_RETRY_AFTER = float(os.getenv('REPLICA_RETRY_AFTER', 5))  # after a replica is unreachable
+    REPLICA_HEARTBEAT_INTERVAL = float(os.getenv('REPLICA_HEARTBEAT_INTERVAL', 1))  # stamped by worker.py
+    REPLICA_WATERMARK_URL = os.getenv('REPLICA_WATERMARK_URL', os.getenv('CATALOG_CACHE_SHARED_URL', ''))
+    
     # JWT
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'dev-jwt-secret')
     JWT_ACCESS_TOKEN_EXPIRES = 86400  # 24 hours
     
-    # M-Pesa Configuration (Placeholder)
+    # Per-worker cache of signed-in users' claims (profile fields); a user's
+    # own writes drop it immediately, other workers within the TTL
+    IDENTITY_CACHE_ENABLED = os.getenv('IDENTITY_CACHE_ENABLED', 'true').lower() == 'true'
+    IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', 10000))
+    IDENTITY_CACHE_TTL = int(os.getenv('IDENTITY_CACHE_TTL', 30))
+    
+    # Password hashing: Werkzeug method string (scrypt:n:r:p or pbkdf2:hash:iterations);
+    # older hashes are upgraded on login. The KDF runs in a per-worker pool of
+    # PASSWORD_HASH_PROCESSES lower-priority processes (0 = on the request thread)
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_PROCESSES = int(os.getenv('PASSWORD_HASH_PROCESSES', 1))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 16))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+    PASSWORD_HASH_NICE = int(os.getenv('PASSWORD_HASH_NICE', 5))
+    
+    # Catalog loading: how Product.category is loaded per endpoint
+    # ('joined' for single-row/featured reads, 'selectin' for large listings)
+    CATALOG_DEFAULT_LOADER = os.getenv('CATALOG_DEFAULT_LOADER', 'joined')
+    CATALOG_LOADER_STRATEGIES = {
+        'products.get_products': 'selectin',
+        'products.get_product': 'joined',
+        'products.get_featured_products': 'joined',
+        'products.get_products_by_category': 'selectin',
+        'products.search_products': 'selectin',
+    }
+    
+    # Product listing pagination
+    PRODUCTS_PAGE_SIZE = int(os.getenv('PRODUCTS_PAGE_SIZE', 24))
+    PRODUCTS_MAX_PAGE_SIZE = int(os.getenv('PRODUCTS_MAX_PAGE_SIZE', 100))
+    PRICE_FACET_BUCKETS = [0, 1000, 2500, 5000, 10000]  # lower edges, KSh
+    
+    # Product search: 'auto' uses FTS5 (SQLite) / tsvector (PostgreSQL) when
+    # migrate.py has created the index, otherwise an in-memory inverted index
+    SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'auto')
+    SEARCH_FEATURED_BOOST = float(os.getenv('SEARCH_FEATURED_BOOST', 1.25))
+    SEARCH_RANK_WINDOW = int(os.getenv('SEARCH_RANK_WINDOW', 2000))  # newest matches ranked per query
+    
+    # Catalog cache: per-worker LRU plus an optional shared tier
+    # (CATALOG_CACHE_SHARED_URL: memory://, sqlite:///path or redis://host:6379/0)
+    CATALOG_CACHE_ENABLED = os.getenv('CATALOG_CACHE_ENABLED', 'true').lower() == 'true'
+    CATALOG_CACHE_SIZE = int(os.getenv('CATALOG_CACHE_SIZE', 512))
+    CATALOG_CACHE_TTL = int(os.getenv('CATALOG_CACHE_TTL', 60))
+    CATALOG_CACHE_VERSION_TTL = float(os.getenv('CATALOG_CACHE_VERSION_TTL', 1.0))
+    CATALOG_CACHE_SHARED_URL = os.getenv('CATALOG_CACHE_SHARED_URL', '')
+    CATALOG_FRAGMENT_CACHE_SIZE = int(os.getenv('CATALOG_FRAGMENT_CACHE_SIZE', 10000))
+    
+    # HTTP Cache-Control per blueprint for GET responses (paired with ETag validators)
+    CACHE_CONTROL_POLICIES = {
+        'products': 'public, max-age=60, stale-while-revalidate=300',
+        'categories': 'public, max-age=300, stale-while-revalidate=3600',
+        'orders': 'private, no-cache',
+    }
+    
+    # Request instrumentation (services/instrumentation.py): slow query/request logs,
+    # per-route Prometheus metrics at /api/metrics and, when enabled, Server-Timing
+    # headers (per worker). /api/metrics and /api/health/slow-queries require
+    # METRICS_TOKEN as a Bearer token and answer 403 without one outside debug
+    INSTRUMENTATION_ENABLED = os.getenv('INSTRUMENTATION_ENABLED', 'true').lower() == 'true'
+    SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'false').lower() == 'true'
+    SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 100))
+    SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', 1000))
+    SLOW_QUERY_STATEMENTS = int(os.getenv('SLOW_QUERY_STATEMENTS', 200))  # distinct statements kept
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+    
+    # Rate limits per endpoint or blueprint: 'count/second|minute|hour|day' per signed-in
+    # user ('user', else the client IP) or per 'ip'; burst = requests allowed at once
+    # (default: count). 'shared' policies count in RATE_LIMIT_STORAGE_URL (sqlite:///path
+    # or redis://...) so they hold across workers; the rest are per worker (services/ratelimit.py)
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_POLICIES = {
+        'auth.login': {'rate': '30/minute', 'burst': 10, 'key': 'ip', 'shared': True},
+        'auth.register': {'rate': '10/hour', 'burst': 5, 'key': 'ip', 'shared': True},
+        'payments.initiate_mpesa_payment': {'rate': '5/minute', 'burst': 3, 'key': 'user', 'shared': True},
+        'products': {'rate': '20/second', 'burst': 60, 'key': 'user'},
+    }
+    RATE_LIMIT_STORAGE_URL = os.getenv('RATE_LIMIT_STORAGE_URL', os.getenv('CATALOG_CACHE_SHARED_URL', ''))
+    RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv('RATE_LIMIT_TRUSTED_PROXIES', 0))  # proxies appending X-Forwarded-For
+    RATE_LIMIT_MAX_BUCKETS = int(os.getenv('RATE_LIMIT_MAX_BUCKETS', 100000))  # per-worker clients tracked
+    
+    # Cart batch API (POST /api/cart/batch)
+    CART_BATCH_MAX_OPERATIONS = int(os.getenv('CART_BATCH_MAX_OPERATIONS', 100))
+    
+    # Stock reservations: units held per unpaid order, returned on expiry.
+    # Starting an STK push extends the hold to cover the payment window.
+    STOCK_RESERVATION_TTL = int(os.getenv('STOCK_RESERVATION_TTL', 900))  # seconds
+    STOCK_RESERVATION_PAYMENT_TTL = int(os.getenv('STOCK_RESERVATION_PAYMENT_TTL', 600))
+    STOCK_SWEEP_INTERVAL = int(os.getenv('STOCK_SWEEP_INTERVAL', 60))
+    
+    # M-Pesa Configuration
     MPESA_CONSUMER_KEY = os.getenv('MPESA_CONSUMER_KEY', 'placeholder-key')
     MPESA_CONSUMER_SECRET = os.getenv('MPESA_CONSUMER_SECRET', 'placeholder-secret')
     MPESA_BUSINESS_SHORTCODE = os.getenv('MPESA_BUSINESS_SHORTCODE', '174379')
     MPESA_PASSKEY = os.getenv('MPESA_PASSKEY', 'placeholder-passkey')
     MPESA_CALLBACK_URL = os.getenv('MPESA_CALLBACK_URL', 'http://localhost:5000/api/payments/mpesa/callback')
+    # Sent as ?token= in the callback URL; callbacks without it are refused. Unset, each
+    # callback is confirmed with an STK status query before it settles anything
+    MPESA_CALLBACK_SECRET = os.getenv('MPESA_CALLBACK_SECRET', '')
     MPESA_ENVIRONMENT = os.getenv('MPESA_ENVIRONMENT', 'sandbox')
+    # Real Daraja calls are off until enabled; otherwise responses are simulated
+    MPESA_ENABLED = os.getenv('MPESA_ENABLED', 'false').lower() == 'true'
+    MPESA_BASE_URL = os.getenv('MPESA_BASE_URL', '')  # overrides the environment's host (e.g. a local fake)
+    MPESA_CONNECT_TIMEOUT = float(os.getenv('MPESA_CONNECT_TIMEOUT', 3.05))
+    MPESA_READ_TIMEOUT = float(os.getenv('MPESA_READ_TIMEOUT', 10))
+    MPESA_RETRIES = int(os.getenv('MPESA_RETRIES', 2))
+    MPESA_RETRY_BACKOFF = float(os.getenv('MPESA_RETRY_BACKOFF', 0.5))
+    MPESA_POOL_SIZE = int(os.getenv('MPESA_POOL_SIZE', 10))
+    MPESA_TOKEN_REFRESH_MARGIN = int(os.getenv('MPESA_TOKEN_REFRESH_MARGIN', 60))  # seconds before expiry
+    
+    # Background jobs (worker.py): durable queue in the application database
+    JOBS_EAGER = os.getenv('JOBS_EAGER', 'false').lower() == 'true'  # run jobs in the request (no worker)
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1.0))
+    JOB_BATCH_SIZE = int(os.getenv('JOB_BATCH_SIZE', 10))
+    JOB_RETRY_BACKOFF = float(os.getenv('JOB_RETRY_BACKOFF', 5))  # seconds, doubled per attempt
+    JOB_RETRY_MAX_DELAY = float(os.getenv('JOB_RETRY_MAX_DELAY', 600))
+    JOB_LOCK_TIMEOUT = int(os.getenv('JOB_LOCK_TIMEOUT', 300))  # requeue jobs of dead workers
+    
+    # Payment reconciliation: pending payments with no callback after
+    # MPESA_RECONCILE_AFTER seconds are polled in batches; failed after MPESA_PAYMENT_TIMEOUT
+    MPESA_RECONCILE_AFTER = int(os.getenv('MPESA_RECONCILE_AFTER', 60))
+    MPESA_RECONCILE_INTERVAL = int(os.getenv('MPESA_RECONCILE_INTERVAL', 60))
+    MPESA_RECONCILE_BATCH = int(os.getenv('MPESA_RECONCILE_BATCH', 50))
+    MPESA_PAYMENT_TIMEOUT = int(os.getenv('MPESA_PAYMENT_TIMEOUT', 600))
+    
+    # Payment status events (GET /api/payments/<order_id>/events, Server-Sent Events).
+    # EVENTS_URL: '' picks LISTEN/NOTIFY on PostgreSQL and in-process delivery otherwise;
+    # sqlite:///path shares events between local workers through a file
+    EVENTS_URL = os.getenv('EVENTS_URL', '')
+    EVENTS_POLL_INTERVAL = float(os.getenv('EVENTS_POLL_INTERVAL', 0.25))
+    SSE_HEARTBEAT = int(os.getenv('SSE_HEARTBEAT', 15))  # keep-alive comment and status re-check
+    SSE_MAX_DURATION = int(os.getenv('SSE_MAX_DURATION', 600))  # then the client reconnects
+    SSE_RETRY_MS = int(os.getenv('SSE_RETRY_MS', 3000))
+    SSE_TOKEN_TTL = int(os.getenv('SSE_TOKEN_TTL', 60))  # seconds a stream token may be used to connect
     
     # CORS
     #CORS_ORIGINS = os.getenv('CORS_ORIGINS', 'http://localhost:5173,http://localhost:3000').split(',')
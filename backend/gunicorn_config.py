@@ -1,9 +1,57 @@
+import importlib.util
+import sys
+from gunicorn.glogging import Logger
+from profiles import resolve_profile
+
+# Worker class and sizing come from GUNICORN_PROFILE (sync, gthread or gevent); see profiles.py
+profile = resolve_profile()
+
 bind = "0.0.0.0:5000"
-workers = 4
-worker_class = "sync"
-worker_connections = 1000
+worker_class = profile["worker_class"]
+workers = profile["workers"]
+threads = profile["threads"]
+worker_connections = profile["worker_connections"]
+
+# The gevent worker monkey-patches after forking, so it must import the app itself
+preload_app = False
+
 timeout = 120
 keepalive = 5
 errorlog = "-"
 accesslog = "-"
+# Combined format plus request time and the app's Server-Timing (SQL count and time,
+# '-' unless SERVER_TIMING_ENABLED)
+access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" %(M)sms "%({server-timing}o)s"'
 loglevel = "info"
+
+
+class RedactingLogger(Logger):
+    """Access log with stream tokens and other credentials in query strings masked"""
+    
+    def atoms(self, resp, req, environ, request_time):
+        # Imported in the worker: the master must not load the app's modules before gevent patches them
+        from services.instrumentation import redact_query
+        
+        atoms = super().atoms(resp, req, environ, request_time)
+        atoms["r"] = redact_query(atoms["r"])
+        atoms["q"] = redact_query("?" + atoms["q"])[1:] if atoms["q"] else ""
+        return atoms
+
+
+logger_class = RedactingLogger
+
+
+def post_fork(server, worker):
+    # Let psycopg2 yield to other greenlets while waiting on PostgreSQL
+    if worker_class == "gevent" and importlib.util.find_spec("psycopg2"):
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            server.log.warning("psycogreen is not installed; PostgreSQL queries will block gevent workers")
+        else:
+            patch_psycopg()
+    
+    # With --preload the app was built in the master: drop what the fork inherited
+    if server.cfg.preload_app and "wsgi" in sys.modules:
+        from app import reset_after_fork
+        reset_after_fork(sys.modules["wsgi"].app)
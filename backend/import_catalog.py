@@ -0,0 +1,49 @@
+"""
+Import or refresh products from a supplier CSV or JSON Lines feed
+
+    python import_catalog.py products.csv [--batch-size 1000] [--create-categories]
+    gunzip -c feed.jsonl.gz | python import_catalog.py - --format jsonl
+
+Required columns: sku, name, price, category (slug) and image_url. Optional:
+description, old_price, stock, is_featured, category_name (used when
+creating a category), and additional_images, color_options and size_options
+(arrays in JSON Lines, "|"-separated in CSV). Products are upserted on sku,
+so running the same feed again updates prices, stock and options in place.
+"""
+import argparse
+import sys
+from app import create_app
+from services.catalog_import import import_catalog, read_catalog
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path', help="CSV or JSON Lines file (.gz ok), or - for stdin")
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='default: from the file extension')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--create-categories', action='store_true', help='create unknown category slugs')
+    args = parser.parse_args(argv)
+    
+    def progress(report):
+        if report['batches'] % 10 == 0:
+            print(f"  {report['rows']:>10,} rows  {report['rows_per_second']:>8,.0f} rows/s", flush=True)
+    
+    app = create_app(blueprints=())
+    with app.app_context():
+        report = import_catalog(
+            read_catalog(args.path, args.format),
+            batch_size=args.batch_size,
+            create_categories=args.create_categories,
+            progress=progress,
+        )
+    
+    print(f"Imported {report['upserted']:,} products from {report['rows']:,} rows in {report['seconds']:.1f}s "
+          f"({report['rows_per_second']:,.0f} rows/s); {report['skipped']:,} skipped, "
+          f"{report['categories_created']} categories created")
+    for error in report['errors']:
+        print(f'  {error}')
+    return 1 if report['skipped'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,17 +1,13 @@
 """
 Database initialization and migration script for production
 Run this after deploying to Render to set up the database
+(equivalent to `python migrate.py`, which the deploy runs before starting the app)
 """
-from app import create_app
-from models import db
+from migrate import migrate
 
 def init_db():
-    """Initialize database tables"""
-    app = create_app()
-    with app.app_context():
-        print("Creating database tables...")
-        db.create_all()
-        print("Database tables created successfully!")
+    """Create or upgrade the database schema through the migrations"""
+    migrate()
 
 if __name__ == '__main__':
     init_db()
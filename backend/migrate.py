@@ -0,0 +1,218 @@
+"""
+Database migrations (Alembic, via Flask-Migrate)
+
+The schema lives in migrations/versions and is applied by one command, run
+once per deploy before the new code starts (the app itself never creates
+tables):
+    python migrate.py
+
+Databases created before migrations existed (by db.create_all()) are first
+brought up to the baseline revision with the idempotent steps in
+upgrade_legacy_schema() and stamped, then upgraded like any other. Those
+steps work from the schema revision 0001 declares, never from the current
+models, so later revisions apply on top of it as they would anywhere else.
+
+New revisions are generated from the models with the Flask CLI:
+    flask --app migrate:create_migrate_app db migrate -m "add widgets"
+"""
+import os
+from contextlib import contextmanager
+from alembic.script import ScriptDirectory
+from flask_migrate import Migrate, stamp, upgrade
+from sqlalchemy import Index, MetaData, Table, func, inspect, select, text
+from app import create_app
+from models import db, product_attribute_rows
+from services.search import ensure_search_schema
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Revision matching the schema upgrade_legacy_schema() produces
+BASELINE_REVISION = '0001_baseline'
+
+
+def add_column(table, column, ddl, backfill=None):
+    """Add a column if it does not exist yet, optionally backfilling it"""
+    columns = {col['name'] for col in inspect(db.engine).get_columns(table)}
+    if column in columns:
+        return False
+    
+    with db.engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+        if backfill:
+            conn.execute(text(f'UPDATE {table} SET {column} = {backfill} WHERE {column} IS NULL'))
+    print(f'  added {table}.{column}')
+    return True
+
+
+def convert_json_columns(table, columns):
+    """
+    Move legacy JSON-in-TEXT columns to native JSON
+    
+    Rows written by the old seed.py hold json.dumps() strings. PostgreSQL
+    columns are converted in place to JSONB; SQLite's JSON type reads the same
+    text, so only empty strings (not valid JSON) are cleared there.
+    """
+    existing = {col['name']: col['type'] for col in inspect(db.engine).get_columns(table)}
+    
+    with db.engine.begin() as conn:
+        for column in columns:
+            if db.engine.dialect.name == 'postgresql':
+                if existing[column].__class__.__name__ == 'JSONB':
+                    continue
+                conn.execute(text(
+                    f"ALTER TABLE {table} ALTER COLUMN {column} TYPE JSONB "
+                    f"USING NULLIF({column}, '')::jsonb"
+                ))
+                print(f'  converted {table}.{column} to JSONB')
+            else:
+                conn.execute(text(f"UPDATE {table} SET {column} = NULL WHERE {column} = ''"))
+
+
+def backfill_product_attributes(tables, batch_size=1000):
+    """Populate product_attributes from products' color/size options"""
+    attributes, products = tables['product_attributes'], tables['products']
+    if db.session.execute(select(attributes.c.id).limit(1)).first() is not None:
+        return
+    
+    rows = []
+    options = db.session.execute(
+        select(products.c.id, products.c.color_options, products.c.size_options).execution_options(yield_per=batch_size)
+    )
+    for product_id, color_options, size_options in options:
+        rows.extend(product_attribute_rows(product_id, color_options, size_options))
+        if len(rows) >= batch_size:
+            db.session.execute(attributes.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(attributes.insert(), rows)
+    db.session.commit()
+    count = db.session.execute(select(func.count()).select_from(attributes)).scalar()
+    print(f'  backfilled product_attributes ({count} rows)')
+
+
+class _BaselineRecorder:
+    """Stands in for alembic.op while the baseline revision runs, collecting its tables and indexes"""
+    
+    def __init__(self, bind):
+        self.metadata = MetaData()
+        self.table = None
+        self.bind = bind
+    
+    def create_table(self, name, *columns, **kwargs):
+        return Table(name, self.metadata, *columns, **kwargs)
+    
+    @contextmanager
+    def batch_alter_table(self, name, schema=None):
+        self.table = self.metadata.tables[name]
+        yield self
+    
+    def create_index(self, name, columns, unique=False):
+        return Index(name, *(self.table.c[column] for column in columns), unique=unique)
+    
+    def f(self, name):
+        return name
+    
+    def execute(self, statement):
+        pass  # the full-text index DDL; ensure_search_schema() creates it
+    
+    def get_bind(self):
+        return self.bind
+
+
+def baseline_metadata():
+    """The tables and indexes the baseline revision creates, read from the revision itself"""
+    module = ScriptDirectory(MIGRATIONS_DIR).get_revision(BASELINE_REVISION).module
+    recorder = _BaselineRecorder(db.engine)
+    op, module.op = module.op, recorder
+    try:
+        module.upgrade()
+    finally:
+        module.op = op
+    return recorder.metadata
+
+
+def create_indexes(metadata):
+    """Create any index of `metadata` that is missing"""
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+
+def upgrade_legacy_schema():
+    """Bring a database created with db.create_all() up to the baseline revision"""
+    baseline = baseline_metadata()
+    baseline.create_all(db.engine)  # tables added since, with their indexes
+    
+    # Conditional GET validators
+    add_column('products', 'updated_at', 'TIMESTAMP', backfill='created_at')
+    add_column('categories', 'updated_at', 'TIMESTAMP', backfill='CURRENT_TIMESTAMP')
+    add_column('orders', 'updated_at', 'TIMESTAMP', backfill='created_at')
+    
+    # Cart versions for compact/delta cart responses
+    add_column('carts', 'version', 'INTEGER NOT NULL DEFAULT 0')
+    
+    # STK push tracking for background initiation and reconciliation
+    add_column('payments', 'checkout_request_id', 'VARCHAR(100)')
+    add_column('payments', 'merchant_request_id', 'VARCHAR(100)')
+    add_column('payments', 'result_desc', 'VARCHAR(255)')
+    add_column('payments', 'checked_at', 'TIMESTAMP')
+    
+    # Exactly-once callback settlement (replaced by uq_payments_checkout_request_id)
+    add_column('payments', 'updated_at', 'TIMESTAMP', backfill='created_at')
+    with db.engine.begin() as conn:
+        conn.execute(text('DROP INDEX IF EXISTS ix_payments_checkout_request_id'))
+    
+    # Native JSON product options
+    convert_json_columns('products', ['additional_images', 'color_options', 'size_options'])
+    
+    # Normalized color/size options for filters and facets
+    backfill_product_attributes(baseline.tables)
+    
+    create_indexes(baseline)
+    
+    # Full-text product search index
+    if ensure_search_schema(db.engine):
+        print(f'  search index ready ({db.engine.dialect.name})')
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    """Keep autogenerate away from the full-text index, which is not declared on the models"""
+    if type_ == 'table' and name.startswith('products_fts'):
+        return False
+    if type_ == 'column' and name == 'search_vector':
+        return False
+    return True
+
+
+def create_migrate_app():
+    """App with Flask-Migrate configured, for `flask --app migrate:create_migrate_app db ...`"""
+    app = create_app(blueprints=())
+    Migrate(app, db, directory=MIGRATIONS_DIR, render_as_batch=True, compare_type=True,
+            include_object=include_object)
+    return app
+
+
+def migrate():
+    """Apply every pending migration (one-shot, idempotent)"""
+    app = create_migrate_app()
+    with app.app_context():
+        tables = set(inspect(db.engine).get_table_names())
+        if tables and 'alembic_version' not in tables:
+            print("Upgrading a database created before migrations...")
+            upgrade_legacy_schema()
+            stamp(revision=BASELINE_REVISION)
+        upgrade()
+        print("Database schema is up to date!")
+
+
+def reset_schema():
+    """Drop every table and rebuild the schema from the migrations (development seeding only)"""
+    db.drop_all()
+    with db.engine.begin() as conn:
+        conn.execute(text('DROP TABLE IF EXISTS products_fts'))
+        conn.execute(text('DROP TABLE IF EXISTS alembic_version'))
+    upgrade()
+
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,50 @@
+"""cart items line
+
+Unique index on cart_items (cart_id, product_id, selected_color,
+selected_size), options coalesced to '' so lines without options conflict
+too. Lines duplicated before it existed are merged into the oldest one,
+quantities summed, and their carts' versions bumped.
+
+Revision ID: 0004_cart_items_line
+Revises: 0003_order_items_order_id
+Create Date: 2026-10-18 19:41:07.552310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_cart_items_line'
+down_revision = '0003_order_items_order_id'
+branch_labels = None
+depends_on = None
+
+LINE = "cart_id, product_id, coalesce(selected_color, ''), coalesce(selected_size, '')"
+
+SAME_LINE = """
+    d.cart_id = cart_items.cart_id AND d.product_id = cart_items.product_id
+    AND coalesce(d.selected_color, '') = coalesce(cart_items.selected_color, '')
+    AND coalesce(d.selected_size, '') = coalesce(cart_items.selected_size, '')
+"""
+
+
+def upgrade():
+    op.execute(f"""
+        UPDATE carts SET version = version + 1
+        WHERE id IN (SELECT cart_id FROM cart_items GROUP BY {LINE} HAVING count(*) > 1)
+    """)
+    op.execute(f"""
+        UPDATE cart_items SET quantity = (SELECT sum(d.quantity) FROM cart_items d WHERE {SAME_LINE})
+        WHERE id IN (SELECT min(id) FROM cart_items GROUP BY {LINE} HAVING count(*) > 1)
+    """)
+    op.execute(f"""
+        DELETE FROM cart_items WHERE id NOT IN (SELECT min(id) FROM cart_items GROUP BY {LINE})
+    """)
+    op.create_index('uq_cart_items_line', 'cart_items', [
+        'cart_id', 'product_id', sa.text("coalesce(selected_color, '')"), sa.text("coalesce(selected_size, '')")
+    ], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_cart_items_line', table_name='cart_items')
@@ -1,8 +1,15 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import JSONB
+from services.passwords import password_hasher
+from services.replicas import RoutingSession
 
-db = SQLAlchemy()
+# Read-only endpoints may read from a replica (see services/replicas.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Native JSON column: JSONB on PostgreSQL, JSON (text) elsewhere
+JSONType = db.JSON().with_variant(JSONB(), 'postgresql')
 
 class User(db.Model):
     """User model for authentication and orders"""
@@ -20,12 +27,16 @@ class User(db.Model):
     orders = db.relationship('Order', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
-        """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        """Hash and set password (parameters from PASSWORD_HASH_METHOD)"""
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        """Check if password matches hash"""
-        return check_password_hash(self.password_hash, password)
+        """Check if password matches hash, re-hashing it if made with outdated parameters (caller commits)"""
+        if not password_hasher.verify(self.password_hash, password):
+            return False
+        if password_hasher.needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
     
     def to_dict(self):
         """Convert user to dictionary (excluding password)"""
@@ -47,6 +58,7 @@ class Category(db.Model):
     slug = db.Column(db.String(50), unique=True, nullable=False, index=True)
     description = db.Column(db.Text)
     image_url = db.Column(db.String(255))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relationships
     products = db.relationship('Product', backref='category', lazy=True)
@@ -67,18 +79,29 @@ class Product(db.Model):
     __tablename__ = 'products'
     
     id = db.Column(db.Integer, primary_key=True)
+    sku = db.Column(db.String(64))  # supplier SKU; catalog imports upsert on it
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     price = db.Column(db.Float, nullable=False)
     old_price = db.Column(db.Float)
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
     image_url = db.Column(db.String(255), nullable=False)
-    additional_images = db.Column(db.Text)  # JSON string of image URLs
+    additional_images = db.Column(JSONType)  # list of image URLs
     stock = db.Column(db.Integer, default=0)
-    color_options = db.Column(db.Text)  # JSON string of available colors
-    size_options = db.Column(db.Text)  # JSON string of available sizes
+    color_options = db.Column(JSONType)  # list of available colors
+    size_options = db.Column(JSONType)  # list of available sizes
     is_featured = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    # Composite indexes backing keyset pagination (see services/catalog.py)
+    __table_args__ = (
+        db.Index('ix_products_created_at_id', 'created_at', 'id'),
+        db.Index('ix_products_price_id', 'price', 'id'),
+        db.Index('ix_products_category_created_at_id', 'category_id', 'created_at', 'id'),
+        db.Index('ix_products_category_price_id', 'category_id', 'price', 'id'),
+        db.Index('uq_products_sku', 'sku', unique=True),
+    )
     
     # Relationships
     cart_items = db.relationship('CartItem', backref='product', lazy=True)
@@ -86,9 +109,9 @@ class Product(db.Model):
     
     def to_dict(self):
         """Convert product to dictionary"""
-        import json
         return {
             'id': self.id,
+            'sku': self.sku,
             'name': self.name,
             'description': self.description,
             'price': self.price,
@@ -96,21 +119,78 @@ class Product(db.Model):
             'category_id': self.category_id,
             'category': self.category.to_dict() if self.category else None,
             'image_url': self.image_url,
-            'additional_images': json.loads(self.additional_images) if self.additional_images else [],
+            'additional_images': self.additional_images or [],
             'stock': self.stock,
-            'color_options': json.loads(self.color_options) if self.color_options else [],
-            'size_options': json.loads(self.size_options) if self.size_options else [],
+            'color_options': self.color_options or [],
+            'size_options': self.size_options or [],
             'is_featured': self.is_featured,
             'created_at': self.created_at.isoformat()
         }
 
 
+class ProductAttribute(db.Model):
+    """Normalized product option (one row per color/size) for filtering and facets"""
+    __tablename__ = 'product_attributes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(10), nullable=False)  # color, size
+    value = db.Column(db.String(50), nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_product_attributes_kind_value', 'kind', 'value', 'product_id'),
+        db.Index('ix_product_attributes_product_kind', 'product_id', 'kind'),
+    )
+
+
+# Product JSON option columns mirrored into product_attributes
+ATTRIBUTE_COLUMNS = {'color': 'color_options', 'size': 'size_options'}
+
+
+def product_attribute_rows(product_id, color_options, size_options):
+    """Rows for product_attributes from a product's option lists (deduplicated)"""
+    rows = []
+    for kind, values in (('color', color_options), ('size', size_options)):
+        for value in dict.fromkeys(str(value)[:50] for value in values or []):
+            rows.append({'product_id': product_id, 'kind': kind, 'value': value})
+    return rows
+
+
+def _write_product_attributes(connection, product):
+    table = ProductAttribute.__table__
+    connection.execute(table.delete().where(table.c.product_id == product.id))
+    rows = product_attribute_rows(product.id, product.color_options, product.size_options)
+    if rows:
+        connection.execute(table.insert(), rows)
+
+
+@event.listens_for(Product, 'after_insert')
+def _insert_product_attributes(mapper, connection, product):
+    """Mirror a new product's options into product_attributes"""
+    _write_product_attributes(connection, product)
+
+
+@event.listens_for(Product, 'after_update')
+def _update_product_attributes(mapper, connection, product):
+    """Re-mirror options when color_options or size_options change"""
+    state = db.inspect(product)
+    if any(state.attrs[column].history.has_changes() for column in ATTRIBUTE_COLUMNS.values()):
+        _write_product_attributes(connection, product)
+
+
+@event.listens_for(Product, 'after_delete')
+def _delete_product_attributes(mapper, connection, product):
+    table = ProductAttribute.__table__
+    connection.execute(table.delete().where(table.c.product_id == product.id))
+
+
 class Cart(db.Model):
     """Shopping cart model"""
     __tablename__ = 'carts'
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    version = db.Column(db.Integer, default=0, nullable=False)  # bumped on every cart mutation
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -118,11 +198,13 @@ class Cart(db.Model):
     
     def to_dict(self):
         """Convert cart to dictionary"""
+        items = [item.to_dict() for item in self.items]
         return {
             'id': self.id,
             'user_id': self.user_id,
-            'items': [item.to_dict() for item in self.items],
-            'total': sum(item.product.price * item.quantity for item in self.items),
+            'version': self.version,
+            'items': items,
+            'total': sum(item['subtotal'] for item in items),
             'created_at': self.created_at.isoformat()
         }
 
@@ -138,6 +220,12 @@ class CartItem(db.Model):
     selected_color = db.Column(db.String(50))
     selected_size = db.Column(db.String(20))
     
+    # One line per product and options in a cart; options are coalesced because NULLs never conflict
+    __table_args__ = (
+        db.Index('uq_cart_items_line', cart_id, product_id, db.func.coalesce(selected_color, db.literal_column("''")),
+                 db.func.coalesce(selected_size, db.literal_column("''")), unique=True),
+    )
+    
     def to_dict(self):
         """Convert cart item to dictionary"""
         return {
@@ -173,6 +261,12 @@ class Order(db.Model):
     payment_status = db.Column(db.String(20), default='pending')  # pending, completed, failed
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Backs per-user order history and its conditional GET validator
+    __table_args__ = (
+        db.Index('ix_orders_user_updated_at', 'user_id', 'updated_at'),
+    )
     
     # Relationships
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
@@ -203,7 +297,7 @@ class OrderItem(db.Model):
     __tablename__ = 'order_items'
     
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)  # Price at time of order
@@ -229,16 +323,29 @@ class Payment(db.Model):
     __tablename__ = 'payments'
     
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
     mpesa_receipt_number = db.Column(db.String(50))
     transaction_id = db.Column(db.String(50), unique=True)
     phone_number = db.Column(db.String(20), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='pending')  # pending, success, failed
+    checkout_request_id = db.Column(db.String(100))  # set once the STK push is accepted
+    merchant_request_id = db.Column(db.String(100))
+    result_desc = db.Column(db.String(255))
+    checked_at = db.Column(db.DateTime)  # last STK status query by the reconciler
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Callbacks settle by Daraja's request ids; the reconciler scans stale pending payments
+    __table_args__ = (
+        db.Index('uq_payments_checkout_request_id', 'checkout_request_id', unique=True),
+        db.Index('uq_payments_merchant_request_id', 'merchant_request_id', unique=True),
+        db.Index('ix_payments_status_created_at', 'status', 'created_at'),
+    )
     
     def to_dict(self):
         """Convert payment to dictionary"""
+        # No Daraja request ids: they identify the callback
         return {
             'id': self.id,
             'order_id': self.order_id,
@@ -247,5 +354,123 @@ class Payment(db.Model):
             'phone_number': self.phone_number,
             'amount': self.amount,
             'status': self.status,
+            'result_desc': self.result_desc,
             'created_at': self.created_at.isoformat()
         }
+
+
+class MpesaCallback(db.Model):
+    """
+    Ledger of STK callbacks received, one row per CheckoutRequestID
+    
+    Daraja retries callbacks it considers undelivered; the unique key turns
+    every repeat into a no-op insert, and a callback that arrives before the
+    worker has stored its push's ids is kept here until it can be applied.
+    """
+    __tablename__ = 'mpesa_callbacks'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    checkout_request_id = db.Column(db.String(100), nullable=False, unique=True)
+    merchant_request_id = db.Column(db.String(100))
+    result_code = db.Column(db.Integer)
+    payload = db.Column(JSONType)
+    payment_id = db.Column(db.Integer, db.ForeignKey('payments.id'))  # set once applied
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        """Convert callback record to dictionary"""
+        return {
+            'id': self.id,
+            'checkout_request_id': self.checkout_request_id,
+            'merchant_request_id': self.merchant_request_id,
+            'result_code': self.result_code,
+            'payment_id': self.payment_id,
+            'received_at': self.received_at.isoformat()
+        }
+
+
+class StockReservation(db.Model):
+    """
+    Stock held for an unpaid order
+    
+    Product.stock is decremented when the reservation is taken; the units are
+    returned if the reservation is released (payment failed or timed out).
+    """
+    __tablename__ = 'stock_reservations'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), default='held', nullable=False)  # held, committed, released
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Backs the expiry sweep (held reservations past expires_at)
+    __table_args__ = (
+        db.Index('ix_stock_reservations_status_expires_at', 'status', 'expires_at'),
+    )
+    
+    def to_dict(self):
+        """Convert reservation to dictionary"""
+        return {
+            'id': self.id,
+            'order_id': self.order_id,
+            'product_id': self.product_id,
+            'quantity': self.quantity,
+            'status': self.status,
+            'expires_at': self.expires_at.isoformat()
+        }
+
+
+class Job(db.Model):
+    """
+    Durable background job
+    
+    Jobs are rows in the application database, so enqueueing commits
+    atomically with the request's own writes and no broker is needed.
+    """
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    queue = db.Column(db.String(50), default='default', nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(JSONType)
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, done, dead
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=5, nullable=False)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Backs the worker's poll for due jobs and the claim-token lookup
+    __table_args__ = (
+        db.Index('ix_jobs_queue_status_run_at', 'queue', 'status', 'run_at'),
+        db.Index('ix_jobs_locked_by', 'locked_by'),
+    )
+    
+    def to_dict(self):
+        """Convert job to dictionary"""
+        return {
+            'id': self.id,
+            'queue': self.queue,
+            'name': self.name,
+            'payload': self.payload,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'run_at': self.run_at.isoformat(),
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat()
+        }
+
+
+class ReplicaHeartbeat(db.Model):
+    """Single row stamped on the primary; its replicated copy shows how far behind a replica is"""
+    __tablename__ = 'replica_heartbeat'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    beat_at = db.Column(db.DateTime, nullable=False)
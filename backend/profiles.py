@@ -0,0 +1,49 @@
+"""
+Gunicorn run profiles
+
+Each profile picks a worker class and sizes it from the CPU count:
+
+    sync     one request at a time per process; a slow query or M-Pesa call
+             blocks the whole worker
+    gthread  a thread pool per process; blocking I/O overlaps across threads
+    gevent   greenlets; many concurrent requests and idle keep-alive or
+             Server-Sent Events connections per process (default)
+
+Select one with GUNICORN_PROFILE; GUNICORN_WORKERS, GUNICORN_THREADS and
+GUNICORN_WORKER_CONNECTIONS override the derived sizes.
+"""
+import multiprocessing
+import os
+
+PROFILES = ('sync', 'gthread', 'gevent')
+DEFAULT_PROFILE = 'gevent'
+
+
+def resolve_profile(name=None, cpus=None):
+    """Worker class and sizing for a profile, with environment overrides applied"""
+    name = name or os.getenv('GUNICORN_PROFILE', DEFAULT_PROFILE)
+    if name not in PROFILES:
+        raise ValueError(f"Unknown GUNICORN_PROFILE {name!r}; choose one of {', '.join(PROFILES)}")
+    cpus = cpus or multiprocessing.cpu_count()
+    
+    if name == 'sync':
+        workers, threads = 2 * cpus + 1, 1
+    elif name == 'gthread':
+        workers, threads = cpus + 1, 8
+    else:
+        workers, threads = cpus + 1, 1
+    
+    workers = int(os.getenv('GUNICORN_WORKERS', workers))
+    threads = int(os.getenv('GUNICORN_THREADS', threads))
+    # Open connections per worker (gthread parks idle keep-alive ones beyond its threads)
+    connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+    
+    return {
+        'name': name,
+        'worker_class': name,
+        'workers': workers,
+        'threads': threads,
+        'worker_connections': connections,
+        # Requests one worker process can have in flight at once
+        'concurrency': connections if name == 'gevent' else threads,
+    }
@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, jwt_required
 from models import db, User
+from services.identity import current_identity
+from services.passwords import HasherBusy
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
@@ -40,6 +42,9 @@ def register():
             'access_token': access_token
         }), 201
         
+    except HasherBusy:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -61,6 +66,10 @@ def login():
         if not user or not user.check_password(data['password']):
             return jsonify({'error': 'Invalid email or password'}), 401
         
+        # check_password upgraded a hash made with outdated parameters
+        if user in db.session.dirty:
+            db.session.commit()
+        
         # Generate access token
         access_token = create_access_token(identity=user.id)
         
@@ -70,6 +79,8 @@ def login():
             'access_token': access_token
         }), 200
         
+    except HasherBusy:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -79,13 +90,13 @@ def login():
 def get_current_user():
     """Get current authenticated user"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        # Served from the claims cache; no query while the entry is fresh
+        claims = current_identity().claims
         
-        if not user:
+        if not claims:
             return jsonify({'error': 'User not found'}), 404
         
-        return jsonify({'user': user.to_dict()}), 200
+        return jsonify({'user': claims}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1,25 +1,50 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Cart, CartItem, Product
+from flask_jwt_extended import jwt_required
+from models import db, Cart, CartItem
+from services.cart import (
+    CartItemNotFound, ProductNotFound, add_lines, apply_operations, bump_version, cart_delta, cart_line,
+    compact_cart, parse_operations, parse_view
+)
+from services.catalog import product_details
+from services.identity import current_identity
 
 cart_bp = Blueprint('cart', __name__, url_prefix='/api/cart')
 
+
+def _cart_payload(cart_id, view, version=None, line=None, removed=None, product=None):
+    """Response body for a cart mutation in the requested view (only 'full' reloads the cart)"""
+    if view == 'delta':
+        return {'delta': cart_delta(cart_id, version, line=line, removed=removed, product=product)}
+    if view == 'compact':
+        return {'cart': compact_cart(cart_id, version)}
+    return {'cart': db.session.get(Cart, cart_id).to_dict()}
+
+
 @cart_bp.route('', methods=['GET'])
 @jwt_required()
 def get_cart():
-    """Get user's cart"""
+    """Get user's cart (?view=compact for lines only, &expand=products for cached product details)"""
     try:
-        user_id = get_jwt_identity()
+        identity = current_identity()
+        
+        try:
+            view = parse_view(request.args.get('view'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Get or create cart for user
-        cart = Cart.query.filter_by(user_id=user_id).first()
+        cart = identity.cart()
         
         if not cart:
-            cart = Cart(user_id=user_id)
-            db.session.add(cart)
+            db.session().use_primary()  # a lagging replica may not have it yet
+            cart = identity.cart(create=True)
             db.session.commit()
         
-        return jsonify({'cart': cart.to_dict()}), 200
+        if view == 'full':
+            return jsonify({'cart': cart.to_dict()}), 200
+        
+        expand = request.args.get('expand') == 'products'
+        return jsonify({'cart': compact_cart(cart.id, cart.version, expand=expand)}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -30,52 +55,40 @@ def get_cart():
 def add_to_cart():
     """Add item to cart"""
     try:
-        user_id = get_jwt_identity()
         data = request.get_json()
         
         # Validate required fields
         if 'product_id' not in data:
             return jsonify({'error': 'product_id is required'}), 400
         
-        # Check if product exists
-        product = Product.query.get(data['product_id'])
+        try:
+            view = parse_view(request.args.get('view'))
+            product_id = int(data['product_id'])
+            quantity = int(data.get('quantity', 1))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        if quantity < 1:
+            return jsonify({'error': 'quantity must be at least 1'}), 400
+        
+        # Check if product exists (served from the catalog cache)
+        product = product_details([product_id]).get(product_id)
         if not product:
             return jsonify({'error': 'Product not found'}), 404
         
         # Get or create cart
-        cart = Cart.query.filter_by(user_id=user_id).first()
-        if not cart:
-            cart = Cart(user_id=user_id)
-            db.session.add(cart)
-            db.session.flush()
-        
-        # Check if item already in cart
-        cart_item = CartItem.query.filter_by(
-            cart_id=cart.id,
-            product_id=data['product_id'],
-            selected_color=data.get('selected_color'),
-            selected_size=data.get('selected_size')
-        ).first()
-        
-        if cart_item:
-            # Update quantity
-            cart_item.quantity += data.get('quantity', 1)
-        else:
-            # Add new item
-            cart_item = CartItem(
-                cart_id=cart.id,
-                product_id=data['product_id'],
-                quantity=data.get('quantity', 1),
-                selected_color=data.get('selected_color'),
-                selected_size=data.get('selected_size')
-            )
-            db.session.add(cart_item)
-        
+        cart_id = current_identity().cart(create=True).id
+        
+        # New line, or added to the quantity of the one already in the cart (the
+        # cart row lock is taken first, in the same order as a batch)
+        selected_color, selected_size = data.get('selected_color'), data.get('selected_size')
+        version = bump_version(cart_id)
+        [(item_id, line_quantity)] = add_lines(cart_id, {(product_id, selected_color, selected_size): quantity})
+        line = cart_line(item_id, product_id, line_quantity, product['price'], selected_color, selected_size)
         db.session.commit()
         
         return jsonify({
             'message': 'Item added to cart',
-            'cart': cart.to_dict()
+            **_cart_payload(cart_id, view, version, line=line, product=product)
         }), 200
         
     except Exception as e:
@@ -88,9 +101,14 @@ def add_to_cart():
 def update_cart_item(item_id):
     """Update cart item quantity"""
     try:
-        user_id = get_jwt_identity()
+        user_id = current_identity().user_id
         data = request.get_json()
         
+        try:
+            view = parse_view(request.args.get('view'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         # Find cart item
         cart_item = CartItem.query.join(Cart).filter(
             CartItem.id == item_id,
@@ -100,20 +118,29 @@ def update_cart_item(item_id):
         if not cart_item:
             return jsonify({'error': 'Cart item not found'}), 404
         
+        cart_id = cart_item.cart_id
+        line = removed = None
+        
         # Update quantity
         if 'quantity' in data:
-            if data['quantity'] <= 0:
+            product = product_details([cart_item.product_id]).get(cart_item.product_id)
+            if data['quantity'] <= 0 or product is None:
+                # A line whose product was deleted is dropped, as the compact view already hides it
                 db.session.delete(cart_item)
+                removed = item_id
             else:
                 cart_item.quantity = data['quantity']
+                if view == 'delta':
+                    line = cart_line(cart_item.id, cart_item.product_id, cart_item.quantity, product['price'],
+                                     cart_item.selected_color, cart_item.selected_size)
         
+        db.session.flush()
+        version = bump_version(cart_id)
         db.session.commit()
         
-        cart = Cart.query.filter_by(user_id=user_id).first()
-        
         return jsonify({
             'message': 'Cart updated',
-            'cart': cart.to_dict()
+            **_cart_payload(cart_id, view, version, line=line, removed=removed)
         }), 200
         
     except Exception as e:
@@ -126,7 +153,12 @@ def update_cart_item(item_id):
 def remove_from_cart(item_id):
     """Remove item from cart"""
     try:
-        user_id = get_jwt_identity()
+        user_id = current_identity().user_id
+        
+        try:
+            view = parse_view(request.args.get('view'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Find cart item
         cart_item = CartItem.query.join(Cart).filter(
@@ -137,14 +169,15 @@ def remove_from_cart(item_id):
         if not cart_item:
             return jsonify({'error': 'Cart item not found'}), 404
         
+        cart_id = cart_item.cart_id
         db.session.delete(cart_item)
+        db.session.flush()
+        version = bump_version(cart_id)
         db.session.commit()
         
-        cart = Cart.query.filter_by(user_id=user_id).first()
-        
         return jsonify({
             'message': 'Item removed from cart',
-            'cart': cart.to_dict()
+            **_cart_payload(cart_id, view, version, removed=item_id)
         }), 200
         
     except Exception as e:
@@ -152,17 +185,52 @@ def remove_from_cart(item_id):
         return jsonify({'error': str(e)}), 500
 
 
+@cart_bp.route('/batch', methods=['POST'])
+@jwt_required()
+def batch_update_cart():
+    """Apply many add/update/remove operations to the cart in one transaction"""
+    try:
+        try:
+            view = parse_view(request.args.get('view'), default='compact')
+            if view == 'delta':
+                raise ValueError('view must be full or compact for batch updates')
+            operations = parse_operations(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        cart = current_identity().cart(create=True)
+        version = apply_operations(cart, operations)
+        cart_id = cart.id
+        db.session.commit()
+        
+        if view == 'full':
+            payload = db.session.get(Cart, cart_id).to_dict()
+        else:
+            payload = compact_cart(cart_id, version, expand=request.args.get('expand') == 'products')
+        
+        return jsonify({
+            'message': f'{len(operations)} cart operation(s) applied',
+            'cart': payload
+        }), 200
+        
+    except (ProductNotFound, CartItemNotFound) as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'ids': e.ids}), 404
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
 @cart_bp.route('/clear', methods=['DELETE'])
 @jwt_required()
 def clear_cart():
     """Clear entire cart"""
     try:
-        user_id = get_jwt_identity()
-        
-        cart = Cart.query.filter_by(user_id=user_id).first()
+        cart = current_identity().cart()
         
         if cart:
             CartItem.query.filter_by(cart_id=cart.id).delete()
+            bump_version(cart.id)
             db.session.commit()
         
         return jsonify({'message': 'Cart cleared'}), 200
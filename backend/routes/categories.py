@@ -1,9 +1,13 @@
 from flask import Blueprint, jsonify
 from models import db, Category
+from services.cache import catalog_cache
+from services.http_cache import conditional, catalog_validator
 
 categories_bp = Blueprint('categories', __name__, url_prefix='/api/categories')
 
 @categories_bp.route('', methods=['GET'])
+@conditional(catalog_validator)
+@catalog_cache.cached
 def get_categories():
     """Get all categories"""
     try:
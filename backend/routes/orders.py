@@ -1,6 +1,9 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Order, OrderItem, Cart, CartItem
+from models import db, Order
+from services.checkout import EmptyCart, load_order, place_order
+from services.http_cache import conditional, orders_validator
+from services.inventory import InsufficientStock, sweep_expired_reservations
 
 orders_bp = Blueprint('orders', __name__, url_prefix='/api/orders')
 
@@ -18,55 +21,24 @@ def create_order():
             if field not in data:
                 return jsonify({'error': f'{field} is required'}), 400
         
-        # Get user's cart
-        cart = Cart.query.filter_by(user_id=user_id).first()
-        
-        if not cart or not cart.items:
-            return jsonify({'error': 'Cart is empty'}), 400
-        
-        # Calculate total
-        subtotal = sum(item.product.price * item.quantity for item in cart.items)
-        delivery_fee = data.get('delivery_fee', 500.0)
-        total_amount = subtotal + delivery_fee
-        
-        # Create order
-        order = Order(
-            user_id=user_id,
-            total_amount=total_amount,
-            delivery_fee=delivery_fee,
-            phone_number=data['phone_number'],
-            full_name=data['full_name'],
-            county=data['county'],
-            town=data['town'],
-            address=data['address'],
-            payment_method=data.get('payment_method', 'mpesa')
-        )
-        
-        db.session.add(order)
-        db.session.flush()
-        
-        # Create order items from cart
-        for cart_item in cart.items:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=cart_item.product_id,
-                quantity=cart_item.quantity,
-                price=cart_item.product.price,
-                selected_color=cart_item.selected_color,
-                selected_size=cart_item.selected_size
-            )
-            db.session.add(order_item)
-        
-        # Clear cart
-        CartItem.query.filter_by(cart_id=cart.id).delete()
+        # Return stock held by abandoned unpaid orders before reserving more
+        sweep_expired_reservations()
         
+        # Order, stock reservation, items and cart clear in one transaction
+        order_id = place_order(user_id, data)
         db.session.commit()
         
         return jsonify({
             'message': 'Order created successfully',
-            'order': order.to_dict()
+            'order': load_order(order_id).to_dict()
         }), 201
         
+    except (EmptyCart, ValueError) as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except InsufficientStock as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'product_ids': e.product_ids}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -74,6 +46,7 @@ def create_order():
 
 @orders_bp.route('', methods=['GET'])
 @jwt_required()
+@conditional(orders_validator)
 def get_orders():
     """Get user's orders"""
     try:
@@ -92,6 +65,7 @@ def get_orders():
 
 @orders_bp.route('/<int:order_id>', methods=['GET'])
 @jwt_required()
+@conditional(orders_validator)
 def get_order(order_id):
     """Get order by ID"""
     try:
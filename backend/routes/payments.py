@@ -1,14 +1,22 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+import hmac
+import json
+import time
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
 from models import db, Order, Payment
-from services.mpesa import mpesa_service
+from services.mpesa import normalize_phone
+from services.inventory import InsufficientStock, commit_reservations, extend_reservations
+from services.jobs import enqueue, run_eager
+from services.events import event_broker
+from services.payments import STK_PUSH_JOB, handle_callback, publish_status
 
 payments_bp = Blueprint('payments', __name__, url_prefix='/api/payments')
 
 @payments_bp.route('/mpesa/initiate', methods=['POST'])
 @jwt_required()
 def initiate_mpesa_payment():
-    """Initiate M-Pesa STK push (PLACEHOLDER)"""
+    """Initiate M-Pesa STK push"""
     try:
         user_id = get_jwt_identity()
         data = request.get_json()
@@ -26,39 +34,33 @@ def initiate_mpesa_payment():
         if order.payment_status == 'completed':
             return jsonify({'error': 'Order already paid'}), 400
         
+        if order.status == 'cancelled':
+            return jsonify({'error': 'Order has expired'}), 400
+        
         # Get phone number (use order phone or provided phone)
-        phone_number = data.get('phone_number', order.phone_number)
+        phone_number = normalize_phone(data.get('phone_number', order.phone_number))
         
-        # Initiate STK push (PLACEHOLDER)
-        response = mpesa_service.initiate_stk_push(
+        # Create the pending payment and queue its STK push in one transaction;
+        # the worker talks to Daraja so this request returns immediately
+        payment = Payment(
+            order_id=order.id,
             phone_number=phone_number,
             amount=order.total_amount,
-            account_reference=f'ORDER{order.id}',
-            transaction_desc=f'Payment for Order #{order.id}'
+            status='pending'
         )
+        db.session.add(payment)
+        db.session.flush()
+        job = enqueue(STK_PUSH_JOB, {'payment_id': payment.id})
         
-        if response['success']:
-            # Create payment record
-            payment = Payment(
-                order_id=order.id,
-                transaction_id=response['transaction_id'],
-                phone_number=phone_number,
-                amount=order.total_amount,
-                status='pending'
-            )
-            
-            db.session.add(payment)
-            db.session.commit()
-            
-            return jsonify({
-                'message': 'STK push initiated successfully (PLACEHOLDER)',
-                'checkout_request_id': response['checkout_request_id'],
-                'merchant_request_id': response['merchant_request_id'],
-                'transaction_id': response['transaction_id'],
-                'customer_message': response['customer_message']
-            }), 200
-        else:
-            return jsonify({'error': 'Failed to initiate payment'}), 500
+        # Hold the order's stock until the STK push can complete
+        extend_reservations(order.id, current_app.config['STOCK_RESERVATION_PAYMENT_TTL'])
+        db.session.commit()
+        run_eager(job)
+        
+        return jsonify({
+            'message': 'STK push queued. Check your phone to complete the payment.',
+            'payment': db.session.get(Payment, payment.id).to_dict()
+        }), 202
         
     except Exception as e:
         db.session.rollback()
@@ -67,36 +69,28 @@ def initiate_mpesa_payment():
 
 @payments_bp.route('/mpesa/callback', methods=['POST'])
 def mpesa_callback():
-    """M-Pesa payment callback (PLACEHOLDER)"""
+    """
+    M-Pesa STK callback
+    
+    With MPESA_CALLBACK_SECRET set, only requests to the callback URL given
+    to Daraja (carrying ?token=<secret>) are accepted; without it, each
+    callback is confirmed with Daraja before it settles anything.
+    """
+    secret = current_app.config.get('MPESA_CALLBACK_SECRET')
+    if secret and not hmac.compare_digest(request.args.get('token', ''), secret):
+        return jsonify({'ResultCode': 1, 'ResultDesc': 'Forbidden'}), 403
     try:
-        callback_data = request.get_json()
-        
-        # Process callback (PLACEHOLDER)
-        payment_info = mpesa_service.process_callback(callback_data)
+        # Recorded once per CheckoutRequestID; Daraja's retries are no-ops
+        outcome = handle_callback(request.get_json(silent=True), verified=bool(secret))
+        if outcome != 'duplicate':
+            db.session.commit()
+        if outcome == 'invalid':
+            return jsonify({'ResultCode': 1, 'ResultDesc': 'Missing CheckoutRequestID'}), 200
         
-        if payment_info['success']:
-            # Find payment by transaction ID or order ID
-            # This is simplified for placeholder
-            # In production, you'd extract the actual transaction ID from callback
-            
-            # Update payment status
-            # payment = Payment.query.filter_by(transaction_id=transaction_id).first()
-            # if payment:
-            #     payment.status = 'success'
-            #     payment.mpesa_receipt_number = payment_info['mpesa_receipt_number']
-            #     
-            #     # Update order payment status
-            #     order = Order.query.get(payment.order_id)
-            #     order.payment_status = 'completed'
-            #     order.status = 'processing'
-            #     
-            #     db.session.commit()
-            
-            return jsonify({'ResultCode': 0, 'ResultDesc': 'Success'}), 200
-        else:
-            return jsonify({'ResultCode': 1, 'ResultDesc': 'Failed'}), 200
+        return jsonify({'ResultCode': 0, 'ResultDesc': 'Accepted'}), 200
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({'ResultCode': 1, 'ResultDesc': str(e)}), 200
 
 
@@ -126,6 +120,112 @@ def check_payment_status(order_id):
         return jsonify({'error': str(e)}), 500
 
 
+def _order_status(order_id, user_id):
+    """Status summary streamed to clients, or None if the order is not the user's"""
+    row = (
+        db.session.query(Order.id, Order.payment_status, Order.status)
+        .filter_by(id=order_id, user_id=user_id)
+        .first()
+    )
+    db.session.close()  # never hold a pooled connection while the stream idles
+    if row is None:
+        return None
+    return {'order_id': row.id, 'payment_status': row.payment_status, 'order_status': row.status}
+
+
+def _settled(status):
+    return status['payment_status'] != 'pending' or status['order_status'] == 'cancelled'
+
+
+def _sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def _stream_tokens():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='payment-events')
+
+
+@payments_bp.route('/<int:order_id>/events/token', methods=['POST'])
+@jwt_required()
+def payment_events_token(order_id):
+    """
+    Short-lived token for one order's event stream
+    
+    EventSource cannot set headers, so the stream is opened with this token
+    in the URL instead of the access token: it is not a JWT, grants only
+    this order's stream and expires after SSE_TOKEN_TTL seconds, so a copy
+    in an access log is of little use.
+    """
+    user_id = get_jwt_identity()
+    if _order_status(order_id, user_id) is None:
+        return jsonify({'error': 'Order not found'}), 404
+    token = _stream_tokens().dumps({'user_id': user_id, 'order_id': order_id})
+    return jsonify({'token': token, 'expires_in': current_app.config['SSE_TOKEN_TTL']}), 200
+
+
+def _stream_user(order_id):
+    """The user opening a stream: ?token= from payment_events_token, else the Authorization header"""
+    token = request.args.get('token')
+    if token is None:
+        verify_jwt_in_request()
+        return get_jwt_identity()
+    try:
+        claims = _stream_tokens().loads(token, max_age=current_app.config['SSE_TOKEN_TTL'])
+    except BadSignature:  # expiry included
+        return None
+    return claims['user_id'] if claims.get('order_id') == order_id else None
+
+
+@payments_bp.route('/<int:order_id>/events', methods=['GET'])
+def payment_events(order_id):
+    """
+    Stream an order's payment outcome as Server-Sent Events
+    
+    Sends one `status` event as soon as the payment settles (or at once if it
+    already has) and closes. Opened with an Authorization header or a
+    ?token= from POST /events/token. While waiting, a keep-alive comment
+    every SSE_HEARTBEAT seconds doubles as a status re-check for settlements
+    this worker was not notified of.
+    """
+    user_id = _stream_user(order_id)
+    if user_id is None:
+        return jsonify({'error': 'Invalid or expired stream token'}), 401
+    config = current_app.config
+    
+    # Subscribe before reading the status so a settlement in between is not missed
+    subscription = event_broker.subscribe(f'order:{order_id}')
+    status = _order_status(order_id, user_id)
+    if status is None:
+        subscription.close()
+        return jsonify({'error': 'Order not found'}), 404
+    
+    def stream():
+        with subscription:
+            yield f"retry: {config['SSE_RETRY_MS']}\n\n"
+            if _settled(status):
+                yield _sse('status', status)
+                return
+            
+            deadline = time.monotonic() + config['SSE_MAX_DURATION']
+            while time.monotonic() < deadline:
+                event = subscription.get(timeout=config['SSE_HEARTBEAT'])
+                if event is None:
+                    current = _order_status(order_id, user_id)
+                    if current is not None and _settled(current):
+                        yield _sse('status', current)
+                        return
+                    yield ': keep-alive\n\n'
+                    continue
+                yield _sse('status', event)
+                return
+    
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @payments_bp.route('/mpesa/simulate-success/<int:order_id>', methods=['POST'])
 @jwt_required()
 def simulate_payment_success(order_id):
@@ -138,6 +238,9 @@ def simulate_payment_success(order_id):
         if not order:
             return jsonify({'error': 'Order not found'}), 404
         
+        # Paid orders keep their reserved stock
+        commit_reservations(order.id)
+        
         # Update order payment status
         order.payment_status = 'completed'
         order.status = 'processing'
@@ -148,6 +251,9 @@ def simulate_payment_success(order_id):
             payment.status = 'success'
             payment.mpesa_receipt_number = f'MPESA{order_id}TEST'
         
+        publish_status(order.id, 'completed', 'processing', {
+            'id': payment.id, 'status': 'success', 'mpesa_receipt_number': payment.mpesa_receipt_number
+        } if payment else None)
         db.session.commit()
         
         return jsonify({
@@ -155,6 +261,9 @@ def simulate_payment_success(order_id):
             'order': order.to_dict()
         }), 200
         
+    except InsufficientStock as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'product_ids': e.product_ids}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
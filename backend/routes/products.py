@@ -1,66 +1,153 @@
 from flask import Blueprint, request, jsonify
 from models import db, Product, Category
+from services.cache import catalog_cache
+from services.http_cache import conditional, catalog_validator
+from services.search import ranked_product_ids
+from services.facets import TRUE_VALUES, parse_filters, filter_conditions, facet_counts
+from services.catalog import (
+    product_query, paginate_products, products_response, product_response,
+    parse_fields, parse_limit, parse_sort
+)
 
 products_bp = Blueprint('products', __name__, url_prefix='/api/products')
 
 @products_bp.route('', methods=['GET'])
+@conditional(catalog_validator)
+@catalog_cache.cached
 def get_products():
-    """Get all products with optional category filter"""
+    """
+    Get products with optional category and attribute filters
+    
+    Query params:
+        category_id / category: Filter by category id or slug
+        min_price / max_price: Price bounds (inclusive)
+        colors / sizes: Comma-separated option values (any may match)
+        in_stock / featured: true or false
+        facets: true to include facet counts for the filtered listing
+        sort: newest (default), oldest, price_asc or price_desc
+        limit: Page size (capped by PRODUCTS_MAX_PAGE_SIZE)
+        cursor: Opaque cursor from a previous page's next_cursor
+        fields: Comma-separated fields to return (e.g. id,name,price,image_url)
+    """
     try:
         category_id = request.args.get('category_id', type=int)
         category_slug = request.args.get('category', type=str)
         
-        query = Product.query
+        try:
+            sort = parse_sort(request.args.get('sort'))
+            fields = parse_fields(request.args.get('fields'))
+            limit = parse_limit(request.args.get('limit', type=int))
+            filters = parse_filters(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
+        base = []
         if category_id:
-            query = query.filter_by(category_id=category_id)
+            base.append(Product.category_id == category_id)
         elif category_slug:
             category = Category.query.filter_by(slug=category_slug).first()
             if category:
-                query = query.filter_by(category_id=category.id)
+                base.append(Product.category_id == category.id)
         
-        products = query.all()
+        query = product_query(fields=fields, sort=sort).filter(*base, *filter_conditions(filters))
         
-        return jsonify({
-            'products': [product.to_dict() for product in products],
-            'count': len(products)
-        }), 200
+        try:
+            products, next_cursor = paginate_products(query, sort, request.args.get('cursor'), limit)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        extra = {}
+        if request.args.get('facets', '').lower() in TRUE_VALUES:
+            extra['facets'] = facet_counts(filters, base)
+        
+        return products_response(
+            products, fields,
+            count=len(products),
+            next_cursor=next_cursor,
+            has_more=next_cursor is not None,
+            **extra
+        ), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@products_bp.route('/search', methods=['GET'])
+@conditional(catalog_validator)
+@catalog_cache.cached
+def search_products():
+    """
+    Full-text product search, ranked by relevance with featured boosting
+    
+    Query params:
+        q: Search text; the last word is prefix-matched for type-ahead
+        category_id / category: Restrict to a category by id or slug
+        limit: Maximum results (capped by PRODUCTS_MAX_PAGE_SIZE)
+    """
+    try:
+        q = request.args.get('q', '', type=str).strip()
+        if not q:
+            return jsonify({'error': 'q is required'}), 400
+        
+        try:
+            limit = parse_limit(request.args.get('limit', type=int))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        category_id = request.args.get('category_id', type=int)
+        category_slug = request.args.get('category', type=str)
+        if not category_id and category_slug:
+            category = Category.query.filter_by(slug=category_slug).first()
+            if not category:
+                return products_response([], query=q, count=0), 200
+            category_id = category.id
+        
+        product_ids = ranked_product_ids(q, limit, category_id)
+        
+        products = product_query().filter(Product.id.in_(product_ids)).all() if product_ids else []
+        by_id = {product.id: product for product in products}
+        ranked = [by_id[product_id] for product_id in product_ids if product_id in by_id]
+        
+        return products_response(ranked, query=q, count=len(ranked)), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @products_bp.route('/<int:product_id>', methods=['GET'])
+@conditional(catalog_validator)
+@catalog_cache.cached
 def get_product(product_id):
     """Get product by ID"""
     try:
-        product = Product.query.get(product_id)
+        product = product_query().filter_by(id=product_id).first()
         
         if not product:
             return jsonify({'error': 'Product not found'}), 404
         
-        return jsonify({'product': product.to_dict()}), 200
+        return product_response(product), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @products_bp.route('/featured', methods=['GET'])
+@conditional(catalog_validator)
+@catalog_cache.cached
 def get_featured_products():
     """Get featured products"""
     try:
-        products = Product.query.filter_by(is_featured=True).all()
+        products = product_query().filter_by(is_featured=True).all()
         
-        return jsonify({
-            'products': [product.to_dict() for product in products],
-            'count': len(products)
-        }), 200
+        return products_response(products, count=len(products)), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @products_bp.route('/category/<slug>', methods=['GET'])
+@conditional(catalog_validator)
+@catalog_cache.cached
 def get_products_by_category(slug):
     """Get products by category slug"""
     try:
@@ -69,13 +156,9 @@ def get_products_by_category(slug):
         if not category:
             return jsonify({'error': 'Category not found'}), 404
         
-        products = Product.query.filter_by(category_id=category.id).all()
+        products = product_query().filter_by(category_id=category.id).all()
         
-        return jsonify({
-            'category': category.to_dict(),
-            'products': [product.to_dict() for product in products],
-            'count': len(products)
-        }), 200
+        return products_response(products, category=category.to_dict(), count=len(products)), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
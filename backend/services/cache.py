@@ -0,0 +1,397 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, current_app, request
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+# Tables whose writes invalidate the catalog cache
+CATALOG_TABLES = {'products', 'categories'}
+
+# Columns every checkout and reservation release writes. Updates touching only
+# these leave cached pages alone, so stock shown there can lag by up to
+# CATALOG_CACHE_TTL; checkout itself always takes stock from the row.
+STOCK_COLUMNS = {'stock', 'updated_at'}
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU cache with per-entry TTL"""
+    
+    def __init__(self, maxsize=512, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key):
+        """Return (found, value)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+    
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+    
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self):
+        return len(self._data)
+
+
+class MemoryStore:
+    """In-process stand-in for a shared cache store"""
+    
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] < time.time():
+                del self._data[key]
+                return None
+            return entry[1]
+    
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.time() + ttl if ttl else None, value)
+    
+    def incr(self, key, ttl=None):
+        """Add one to a counter; `ttl` applies when this starts a new one (missing or expired)"""
+        with self._lock:
+            expires_at, value = self._data.get(key, (None, 0))
+            if expires_at is not None and expires_at < time.time():
+                expires_at, value = None, 0
+            if not value and ttl:
+                expires_at = time.time() + ttl
+            value = int(value) + 1
+            self._data[key] = (expires_at, value)
+            return value
+
+
+class SQLiteStore:
+    """
+    Shared cache store backed by a SQLite file
+    
+    Every worker on the host opens the same file, so it stands in for a
+    network cache (e.g. Redis) in local development and benchmarks.
+    """
+    
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache_entries '
+            '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)'
+        )
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value FROM cache_entries WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+                (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+    
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, value, time.time() + ttl if ttl else None)
+            )
+    
+    def incr(self, key, ttl=None):
+        now = time.time()
+        with self._lock:
+            # One write transaction, so workers incrementing together each read their own count
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute(
+                    'INSERT INTO cache_entries (key, value, expires_at) VALUES (?, 1, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET '
+                    'value = CASE WHEN expires_at <= ? THEN 1 ELSE CAST(value AS INTEGER) + 1 END, '
+                    'expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END',
+                    (key, now + ttl if ttl else None, now, now)
+                )
+                value = int(self._conn.execute('SELECT value FROM cache_entries WHERE key = ?', (key,)).fetchone()[0])
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            return value
+
+
+class RedisStore:
+    """Shared cache store backed by Redis (requires the `redis` package)"""
+    
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+    
+    def get(self, key):
+        return self._client.get(key)
+    
+    def set(self, key, value, ttl=None):
+        self._client.set(key, value, ex=ttl)
+    
+    def incr(self, key, ttl=None):
+        value, remaining = self._client.pipeline().incr(key).pttl(key).execute()
+        if ttl and remaining < 0:  # a new counter (or one left without an expiry)
+            self._client.pexpire(key, max(1, int(ttl * 1000)))
+        return value
+
+
+def create_store(url):
+    """Build a shared store from a URL: memory://, sqlite:///path or redis://..."""
+    if not url:
+        return None
+    if url.startswith('memory://'):
+        return MemoryStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteStore(url[len('sqlite:///'):] or ':memory:')
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisStore(url)
+    raise ValueError(f'Unsupported cache store URL: {url}')
+
+
+class CatalogCache:
+    """
+    Two-tier cache for catalog responses
+    
+    Tier 1 is a per-worker LRU; tier 2 is an optional shared store. Entries
+    are keyed by a catalog version that is bumped whenever a transaction
+    writing products or categories commits, so stale entries are simply
+    never read again and age out of both tiers.
+    
+    `fragments` holds pre-rendered product JSON keyed by row versions (see
+    services/catalog.render_product); it survives catalog invalidation.
+    """
+    
+    VERSION_KEY = 'catalog:version'
+    
+    def __init__(self):
+        self.enabled = False
+        self.local = LRUCache()
+        self.fragments = LRUCache()
+        self.shared = None
+        self.ttl = 60
+        self.version_ttl = 1.0
+        self._version = 0
+        self._version_checked_at = 0.0
+        self.shared_hits = 0
+        self.shared_misses = 0
+        self.invalidations = 0
+    
+    def init_app(self, app):
+        """Initialize with app configuration"""
+        self.enabled = app.config.get('CATALOG_CACHE_ENABLED', True)
+        self.ttl = app.config.get('CATALOG_CACHE_TTL', 60)
+        self.version_ttl = app.config.get('CATALOG_CACHE_VERSION_TTL', 1.0)
+        self.local = LRUCache(app.config.get('CATALOG_CACHE_SIZE', 512), self.ttl)
+        self.fragments = LRUCache(
+            app.config.get('CATALOG_FRAGMENT_CACHE_SIZE', 10000),
+            app.config.get('CATALOG_FRAGMENT_CACHE_TTL', 3600)
+        )
+        self.shared = create_store(app.config.get('CATALOG_CACHE_SHARED_URL'))
+        self._version_checked_at = 0.0
+        _register_invalidation_events()
+    
+    def version(self):
+        """
+        Current catalog version
+        
+        With a shared store the version is re-read at most every
+        CATALOG_CACHE_VERSION_TTL seconds, which bounds how long another
+        worker's write can go unnoticed here.
+        """
+        if self.shared is not None and time.monotonic() - self._version_checked_at > self.version_ttl:
+            self._version = int(self.shared.get(self.VERSION_KEY) or 0)
+            self._version_checked_at = time.monotonic()
+        return self._version
+    
+    def get(self, key, version=None):
+        """
+        Return (found, value) for a catalog key
+        
+        Pass the `version` read before computing a value, and the same one to
+        set(): a value built from data read before a write then lands under
+        the version the write retired, never under the one that replaced it.
+        """
+        versioned_key = f'catalog:{self.version() if version is None else version}:{key}'
+        
+        found, value = self.local.get(versioned_key)
+        if found or self.shared is None:
+            return found, value
+        
+        raw = self.shared.get(versioned_key)
+        if raw is None:
+            self.shared_misses += 1
+            return False, None
+        
+        self.shared_hits += 1
+        value = json.loads(raw)
+        self.local.set(versioned_key, value)
+        return True, value
+    
+    def set(self, key, value, version=None):
+        versioned_key = f'catalog:{self.version() if version is None else version}:{key}'
+        self.local.set(versioned_key, value)
+        if self.shared is not None:
+            self.shared.set(versioned_key, json.dumps(value), self.ttl)
+    
+    def invalidate(self):
+        """Bump the catalog version and drop this worker's entries"""
+        self.invalidations += 1
+        if self.shared is not None:
+            self._version = int(self.shared.incr(self.VERSION_KEY))
+            self._version_checked_at = time.monotonic()
+        else:
+            self._version += 1
+        self.local.clear()
+    
+    def stats(self):
+        """Hit/miss/eviction counters for both tiers"""
+        return {
+            'enabled': self.enabled,
+            'version': self._version,
+            'local': {
+                'size': len(self.local),
+                'maxsize': self.local.maxsize,
+                'hits': self.local.hits,
+                'misses': self.local.misses,
+                'evictions': self.local.evictions,
+            },
+            'fragments': {
+                'size': len(self.fragments),
+                'maxsize': self.fragments.maxsize,
+                'hits': self.fragments.hits,
+                'misses': self.fragments.misses,
+                'evictions': self.fragments.evictions,
+            },
+            'shared': {
+                'backend': type(self.shared).__name__ if self.shared is not None else None,
+                'hits': self.shared_hits,
+                'misses': self.shared_misses,
+            },
+            'invalidations': self.invalidations,
+        }
+    
+    def cached(self, view):
+        """
+        Cache a catalog view's successful JSON response
+        
+        The key is the endpoint plus its sorted arguments, and the stored value
+        is the rendered body, so hits skip both the ORM and serialization.
+        """
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return view(*args, **kwargs)
+            
+            key, version = _request_key(), self.version()
+            found, body = self.get(key, version)
+            if found:
+                return Response(body, status=200, mimetype='application/json')
+            
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                self.set(key, response.get_data(as_text=True), version)
+            return response
+        
+        return wrapper
+
+
+def _request_key():
+    args = '&'.join(f'{key}={value}' for key, value in sorted(request.args.items(multi=True)))
+    view_args = ','.join(f'{key}={value}' for key, value in sorted((request.view_args or {}).items()))
+    return f'{request.endpoint}:{view_args}?{args}'
+
+
+def _table_name(statement):
+    table = getattr(statement, 'table', None)
+    return getattr(table, 'name', None)
+
+
+def _stock_only_update(statement):
+    """Whether a bulk UPDATE sets nothing but STOCK_COLUMNS"""
+    columns = {getattr(column, 'key', column) for column in getattr(statement, '_values', None) or ()}
+    return bool(columns) and columns <= STOCK_COLUMNS
+
+
+def _stock_only_change(instance):
+    """Whether a flushed instance changed nothing but STOCK_COLUMNS"""
+    return all(attr.key in STOCK_COLUMNS for attr in inspect(instance).attrs if attr.history.has_changes())
+
+
+def _on_after_flush(session, flush_context):
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if getattr(instance, '__tablename__', None) in CATALOG_TABLES:
+            if instance in session.dirty and _stock_only_change(instance):
+                continue
+            session.info['catalog_dirty'] = True
+            return
+
+
+def _on_orm_execute(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        statement = orm_execute_state.statement
+        if _table_name(statement) in CATALOG_TABLES:
+            if orm_execute_state.is_update and _stock_only_update(statement):
+                return
+            orm_execute_state.session.info['catalog_dirty'] = True
+
+
+def _on_after_commit(session):
+    if session.info.pop('catalog_dirty', False):
+        catalog_cache.invalidate()
+
+
+def _on_after_rollback(session):
+    session.info.pop('catalog_dirty', None)
+
+
+_events_registered = False
+
+
+def _register_invalidation_events():
+    global _events_registered
+    if _events_registered:
+        return
+    event.listen(Session, 'after_flush', _on_after_flush)
+    event.listen(Session, 'do_orm_execute', _on_orm_execute)
+    event.listen(Session, 'after_commit', _on_after_commit)
+    event.listen(Session, 'after_rollback', _on_after_rollback)
+    _events_registered = True
+
+
+# Create singleton instance
+catalog_cache = CatalogCache()
@@ -0,0 +1,296 @@
+from flask import current_app
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects.postgresql import insert as postgres_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Cart, CartItem, Product
+from services.catalog import product_details
+
+# Cart response shapes: full nests Product.to_dict() in every line (legacy),
+# compact returns lines with unit prices, delta only the changed line
+CART_VIEWS = ('full', 'compact', 'delta')
+
+BATCH_OPERATIONS = ('add', 'update', 'remove')
+
+# INSERT ... ON CONFLICT per dialect, against the index a cart line is unique on
+UPSERT_INSERTS = {'postgresql': postgres_insert, 'sqlite': sqlite_insert}
+LINE_INDEX = next(index for index in CartItem.__table__.indexes if index.name == 'uq_cart_items_line')
+
+
+class ProductNotFound(LookupError):
+    """Raised when a batch references products that do not exist"""
+    
+    def __init__(self, ids):
+        self.ids = sorted(ids)
+        super().__init__(f'Product(s) not found: {", ".join(map(str, self.ids))}')
+
+
+class CartItemNotFound(LookupError):
+    """Raised when a batch references lines that are not in the user's cart"""
+    
+    def __init__(self, ids):
+        self.ids = sorted(ids)
+        super().__init__(f'Cart item(s) not found: {", ".join(map(str, self.ids))}')
+
+
+def parse_view(raw, default='full'):
+    """Validate a `view=` value"""
+    view = raw or default
+    if view not in CART_VIEWS:
+        raise ValueError(f"view must be one of: {', '.join(CART_VIEWS)}")
+    return view
+
+
+def get_or_create_cart(user_id):
+    """The user's cart, created (and flushed) if they have none yet"""
+    cart = Cart.query.filter_by(user_id=user_id).first()
+    if not cart:
+        cart = Cart(user_id=user_id, version=0)
+        db.session.add(cart)
+        db.session.flush()
+    return cart
+
+
+def bump_version(cart_id):
+    """Increment the cart version in the database and return the new value"""
+    table = Cart.__table__
+    stmt = table.update().where(table.c.id == cart_id).values(version=table.c.version + 1)
+    if db.session.get_bind().dialect.update_returning:
+        return db.session.execute(stmt.returning(table.c.version)).scalar_one()
+    db.session.execute(stmt)
+    return db.session.execute(select(table.c.version).where(table.c.id == cart_id)).scalar_one()
+
+
+def cart_line(item_id, product_id, quantity, unit_price, selected_color=None, selected_size=None):
+    """Compact representation of one cart line"""
+    return {
+        'id': item_id,
+        'product_id': product_id,
+        'quantity': quantity,
+        'selected_color': selected_color,
+        'selected_size': selected_size,
+        'unit_price': unit_price,
+        'subtotal': unit_price * quantity,
+    }
+
+
+def line_key(product_id, selected_color, selected_size):
+    """What a cart line is unique on: uq_cart_items_line treats missing options as ''"""
+    return product_id, selected_color or '', selected_size or ''
+
+
+def add_lines(cart_id, lines):
+    """
+    Insert cart lines, adding to the quantity of a line the cart already has
+    
+    `lines` maps (product_id, selected_color, selected_size) to a quantity.
+    On PostgreSQL and SQLite this is one INSERT ... ON CONFLICT DO UPDATE on
+    uq_cart_items_line, so a line another request inserted meanwhile is
+    summed into rather than duplicated.
+    
+    Returns:
+        list: (id, quantity) of each line written, in no particular order
+    """
+    table = CartItem.__table__
+    insert = UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+    rows = [
+        {
+            'cart_id': cart_id,
+            'product_id': product_id,
+            'quantity': quantity,
+            'selected_color': selected_color,
+            'selected_size': selected_size,
+        }
+        for (product_id, selected_color, selected_size), quantity in lines.items()
+    ]
+    if insert is None:
+        statement = table.insert().values(rows)
+    else:
+        statement = insert(table).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=LINE_INDEX.expressions,
+            set_={'quantity': table.c.quantity + statement.excluded.quantity},
+        )
+    return db.session.execute(statement.returning(table.c.id, table.c.quantity)).all()
+
+
+def cart_totals(cart_id):
+    """(item_count, total) for a cart, aggregated in the database"""
+    item_count, total = db.session.execute(
+        select(func.coalesce(func.sum(CartItem.quantity), 0), func.coalesce(func.sum(CartItem.quantity * Product.price), 0))
+        .join(Product, Product.id == CartItem.product_id)
+        .where(CartItem.cart_id == cart_id)
+    ).one()
+    return int(item_count), float(total)
+
+
+def compact_cart(cart_id, version, expand=False):
+    """
+    Cart as lines of ids, quantities and prices from a single joined query
+    
+    Takes the cart's id and version rather than the Cart so callers that
+    just bumped the version need not reload the row. With expand=True, full
+    product details for the lines are attached under 'products', served
+    from the catalog cache rather than re-serialized.
+    """
+    rows = db.session.execute(
+        select(
+            CartItem.id, CartItem.product_id, CartItem.quantity,
+            CartItem.selected_color, CartItem.selected_size, Product.price
+        )
+        .join(Product, Product.id == CartItem.product_id)
+        .where(CartItem.cart_id == cart_id)
+        .order_by(CartItem.id)
+    ).all()
+    
+    items = [
+        cart_line(row.id, row.product_id, row.quantity, row.price, row.selected_color, row.selected_size)
+        for row in rows
+    ]
+    result = {
+        'id': cart_id,
+        'version': version,
+        'items': items,
+        'item_count': sum(item['quantity'] for item in items),
+        'total': sum(item['subtotal'] for item in items),
+    }
+    if expand:
+        details = product_details(item['product_id'] for item in items)
+        result['products'] = {str(product_id): product for product_id, product in details.items()}
+    return result
+
+
+def cart_delta(cart_id, version, line=None, removed=None, product=None):
+    """
+    Only what changed: the touched line (or the id of a removed one) and new totals
+    
+    `product` attaches the line's product details when the client may not
+    have them yet (a newly added product).
+    """
+    item_count, total = cart_totals(cart_id)
+    delta = {
+        'id': cart_id,
+        'version': version,
+        'line': line,
+        'removed': removed,
+        'item_count': item_count,
+        'total': total,
+    }
+    if product is not None:
+        delta['product'] = product
+    return delta
+
+
+def _int(operation, key, default=None):
+    value = operation.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f'{key} must be an integer')
+    return value
+
+
+def parse_operations(data):
+    """
+    Validate a batch body: {"operations": [{"op": "add"|"update"|"remove", ...}]}
+    
+    add takes product_id, quantity (default 1), selected_color, selected_size;
+    update takes item_id and quantity (<= 0 removes the line); remove takes
+    item_id. Raises ValueError naming the first invalid operation.
+    """
+    operations = (data or {}).get('operations')
+    if not isinstance(operations, list) or not operations:
+        raise ValueError('operations must be a non-empty list')
+    
+    limit = current_app.config.get('CART_BATCH_MAX_OPERATIONS', 100)
+    if len(operations) > limit:
+        raise ValueError(f'At most {limit} operations per batch')
+    
+    parsed = []
+    for index, operation in enumerate(operations):
+        try:
+            if not isinstance(operation, dict) or operation.get('op') not in BATCH_OPERATIONS:
+                raise ValueError(f"op must be one of: {', '.join(BATCH_OPERATIONS)}")
+            op = operation['op']
+            if op == 'add':
+                quantity = _int(operation, 'quantity', 1)
+                if quantity < 1:
+                    raise ValueError('quantity must be at least 1')
+                parsed.append({
+                    'op': op,
+                    'product_id': _int(operation, 'product_id'),
+                    'quantity': quantity,
+                    'selected_color': operation.get('selected_color'),
+                    'selected_size': operation.get('selected_size'),
+                })
+            elif op == 'update':
+                parsed.append({'op': op, 'item_id': _int(operation, 'item_id'), 'quantity': _int(operation, 'quantity')})
+            else:
+                parsed.append({'op': op, 'item_id': _int(operation, 'item_id')})
+        except ValueError as e:
+            raise ValueError(f'operations[{index}]: {e}')
+    return parsed
+
+
+def apply_operations(cart, operations):
+    """
+    Apply parsed batch operations to a cart inside the current transaction
+    
+    The cart version is bumped first, which also takes the cart row lock so
+    concurrent batches on one cart apply in turn. Product ids are validated
+    together (catalog cache, one IN query on miss) and the cart's lines are
+    read once; the operations are then folded in memory and written back with
+    at most one DELETE, one UPDATE and one multi-row upsert (add_lines),
+    whatever the number of operations. Raises ProductNotFound or CartItemNotFound before
+    anything is written.
+    
+    Returns:
+        int: the new cart version
+    """
+    version = bump_version(cart.id)
+    
+    product_ids = {operation['product_id'] for operation in operations if operation['op'] == 'add'}
+    missing = product_ids - set(product_details(product_ids)) if product_ids else set()
+    if missing:
+        raise ProductNotFound(missing)
+    
+    rows = db.session.execute(
+        select(CartItem.id, CartItem.product_id, CartItem.quantity, CartItem.selected_color, CartItem.selected_size)
+        .where(CartItem.cart_id == cart.id)
+    ).all()
+    quantities = {row.id: row.quantity for row in rows}
+    by_key = {line_key(row.product_id, row.selected_color, row.selected_size): row.id for row in rows}
+    
+    unknown = {operation['item_id'] for operation in operations if operation['op'] != 'add'} - set(quantities)
+    if unknown:
+        raise CartItemNotFound(unknown)
+    
+    new_lines, removed = {}, set()
+    for operation in operations:
+        if operation['op'] == 'add':
+            line = (operation['product_id'], operation['selected_color'], operation['selected_size'])
+            key = line_key(*line)
+            item_id = by_key.get(key)
+            if item_id is not None and item_id not in removed:
+                quantities[item_id] += operation['quantity']
+            else:
+                # Keyed as the unique index sees lines; the first add's options are stored
+                first, quantity = new_lines.get(key, (line, 0))
+                new_lines[key] = first, quantity + operation['quantity']
+        elif operation['op'] == 'update' and operation['quantity'] > 0 and operation['item_id'] not in removed:
+            quantities[operation['item_id']] = operation['quantity']
+        else:
+            removed.add(operation['item_id'])
+    
+    table = CartItem.__table__
+    if removed:
+        db.session.execute(table.delete().where(table.c.id.in_(removed)))
+    
+    changed = {row.id: quantities[row.id] for row in rows if row.id not in removed and quantities[row.id] != row.quantity}
+    if changed:
+        db.session.execute(
+            table.update()
+            .where(table.c.id.in_(changed))
+            .values(quantity=case(changed, value=table.c.id))
+        )
+    
+    if new_lines:
+        add_lines(cart.id, dict(new_lines.values()))
+    return version
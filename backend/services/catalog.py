@@ -0,0 +1,260 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from flask import current_app, request
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload, selectinload, lazyload, load_only
+from models import Product
+from services.cache import catalog_cache
+
+# Loader options available for Product.category
+LOADER_OPTIONS = {
+    'joined': joinedload,
+    'selectin': selectinload,
+    'lazy': lazyload,
+}
+
+# Sort options: (key column, tiebreaker column, descending)
+SORT_OPTIONS = {
+    'newest': (Product.created_at, Product.id, True),
+    'oldest': (Product.created_at, Product.id, False),
+    'price_asc': (Product.price, Product.id, False),
+    'price_desc': (Product.price, Product.id, True),
+}
+
+DEFAULT_SORT = 'newest'
+
+
+# Field serializers for projected responses (see Product.to_dict)
+PRODUCT_FIELDS = {
+    'id': lambda p: p.id,
+    'sku': lambda p: p.sku,
+    'name': lambda p: p.name,
+    'description': lambda p: p.description,
+    'price': lambda p: p.price,
+    'old_price': lambda p: p.old_price,
+    'category_id': lambda p: p.category_id,
+    'category': lambda p: p.category.to_dict() if p.category else None,
+    'image_url': lambda p: p.image_url,
+    'additional_images': lambda p: p.additional_images or [],
+    'stock': lambda p: p.stock,
+    'color_options': lambda p: p.color_options or [],
+    'size_options': lambda p: p.size_options or [],
+    'is_featured': lambda p: p.is_featured,
+    'created_at': lambda p: p.created_at.isoformat(),
+}
+
+# Columns each projected field needs loaded
+FIELD_COLUMNS = {
+    field: (Product.category_id if field == 'category' else getattr(Product, field))
+    for field in PRODUCT_FIELDS
+}
+
+
+def loader_strategy(endpoint=None):
+    """Resolve the category loader strategy configured for an endpoint"""
+    endpoint = endpoint or request.endpoint
+    strategies = current_app.config.get('CATALOG_LOADER_STRATEGIES', {})
+    strategy = strategies.get(endpoint, current_app.config.get('CATALOG_DEFAULT_LOADER', 'joined'))
+    
+    if strategy not in LOADER_OPTIONS:
+        raise ValueError(f'Unknown catalog loader strategy: {strategy}')
+    
+    return strategy
+
+
+def product_query(strategy=None, fields=None, sort=None):
+    """
+    Product query with the category relationship eagerly loaded
+    
+    Product.to_dict() touches self.category, so listing endpoints must load
+    it up front; otherwise every product costs an extra SELECT.
+    
+    Args:
+        strategy: 'joined', 'selectin' or 'lazy'; defaults to the strategy
+            configured for the current endpoint
+        fields: Optional list of projected fields; only their columns (plus
+            the sort keys) are loaded, and category is skipped unless asked for
+        sort: Sort option whose key columns must be loaded for cursors
+    
+    Returns:
+        Query: Product query with loader options applied
+    """
+    query = Product.query
+    
+    if fields is not None:
+        columns = {Product.id} | {FIELD_COLUMNS[field] for field in fields}
+        if sort:
+            columns.add(SORT_OPTIONS[sort][0])
+        query = query.options(load_only(*columns))
+        if 'category' not in fields:
+            return query
+    
+    strategy = strategy or loader_strategy()
+    return query.options(LOADER_OPTIONS[strategy](Product.category))
+
+
+def parse_fields(raw):
+    """Parse a comma-separated `fields=` value; None means all fields"""
+    if not raw:
+        return None
+    
+    fields = [field.strip() for field in raw.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in PRODUCT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    
+    return fields
+
+
+def parse_sort(raw):
+    """Validate a `sort=` value"""
+    sort = raw or DEFAULT_SORT
+    if sort not in SORT_OPTIONS:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_OPTIONS)}")
+    return sort
+
+
+def parse_limit(raw):
+    """Clamp a `limit=` value to the configured page size bounds"""
+    default = current_app.config.get('PRODUCTS_PAGE_SIZE', 24)
+    maximum = current_app.config.get('PRODUCTS_MAX_PAGE_SIZE', 100)
+    
+    if raw is None:
+        return default
+    if raw < 1:
+        raise ValueError('limit must be a positive integer')
+    
+    return min(raw, maximum)
+
+
+def serialize_product(product, fields=None):
+    """Serialize a product, limited to `fields` when given"""
+    if fields is None:
+        return product.to_dict()
+    return {field: PRODUCT_FIELDS[field](product) for field in fields}
+
+
+def render_product(product):
+    """
+    Pre-rendered JSON for a fully serialized product
+    
+    Fragments are keyed by the product's and its category's updated_at, so
+    any write (ORM or bulk UPDATE, which both bump updated_at) renders a new
+    fragment on the next read instead of serving a stale one.
+    """
+    category = product.category
+    key = (product.id, product.updated_at, category.updated_at if category else None)
+    
+    found, fragment = catalog_cache.fragments.get(key)
+    if not found:
+        fragment = json.dumps(product.to_dict(), separators=(',', ':'))
+        catalog_cache.fragments.set(key, fragment)
+    return fragment
+
+
+def product_details(product_ids):
+    """
+    Fully serialized products by id, served from the catalog cache
+    
+    Cache misses are loaded together with a single IN query. Entries live
+    under the catalog version, so any catalog write retires them; stock
+    changes at checkout do not (see services/cache.STOCK_COLUMNS).
+    
+    Returns:
+        dict: product id -> product dict (unknown ids are omitted)
+    """
+    details, missing = {}, []
+    version = catalog_cache.version()
+    for product_id in dict.fromkeys(product_ids):
+        found, value = catalog_cache.get(f'product:{product_id}', version) if catalog_cache.enabled else (False, None)
+        if found:
+            details[product_id] = value
+        else:
+            missing.append(product_id)
+    
+    if missing:
+        for product in product_query('joined').filter(Product.id.in_(missing)):
+            details[product.id] = product.to_dict()
+            if catalog_cache.enabled:
+                catalog_cache.set(f'product:{product.id}', details[product.id], version)
+    return details
+
+
+def products_response(products, fields=None, **extra):
+    """
+    JSON response for a product listing
+    
+    Full listings splice cached per-product fragments into the body rather
+    than rebuilding and re-encoding every product dict.
+    """
+    if fields is None:
+        items = ','.join(render_product(product) for product in products)
+    else:
+        items = ','.join(json.dumps(serialize_product(product, fields), separators=(',', ':')) for product in products)
+    
+    parts = [f'"products":[{items}]']
+    parts.extend(f'{json.dumps(key)}:{json.dumps(value, separators=(",", ":"))}' for key, value in extra.items())
+    return current_app.response_class('{' + ','.join(parts) + '}', mimetype='application/json')
+
+
+def product_response(product):
+    """JSON response for a single product using its cached fragment"""
+    return current_app.response_class('{"product":' + render_product(product) + '}', mimetype='application/json')
+
+
+def encode_cursor(sort, product):
+    """Encode the keyset position after `product` as an opaque cursor"""
+    key_column = SORT_OPTIONS[sort][0]
+    key = getattr(product, key_column.key)
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    
+    payload = json.dumps({'s': sort, 'k': key, 'id': product.id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(sort, cursor):
+    """Decode a cursor into (key, id) for the given sort"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key, product_id = payload['k'], int(payload['id'])
+        if payload['s'] != sort:
+            raise ValueError('Cursor does not match sort order')
+        if SORT_OPTIONS[sort][0] is Product.created_at:
+            key = datetime.fromisoformat(key)
+        return key, product_id
+    except (binascii.Error, KeyError, TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'Invalid cursor: {e}')
+
+
+def paginate_products(query, sort, cursor=None, limit=24):
+    """
+    Keyset-paginate a product query
+    
+    Seeks past the cursor with a row-value comparison on (key, id) so every
+    page is an index range scan instead of an OFFSET over earlier rows.
+    
+    Returns:
+        tuple: (products on this page, cursor for the next page or None)
+    """
+    key_column, id_column, descending = SORT_OPTIONS[sort]
+    
+    if cursor:
+        key, product_id = decode_cursor(sort, cursor)
+        position, bound = tuple_(key_column, id_column), tuple_(key, product_id)
+        query = query.filter(position < bound if descending else position > bound)
+    
+    if descending:
+        query = query.order_by(key_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(key_column.asc(), id_column.asc())
+    
+    products = query.limit(limit + 1).all()
+    has_more = len(products) > limit
+    products = products[:limit]
+    
+    next_cursor = encode_cursor(sort, products[-1]) if has_more else None
+    return products, next_cursor
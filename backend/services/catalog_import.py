@@ -0,0 +1,245 @@
+import csv
+import gzip
+import json
+import sys
+import time
+from datetime import datetime
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.postgresql import insert as postgres_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Category, Product, ProductAttribute, product_attribute_rows
+
+REQUIRED_FIELDS = ('sku', 'name', 'price', 'category', 'image_url')
+
+# Separator for list cells (additional_images, color_options, size_options) in CSV
+LIST_SEPARATOR = '|'
+
+# INSERT ... ON CONFLICT per dialect
+UPSERT_INSERTS = {'postgresql': postgres_insert, 'sqlite': sqlite_insert}
+
+# Columns a re-import overwrites; created_at keeps the first import's time
+UPDATE_COLUMNS = (
+    'name', 'description', 'price', 'old_price', 'category_id', 'image_url', 'additional_images',
+    'stock', 'color_options', 'size_options', 'is_featured', 'updated_at',
+)
+
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+
+class RowError(ValueError):
+    """A source row that cannot be imported"""
+
+
+def read_catalog(path, fmt=None):
+    """
+    Yield rows from a CSV or JSON Lines file one at a time
+    
+    `path` may end in .gz, or be '-' for stdin (then `fmt` is required).
+    JSON Lines rows that do not parse are yielded as the raw line so the
+    importer can report them instead of aborting the import.
+    """
+    name = path[:-3] if path.endswith('.gz') else path
+    fmt = fmt or FORMATS.get(name[name.rfind('.'):].lower())
+    if fmt not in ('csv', 'jsonl'):
+        raise ValueError(f'Cannot tell the format of {path}; pass csv or jsonl')
+    
+    if path == '-':
+        stream = sys.stdin
+    elif path.endswith('.gz'):
+        stream = gzip.open(path, 'rt', encoding='utf-8-sig', newline='')
+    else:
+        stream = open(path, encoding='utf-8-sig', newline='')
+    
+    try:
+        if fmt == 'csv':
+            yield from csv.DictReader(stream)
+            return
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield line
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _string(values, field, max_length):
+    value = values.get(field)
+    if _blank(value):
+        return None
+    value = str(value).strip()
+    if len(value) > max_length:
+        raise RowError(f'{field} longer than {max_length} characters')
+    return value
+
+
+def _number(values, field, kind):
+    value = values.get(field)
+    if _blank(value):
+        return None
+    try:
+        number = kind(float(value)) if kind is int else kind(value)
+    except (TypeError, ValueError):
+        raise RowError(f'{field} is not a number: {value!r}')
+    if number < 0:
+        raise RowError(f'{field} is negative')
+    return number
+
+
+def _list(value):
+    if _blank(value):
+        return []
+    if isinstance(value, str):
+        value = value.split(LIST_SEPARATOR)
+    return [str(item).strip() for item in value if not _blank(item)]
+
+
+def _flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y')
+    return bool(value)
+
+
+class CatalogImporter:
+    """
+    Streams products into the catalog in batches, upserting on SKU
+    
+    Rows are consumed one at a time and written every `batch_size` rows with
+    one INSERT ... ON CONFLICT (sku) DO UPDATE, so memory is bounded by the
+    batch whatever the size of the input, and re-importing a feed refreshes
+    existing products in place. Categories are resolved by slug from a map
+    loaded once; an unknown slug is created with `create_categories` and
+    otherwise skips the row. Each batch commits on its own so an interrupted
+    import can simply be re-run. Invalid rows are counted and skipped, with
+    the first `max_errors` reasons kept for the report.
+    """
+    
+    def __init__(self, batch_size=1000, create_categories=False, max_errors=100, progress=None):
+        self.batch_size = batch_size
+        self.create_categories = create_categories
+        self.max_errors = max_errors
+        self.progress = progress
+        self.categories = {}
+        self.errors = []
+        self.stats = {'rows': 0, 'upserted': 0, 'skipped': 0, 'batches': 0, 'categories_created': 0}
+        self._start = None
+    
+    def run(self, rows):
+        """Import an iterable of row dicts; returns the report (see `report`)"""
+        dialect = db.engine.dialect.name
+        if dialect not in UPSERT_INSERTS:
+            raise ValueError(f'Catalog import supports PostgreSQL and SQLite, not {dialect}')
+        
+        self._start = time.perf_counter()
+        self.categories = dict(db.session.execute(select(Category.slug, Category.id)).all())
+        batch = {}
+        for number, row in enumerate(rows, 1):
+            self.stats['rows'] += 1
+            try:
+                product = self.parse_row(row)
+            except RowError as error:
+                self.stats['skipped'] += 1
+                if len(self.errors) < self.max_errors:
+                    self.errors.append(f'row {number}: {error}')
+                continue
+            batch[product['sku']] = product  # a SKU repeated within a batch: the last row wins
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = {}
+        if batch:
+            self.write(batch)
+        return self.report()
+    
+    def parse_row(self, row):
+        """Product column values for one source row, or RowError"""
+        if not isinstance(row, dict):
+            raise RowError('not a JSON object')
+        values = {key.strip().lower(): value for key, value in row.items() if isinstance(key, str)}
+        missing = [field for field in REQUIRED_FIELDS if _blank(values.get(field))]
+        if missing:
+            raise RowError(f'missing {", ".join(missing)}')
+        
+        now = datetime.utcnow()
+        product = {
+            'sku': _string(values, 'sku', 64),
+            'name': _string(values, 'name', 200),
+            'description': _string(values, 'description', 10000),
+            'price': _number(values, 'price', float),
+            'old_price': _number(values, 'old_price', float),
+            'image_url': _string(values, 'image_url', 255),
+            'additional_images': _list(values.get('additional_images')),
+            'stock': _number(values, 'stock', int) or 0,
+            'color_options': _list(values.get('color_options')),
+            'size_options': _list(values.get('size_options')),
+            'is_featured': _flag(values.get('is_featured')),
+            'created_at': now,
+            'updated_at': now,
+        }
+        
+        # Resolved last so a row that fails validation never creates a category
+        slug = _string(values, 'category', 50).lower()
+        product['category_id'] = self.categories.get(slug)
+        if product['category_id'] is None:
+            product['category_id'] = self.add_category(slug, _string(values, 'category_name', 50))
+        return product
+    
+    def add_category(self, slug, name=None):
+        if not self.create_categories:
+            raise RowError(f'unknown category {slug!r}')
+        name = name or slug.replace('-', ' ').title()
+        category_id = db.session.execute(
+            insert(Category).values(name=name, slug=slug).returning(Category.id)
+        ).scalar_one()
+        self.categories[slug] = category_id
+        self.stats['categories_created'] += 1
+        return category_id
+    
+    def write(self, batch):
+        """Upsert one batch of products, re-mirror their options and commit"""
+        products = Product.__table__
+        statement = UPSERT_INSERTS[db.engine.dialect.name](products)
+        statement = statement.on_conflict_do_update(
+            index_elements=[products.c.sku],
+            set_={column: statement.excluded[column] for column in UPDATE_COLUMNS},
+        ).returning(products.c.sku, products.c.id)
+        rows = list(batch.values())
+        ids = dict(db.session.execute(statement, rows).all())
+        
+        # Core upserts bypass the Product mapper events that keep product_attributes in sync
+        attributes = ProductAttribute.__table__
+        db.session.execute(attributes.delete().where(attributes.c.product_id.in_(list(ids.values()))))
+        attribute_rows = [
+            attribute
+            for product in rows
+            for attribute in product_attribute_rows(ids[product['sku']], product['color_options'], product['size_options'])
+        ]
+        if attribute_rows:
+            db.session.execute(attributes.insert(), attribute_rows)
+        db.session.commit()
+        
+        self.stats['upserted'] += len(rows)
+        self.stats['batches'] += 1
+        if self.progress:
+            self.progress(self.report())
+    
+    def report(self):
+        """Counters so far, elapsed seconds, throughput and the kept row errors"""
+        seconds = time.perf_counter() - self._start
+        return {
+            **self.stats,
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(self.stats['rows'] / seconds, 1) if seconds else 0.0,
+            'errors': list(self.errors),
+        }
+
+
+def import_catalog(rows, **options):
+    """Import `rows` with a CatalogImporter (see its options); must be called inside an app context"""
+    return CatalogImporter(**options).run(rows)
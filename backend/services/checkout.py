@@ -0,0 +1,94 @@
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload, selectinload
+from models import db, Cart, CartItem, Order, OrderItem, Product
+from services.inventory import reserve_stock
+
+DEFAULT_DELIVERY_FEE = 500.0
+
+
+class EmptyCart(Exception):
+    """Raised when checking out a cart with no lines"""
+
+
+def cart_lines(user_id):
+    """
+    The user's cart lines joined to current product prices, in one query
+    
+    Returns (cart_id, lines) where each line is a row with product_id,
+    quantity, selected_color, selected_size and price.
+    """
+    cart_id = (
+        select(func.min(Cart.id)).where(Cart.user_id == user_id).scalar_subquery()
+    )
+    lines = db.session.execute(
+        select(
+            CartItem.cart_id,
+            CartItem.product_id,
+            CartItem.quantity,
+            CartItem.selected_color,
+            CartItem.selected_size,
+            Product.price,
+        )
+        .join(Product, Product.id == CartItem.product_id)
+        .where(CartItem.cart_id == cart_id)
+        .order_by(CartItem.id)
+    ).all()
+    return (lines[0].cart_id if lines else None), lines
+
+
+def place_order(user_id, details):
+    """
+    Turn the user's cart into an order inside the current transaction
+    
+    The whole checkout is a fixed number of statements regardless of cart
+    size: load the lines with their prices, insert the order, reserve stock,
+    bulk-insert the order items and delete the cart lines. The caller commits;
+    InsufficientStock, EmptyCart or ValueError (a line quantity below 1) leave
+    the transaction for it to roll back.
+    """
+    cart_id, lines = cart_lines(user_id)
+    if not lines:
+        raise EmptyCart('Cart is empty')
+    
+    subtotal = sum(line.price * line.quantity for line in lines)
+    delivery_fee = details.get('delivery_fee', DEFAULT_DELIVERY_FEE)
+    
+    order = Order(
+        user_id=user_id,
+        total_amount=subtotal + delivery_fee,
+        delivery_fee=delivery_fee,
+        phone_number=details['phone_number'],
+        full_name=details['full_name'],
+        county=details['county'],
+        town=details['town'],
+        address=details['address'],
+        payment_method=details.get('payment_method', 'mpesa')
+    )
+    db.session.add(order)
+    db.session.flush()
+    
+    reserve_stock(order.id, [(line.product_id, line.quantity) for line in lines])
+    
+    db.session.execute(OrderItem.__table__.insert().values([
+        {
+            'order_id': order.id,
+            'product_id': line.product_id,
+            'quantity': line.quantity,
+            'price': line.price,
+            'selected_color': line.selected_color,
+            'selected_size': line.selected_size,
+        }
+        for line in lines
+    ]))
+    db.session.execute(CartItem.__table__.delete().where(CartItem.__table__.c.cart_id == cart_id))
+    return order.id
+
+
+def load_order(order_id):
+    """Order with its items, products and categories loaded for to_dict()"""
+    return (
+        Order.query
+        .options(selectinload(Order.items).joinedload(OrderItem.product).joinedload(Product.category))
+        .filter_by(id=order_id)
+        .one()
+    )
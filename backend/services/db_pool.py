@@ -0,0 +1,183 @@
+import threading
+import time
+from collections import deque
+from flask import jsonify
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import NullPool, QueuePool
+from profiles import resolve_profile
+
+
+class PoolMetrics:
+    """Per-process connection pool counters and recent checkout waits"""
+    
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=window)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+    
+    def reset(self):
+        with self._lock:
+            self._waits.clear()
+            self.checkouts = self.timeouts = self.connects = self.invalidations = 0
+    
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+    
+    def record_wait(self, seconds, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self._waits.append(seconds * 1000)
+    
+    def snapshot(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            counters = {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+            }
+        
+        def pct(p):
+            return round(waits[min(len(waits) - 1, int(p / 100 * len(waits)))], 3) if waits else 0.0
+        
+        counters['checkout_wait_ms'] = {'p50': pct(50), 'p95': pct(95), 'p99': pct(99), 'max': pct(100)}
+        return counters
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+    
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            entry = super()._do_get()
+        except PoolTimeout:
+            pool_metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_metrics.record_wait(time.perf_counter() - start)
+        return entry
+
+
+def _is_memory_sqlite(uri):
+    return uri in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in uri
+
+
+def engine_options(config, profile=None):
+    """
+    SQLAlchemy engine options for this deployment
+    
+    Pool size defaults to one connection per request a worker can run at
+    once (capped by DB_POOL_SIZE_MAX), and DB_MAX_CONNECTIONS bounds the
+    total across all gunicorn workers so scaling workers cannot exhaust the
+    server's connection slots. Connections are pre-pinged and recycled so
+    idle periods on managed PostgreSQL do not surface as stale-connection
+    errors. With DB_PGBOUNCER the pooler owns the connections: the app pool
+    is disabled and no startup parameters are sent.
+    """
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    if _is_memory_sqlite(uri):
+        return {}
+    
+    options = {'pool_pre_ping': config.get('DB_POOL_PRE_PING', True)}
+    is_postgres = uri.startswith('postgres')
+    
+    if is_postgres and config.get('DB_PGBOUNCER'):
+        options['poolclass'] = NullPool
+        options['connect_args'] = {'connect_timeout': config.get('DB_CONNECT_TIMEOUT', 5)}
+        return options
+    
+    profile = profile or resolve_profile()
+    pool_size = config.get('DB_POOL_SIZE') or min(profile['concurrency'], config.get('DB_POOL_SIZE_MAX', 10))
+    max_overflow = config.get('DB_MAX_OVERFLOW')
+    if max_overflow is None:
+        max_overflow = min(max(profile['concurrency'] - pool_size, 0), pool_size)
+    
+    budget = config.get('DB_MAX_CONNECTIONS')
+    if budget:
+        per_worker = max(1, budget // profile['workers'])
+        pool_size = min(pool_size, per_worker)
+        max_overflow = max(0, min(max_overflow, per_worker - pool_size))
+    
+    options.update({
+        'poolclass': TimedQueuePool,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 10),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_use_lifo': True,  # idle extras age out instead of being kept warm round-robin
+    })
+    
+    if is_postgres:
+        connect_args = {'connect_timeout': config.get('DB_CONNECT_TIMEOUT', 5)}
+        timeout = config.get('DB_STATEMENT_TIMEOUT_MS')
+        if timeout:
+            connect_args['options'] = f'-c statement_timeout={int(timeout)}'
+        options['connect_args'] = connect_args
+    return options
+
+
+def configure_engine(app):
+    """Merge the derived engine options under any explicit SQLALCHEMY_ENGINE_OPTIONS (before db.init_app)"""
+    options = engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def init_app(app):
+    """Attach pool counters (and PgBouncer's per-transaction statement timeout) to the app's engine"""
+    from models import db
+    
+    @app.errorhandler(PoolTimeout)
+    def pool_exhausted(error):
+        # Every connection stayed busy for DB_POOL_TIMEOUT: shed the request rather than queue it further
+        response = jsonify({'error': 'Service busy, please retry'})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    
+    with app.app_context():
+        engine = db.engine
+    
+    @event.listens_for(engine, 'connect')
+    def count_connect(dbapi_connection, connection_record):
+        pool_metrics.count('connects')
+    
+    @event.listens_for(engine, 'invalidate')
+    def count_invalidation(dbapi_connection, connection_record, exception):
+        pool_metrics.count('invalidations')
+    
+    timeout = app.config.get('DB_STATEMENT_TIMEOUT_MS')
+    if app.config.get('DB_PGBOUNCER') and timeout and engine.dialect.name == 'postgresql':
+        # Transaction pooling rejects startup options and shares server
+        # sessions, so the timeout is scoped to each transaction instead
+        @event.listens_for(engine, 'begin')
+        def set_statement_timeout(connection):
+            connection.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout)}')
+
+
+def pool_stats(engine):
+    """Pool configuration, current usage and checkout-wait metrics for this worker"""
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'max_overflow': pool._max_overflow,
+            'in_use': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'timeout': pool.timeout(),
+        })
+    stats.update(pool_metrics.snapshot())
+    return stats
@@ -0,0 +1,282 @@
+import json
+import queue
+import select
+import sqlite3
+import threading
+import time
+from sqlalchemy import create_engine, event, func
+from sqlalchemy import select as sql_select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+# PostgreSQL NOTIFY channel shared by every worker
+NOTIFY_CHANNEL = 'app_events'
+
+
+class Subscription:
+    """A subscriber's queue of events on one channel"""
+    
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.queue = queue.Queue()
+    
+    def get(self, timeout=None):
+        """Next event, or None after `timeout` seconds"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+    
+    def close(self):
+        self.broker.unsubscribe(self)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class LocalBackend:
+    """In-process only: events reach subscribers in the publishing worker"""
+    
+    def publish(self, session, channel, data):
+        session.info.setdefault('pending_events', []).append((channel, data))
+    
+    def flush(self, broker, events):
+        for channel, data in events:
+            broker.fan_out(channel, data)
+    
+    def start(self, broker):
+        pass
+
+
+class SQLiteBackend:
+    """
+    Cross-worker events through a SQLite file
+    
+    Committed events are appended to a table that every worker on the host
+    polls every EVENTS_POLL_INTERVAL seconds; a stand-in for LISTEN/NOTIFY in
+    local development and benchmarks.
+    """
+    
+    def __init__(self, path, poll_interval=0.25, retention=60):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS events '
+            '(id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, data TEXT NOT NULL, created_at REAL NOT NULL)'
+        )
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def publish(self, session, channel, data):
+        session.info.setdefault('pending_events', []).append((channel, data))
+    
+    def flush(self, broker, events):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                'INSERT INTO events (channel, data, created_at) VALUES (?, ?, ?)',
+                [(channel, json.dumps(data), now) for channel, data in events]
+            )
+            self._conn.execute('DELETE FROM events WHERE created_at < ?', (now - self.retention,))
+    
+    def start(self, broker):
+        if self._thread is not None:
+            return
+        with self._lock:
+            last_id = self._conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+        self._thread = threading.Thread(target=self._listen, args=(broker, last_id), daemon=True)
+        self._thread.start()
+    
+    def _listen(self, broker, last_id):
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    'SELECT id, channel, data FROM events WHERE id > ? ORDER BY id', (last_id,)
+                ).fetchall()
+            for last_id, channel, data in rows:
+                broker.fan_out(channel, json.loads(data))
+            time.sleep(self.poll_interval)
+
+
+class PostgresBackend:
+    """
+    Cross-worker events with PostgreSQL LISTEN/NOTIFY
+    
+    NOTIFY is issued inside the publishing transaction, so the database
+    delivers it to every listening worker (this one included) only if the
+    transaction commits. Each worker holds one dedicated LISTEN connection
+    outside the pool; behind a transaction-pooling PgBouncer, where LISTEN
+    does not work, give EVENTS_URL the direct server URL for it.
+    """
+    
+    def __init__(self, app, listen_url=None, reconnect_delay=1.0):
+        self.app = app
+        self.listen_url = listen_url
+        self.reconnect_delay = reconnect_delay
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def publish(self, session, channel, data):
+        payload = json.dumps({'channel': channel, 'data': data})
+        session.execute(sql_select(func.pg_notify(NOTIFY_CHANNEL, payload)))
+    
+    def flush(self, broker, events):
+        pass
+    
+    def start(self, broker):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, args=(broker,), daemon=True)
+                self._thread.start()
+    
+    def _connect(self):
+        from models import db
+        
+        if self.listen_url:
+            connection = create_engine(self.listen_url, poolclass=NullPool).raw_connection()
+        else:
+            with self.app.app_context():
+                connection = db.engine.raw_connection()
+        connection.detach()
+        dbapi_connection = connection.driver_connection
+        dbapi_connection.autocommit = True
+        dbapi_connection.cursor().execute(f'LISTEN {NOTIFY_CHANNEL}')
+        return dbapi_connection
+    
+    def _listen(self, broker):
+        while True:
+            try:
+                connection = self._connect()
+                while True:
+                    if select.select([connection], [], [], 5.0) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        message = json.loads(notify.payload)
+                        broker.fan_out(message['channel'], message['data'])
+            except Exception:
+                self.app.logger.exception('Event listener connection lost; reconnecting')
+                time.sleep(self.reconnect_delay)
+
+
+def create_backend(url, app):
+    """Build an event backend: memory://, sqlite:///path, postgres:// (the app database), postgres://host/db or '' for auto"""
+    if not url:
+        url = 'postgres://' if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres') else 'memory://'
+    if url.startswith('memory://'):
+        return LocalBackend()
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):], app.config.get('EVENTS_POLL_INTERVAL', 0.25))
+    if url.startswith(('postgres://', 'postgresql://')):
+        scheme, _, rest = url.partition('://')
+        listen_url = f'postgresql://{rest}' if rest else None
+        return PostgresBackend(app, listen_url)
+    raise ValueError(f'Unsupported event backend URL: {url}')
+
+
+class EventBroker:
+    """
+    Publish/subscribe for application events (e.g. payment status changes)
+    
+    Subscribers in this worker get a Subscription queue per channel; events
+    published inside a transaction are delivered only once it commits, and
+    reach other workers through the configured backend.
+    """
+    
+    def __init__(self):
+        self.backend = LocalBackend()
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+    
+    def init_app(self, app):
+        """Initialize with app configuration"""
+        self.backend = create_backend(app.config.get('EVENTS_URL'), app)
+        _register_session_events()
+    
+    def subscribe(self, channel):
+        # The listener starts on first use, so nothing connects at import or fork time
+        self.backend.start(self)
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+    
+    def publish(self, channel, data):
+        """Publish `data` on `channel` when the current transaction commits"""
+        from models import db
+        
+        session = db.session()
+        if not session.in_transaction():
+            session.begin()  # so a rollback before any SQL still discards the event
+        self.published += 1
+        self.backend.publish(session, channel, data)
+    
+    def fan_out(self, channel, data):
+        """Deliver an event to this worker's subscribers"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.queue.put(data)
+        self.delivered += len(subscribers)
+    
+    def stats(self):
+        with self._lock:
+            channels = len(self._subscribers)
+            subscribers = sum(len(s) for s in self._subscribers.values())
+        return {
+            'backend': type(self.backend).__name__,
+            'channels': channels,
+            'subscribers': subscribers,
+            'published': self.published,
+            'delivered': self.delivered,
+        }
+
+
+def _on_after_commit(session):
+    # Releasing a savepoint also fires after_commit; wait for the real commit
+    if session.in_nested_transaction():
+        return
+    events = session.info.pop('pending_events', None)
+    if events:
+        event_broker.backend.flush(event_broker, events)
+
+
+def _on_after_soft_rollback(session, previous_transaction):
+    # Fires even when nothing reached the database yet; savepoints keep theirs
+    if not previous_transaction.nested:
+        session.info.pop('pending_events', None)
+
+
+_events_registered = False
+
+
+def _register_session_events():
+    global _events_registered
+    if _events_registered:
+        return
+    event.listen(Session, 'after_commit', _on_after_commit)
+    event.listen(Session, 'after_soft_rollback', _on_after_soft_rollback)
+    _events_registered = True
+
+
+# Create singleton instance
+event_broker = EventBroker()
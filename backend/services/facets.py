@@ -0,0 +1,152 @@
+from flask import current_app
+from sqlalchemy import and_, case, exists, func, true
+from sqlalchemy.orm import aliased
+from models import db, Product, ProductAttribute
+
+TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+
+
+def _parse_list(raw):
+    return [value.strip() for value in raw.split(',') if value.strip()] if raw else []
+
+
+def _parse_bool(raw):
+    return None if raw is None else raw.strip().lower() in TRUE_VALUES
+
+
+def parse_filters(args):
+    """
+    Parse the product filter grammar from query args
+    
+    min_price / max_price: numeric bounds (inclusive)
+    colors / sizes: comma-separated values; a product matches any of them
+    in_stock / featured: true or false
+    """
+    filters = {
+        'min_price': args.get('min_price', type=float),
+        'max_price': args.get('max_price', type=float),
+        'colors': _parse_list(args.get('colors')),
+        'sizes': _parse_list(args.get('sizes')),
+        'in_stock': _parse_bool(args.get('in_stock')),
+        'featured': _parse_bool(args.get('featured')),
+    }
+    for bound in ('min_price', 'max_price'):
+        if args.get(bound) is not None and filters[bound] is None:
+            raise ValueError(f'{bound} must be a number')
+    return filters
+
+
+def _has_attribute(kind, values):
+    attribute = aliased(ProductAttribute)
+    return exists().where(
+        attribute.product_id == Product.id,
+        attribute.kind == kind,
+        attribute.value.in_(values)
+    ).correlate(Product)
+
+
+def _price_condition(filters):
+    conditions = []
+    if filters['min_price'] is not None:
+        conditions.append(Product.price >= filters['min_price'])
+    if filters['max_price'] is not None:
+        conditions.append(Product.price <= filters['max_price'])
+    return and_(*conditions) if conditions else None
+
+
+def _stock_condition(filters):
+    if filters['in_stock'] is None:
+        return None
+    return Product.stock > 0 if filters['in_stock'] else func.coalesce(Product.stock, 0) <= 0
+
+
+def _featured_condition(filters):
+    if filters['featured'] is None:
+        return None
+    return Product.is_featured.is_(filters['featured'])
+
+
+def filter_conditions(filters, exclude=()):
+    """SQL conditions for `filters`, leaving out the dimensions in `exclude`"""
+    conditions = []
+    if 'price' not in exclude:
+        conditions.append(_price_condition(filters))
+    if 'colors' not in exclude and filters['colors']:
+        conditions.append(_has_attribute('color', filters['colors']))
+    if 'sizes' not in exclude and filters['sizes']:
+        conditions.append(_has_attribute('size', filters['sizes']))
+    if 'in_stock' not in exclude:
+        conditions.append(_stock_condition(filters))
+    if 'featured' not in exclude:
+        conditions.append(_featured_condition(filters))
+    return [condition for condition in conditions if condition is not None]
+
+
+def _attribute_counts(kind, base, filters, exclude):
+    rows = db.session.query(ProductAttribute.value, func.count(ProductAttribute.product_id)) \
+        .join(Product, Product.id == ProductAttribute.product_id) \
+        .filter(ProductAttribute.kind == kind, *base, *filter_conditions(filters, exclude={exclude})) \
+        .group_by(ProductAttribute.value) \
+        .order_by(func.count(ProductAttribute.product_id).desc(), ProductAttribute.value) \
+        .all()
+    return [{'value': value, 'count': count} for value, count in rows]
+
+
+def _when(*conditions):
+    conditions = [condition for condition in conditions if condition is not None]
+    return and_(*conditions) if conditions else true()
+
+
+def facet_counts(filters, base=()):
+    """
+    Facet counts for a product listing, computed in the database
+    
+    Counts are disjunctive: each facet applies every active filter except
+    its own, so shoppers see how many results selecting another value would
+    give. Colors and sizes are grouped over product_attributes; the price,
+    stock and featured facets share one aggregate pass using CASE sums.
+    
+    Args:
+        filters: Parsed filters (see parse_filters)
+        base: Conditions that are not facets (e.g. the category)
+    
+    Returns:
+        dict: colors, sizes, price (min/max/buckets), in_stock and featured
+    """
+    price = _price_condition(filters)
+    stock = _stock_condition(filters)
+    featured = _featured_condition(filters)
+    
+    for_price = _when(stock, featured)
+    edges = current_app.config.get('PRICE_FACET_BUCKETS', [0, 1000, 2500, 5000, 10000])
+    buckets = list(zip(edges, edges[1:] + [None]))
+    
+    columns = [
+        func.min(case((for_price, Product.price))),
+        func.max(case((for_price, Product.price))),
+        func.sum(case((and_(_when(price, featured), Product.stock > 0), 1), else_=0)),
+        func.sum(case((and_(_when(price, stock), Product.is_featured.is_(True)), 1), else_=0)),
+    ]
+    for low, high in buckets:
+        in_bucket = Product.price >= low if high is None else and_(Product.price >= low, Product.price < high)
+        columns.append(func.sum(case((and_(for_price, in_bucket), 1), else_=0)))
+    
+    summary = db.session.query(*columns).filter(
+        *base, *filter_conditions(filters, exclude={'price', 'in_stock', 'featured'})
+    ).one()
+    min_price, max_price, in_stock_count, featured_count = summary[:4]
+    
+    return {
+        'colors': _attribute_counts('color', base, filters, 'colors'),
+        'sizes': _attribute_counts('size', base, filters, 'sizes'),
+        'price': {
+            'min': min_price,
+            'max': max_price,
+            'buckets': [
+                {'min': low, 'max': high, 'count': count or 0}
+                for (low, high), count in zip(buckets, summary[4:])
+            ],
+        },
+        'in_stock': in_stock_count or 0,
+        'featured': featured_count or 0,
+    }
@@ -0,0 +1,125 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import func
+from models import db, Category, Order, OrderItem, Product
+from services.cache import catalog_cache
+
+
+def _make_etag(*parts):
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def _as_utc(value):
+    return value.replace(tzinfo=timezone.utc) if value is not None else None
+
+
+def catalog_validator(**view_args):
+    """
+    (etag, last_modified) for the whole catalog, shared by every catalog read
+    
+    Built from MAX(updated_at) and row counts, which are served from the
+    updated_at indexes, and memoized in the catalog cache so it is recomputed
+    only after a catalog write.
+    """
+    version = catalog_cache.version()
+    found, validator = catalog_cache.get('validator', version)
+    if found:
+        return validator['etag'], datetime.fromisoformat(validator['last_modified'])
+    
+    products_updated, product_count = db.session.query(
+        func.max(Product.updated_at), func.count(Product.id)
+    ).one()
+    categories_updated, category_count = db.session.query(
+        func.max(Category.updated_at), func.count(Category.id)
+    ).one()
+    
+    last_modified = max(filter(None, [products_updated, categories_updated]), default=datetime(1970, 1, 1))
+    last_modified = _as_utc(last_modified).replace(microsecond=0)
+    etag = _make_etag('catalog', products_updated, product_count, categories_updated, category_count)
+    
+    catalog_cache.set('validator', {'etag': etag, 'last_modified': last_modified.isoformat()}, version)
+    return etag, last_modified
+
+
+def orders_validator(order_id=None):
+    """
+    (etag, last_modified) for the current user's orders, or a single order
+    
+    Orders embed their items' products and categories, so the validator
+    covers those rows' updated_at too, in the same query.
+    """
+    user_id = get_jwt_identity()
+    query = (
+        db.session.query(
+            func.max(Order.updated_at), func.count(func.distinct(Order.id)),
+            func.max(Product.updated_at), func.max(Category.updated_at)
+        )
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+        .outerjoin(Product, Product.id == OrderItem.product_id)
+        .outerjoin(Category, Category.id == Product.category_id)
+        .filter(Order.user_id == user_id)
+    )
+    if order_id is not None:
+        query = query.filter(Order.id == order_id)
+    
+    updated_at, count, products_updated, categories_updated = query.one()
+    if updated_at is None:
+        return None, None
+    
+    last_modified = max(filter(None, [updated_at, products_updated, categories_updated]))
+    last_modified = _as_utc(last_modified).replace(microsecond=0)
+    etag = _make_etag('orders', user_id, order_id, updated_at, count, products_updated, categories_updated)
+    return etag, last_modified
+
+
+def _not_modified(etag, last_modified):
+    if_none_match = request.if_none_match
+    if if_none_match:
+        return etag is not None and if_none_match.contains_weak(etag.removeprefix('W/').strip('"'))
+    
+    if_modified_since = request.if_modified_since
+    return last_modified is not None and if_modified_since is not None and last_modified <= if_modified_since
+
+
+def conditional(validator):
+    """
+    Answer conditional GETs with 304 before the view runs
+    
+    `validator` receives the view's URL arguments and returns (etag, last_modified);
+    a None etag skips validation (e.g. the resource does not exist).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag, last_modified = validator(**kwargs)
+            
+            if etag is not None and _not_modified(etag, last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or etag is None:
+                    return response
+            
+            response.headers['ETag'] = etag
+            if last_modified is not None:
+                response.last_modified = last_modified
+            return response
+        
+        return wrapper
+    
+    return decorator
+
+
+def apply_cache_control(response):
+    """after_request hook applying CACHE_CONTROL_POLICIES by blueprint"""
+    if request.method not in ('GET', 'HEAD') or 'Cache-Control' in response.headers:
+        return response
+    
+    policy = current_app.config.get('CACHE_CONTROL_POLICIES', {}).get(request.blueprint)
+    if policy and response.status_code in (200, 304):
+        response.headers['Cache-Control'] = policy
+    return response
@@ -0,0 +1,158 @@
+from flask import g
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from services.cache import LRUCache
+
+_UNSET = object()
+
+
+class ClaimsCache:
+    """
+    Per-worker cache of user claims (the fields of User.to_dict())
+    
+    Entries live for IDENTITY_CACHE_TTL seconds. Committing a change to a
+    user (profile or password) or deleting one drops that entry in this
+    worker at once; other workers pick the change up when their entry
+    expires, so the TTL bounds how stale a profile can be anywhere.
+    """
+    
+    def __init__(self):
+        self.enabled = True
+        self.entries = LRUCache()
+        self.invalidations = 0
+    
+    def init_app(self, app):
+        """Initialize with app configuration"""
+        self.enabled = app.config.get('IDENTITY_CACHE_ENABLED', True)
+        self.entries = LRUCache(app.config.get('IDENTITY_CACHE_SIZE', 10000), app.config.get('IDENTITY_CACHE_TTL', 30))
+        app.before_request(_reset_identity)
+        _register_invalidation_events()
+    
+    def get(self, user_id):
+        """Claims for `user_id`, or None if there is no such user"""
+        from models import db, User
+        
+        if self.enabled:
+            found, claims = self.entries.get(user_id)
+            if found:
+                return claims
+        
+        user = db.session.get(User, user_id)
+        claims = user.to_dict() if user is not None else None
+        if self.enabled and claims is not None:
+            self.entries.set(user_id, claims)
+        return claims
+    
+    def invalidate(self, user_ids=None):
+        """Drop the given users' claims (all of them when None)"""
+        self.invalidations += 1
+        if user_ids is None:
+            self.entries.clear()
+            return
+        for user_id in user_ids:
+            self.entries.delete(user_id)
+    
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'size': len(self.entries),
+            'maxsize': self.entries.maxsize,
+            'ttl': self.entries.ttl,
+            'hits': self.entries.hits,
+            'misses': self.entries.misses,
+            'invalidations': self.invalidations,
+        }
+
+
+class RequestIdentity:
+    """
+    The signed-in user of one request, resolved once and shared by its callers
+    
+    `claims` come from the claims cache; the User row and the user's cart are
+    loaded on first use and reused for the rest of the request.
+    """
+    
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._claims = _UNSET
+        self._cart = _UNSET
+    
+    @property
+    def claims(self):
+        """The user's public fields, or None if the account no longer exists"""
+        if self._claims is _UNSET:
+            self._claims = claims_cache.get(self.user_id)
+        return self._claims
+    
+    @property
+    def user(self):
+        from models import db, User
+        
+        return db.session.get(User, self.user_id)
+    
+    def cart(self, create=False):
+        """The user's cart; with create=True one is created (and flushed) if they have none"""
+        from models import Cart
+        from services.cart import get_or_create_cart
+        
+        if self._cart is _UNSET or (create and self._cart is None):
+            self._cart = get_or_create_cart(self.user_id) if create else Cart.query.filter_by(user_id=self.user_id).first()
+        return self._cart
+
+
+def current_identity():
+    """RequestIdentity for the JWT verified on this request (inside @jwt_required views)"""
+    identity = g.get('identity')
+    if identity is None:
+        identity = g.identity = RequestIdentity(get_jwt_identity())
+    return identity
+
+
+def _reset_identity():
+    # g outlives the request when the app context was pushed by the caller
+    g.pop('identity', None)
+
+
+def _on_after_flush(session, flush_context):
+    for instance in (*session.dirty, *session.deleted):
+        if getattr(instance, '__tablename__', None) == 'users':
+            session.info.setdefault('identity_dirty', set()).add(instance.id)
+
+
+def _on_orm_execute(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if getattr(table, 'name', None) == 'users':
+            orm_execute_state.session.info['identity_dirty_all'] = True
+
+
+def _on_after_commit(session):
+    user_ids = session.info.pop('identity_dirty', None)
+    if session.info.pop('identity_dirty_all', False):
+        claims_cache.invalidate()
+    elif user_ids:
+        claims_cache.invalidate(user_ids)
+
+
+def _on_after_rollback(session):
+    session.info.pop('identity_dirty', None)
+    session.info.pop('identity_dirty_all', None)
+
+
+_events_registered = False
+
+
+def _register_invalidation_events():
+    global _events_registered
+    if _events_registered:
+        return
+    event.listen(Session, 'after_flush', _on_after_flush)
+    event.listen(Session, 'do_orm_execute', _on_orm_execute)
+    event.listen(Session, 'after_commit', _on_after_commit)
+    event.listen(Session, 'after_rollback', _on_after_rollback)
+    _events_registered = True
+
+
+# Create singleton instance
+claims_cache = ClaimsCache()
@@ -0,0 +1,296 @@
+import hmac
+import re
+import threading
+import time
+from flask import Response, abort, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SQL_DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+_LITERALS = [
+    (re.compile(r'^\s*SELECT\s(?:(?!SELECT).)+?\sFROM\s', re.S | re.I), 'SELECT ... FROM '),  # the column list
+    (re.compile(r"'(?:[^']|'')*'"), '?'),  # string literals
+    (re.compile(r'%\(\w+\)s|(?<!:):\w+\b|\$\d+|%s'), '?'),  # parameters in any paramstyle
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),  # numbers
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)'), '(...)'),  # IN lists and multi-row VALUES
+    (re.compile(r'(?:\(\.\.\.\)\s*,\s*)+\(\.\.\.\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+# Credentials some clients can only send in the URL (EventSource stream tokens, legacy ?jwt=)
+_SECRET_PARAMS = re.compile(r'([?&](?:token|jwt|access_token)=)[^&\s]*', re.I)
+
+
+def redact_query(url):
+    """`url` (a path, query string or request line) with credential parameters replaced by ***"""
+    return _SECRET_PARAMS.sub(r'\1***', url)
+
+
+def normalize_statement(statement, limit=500):
+    """SQL with literals and parameters replaced by ?, so repeats of one query group together"""
+    for pattern, replacement in _LITERALS:
+        statement = pattern.sub(replacement, statement)
+    statement = statement.strip()
+    return statement if len(statement) <= limit else statement[:limit] + '...'
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram, one series per label tuple"""
+    
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.series = {}
+    
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, **extra):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in [*zip(names, values), *extra.items()])
+
+
+class RequestTiming:
+    """Wall time, SQL statement count and SQL time of the current request"""
+    
+    __slots__ = ('start', 'queries', 'sql_seconds')
+    
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+
+class Instrumentation:
+    """
+    Per-request timing, SQL counts and slow-query log for this worker
+    
+    Every request is recorded in per-route histograms served in the
+    Prometheus text format at /api/metrics and, with SERVER_TIMING_ENABLED,
+    gets a Server-Timing header (total, SQL time and statement count). Statements slower than SLOW_QUERY_MS and
+    requests slower than SLOW_REQUEST_MS are logged; slow statements are
+    also aggregated by their normalized text (literals and parameters
+    replaced by ?) for /api/health/slow-queries. Cursor events are counted on
+    every engine, replicas included. Streamed responses are timed until
+    their headers are sent. Both endpoints require METRICS_TOKEN as a Bearer
+    token; without one they only answer in debug mode.
+    """
+    
+    def __init__(self):
+        self.enabled = False
+        self.server_timing = False
+        self.slow_query_ms = 100.0
+        self.slow_request_ms = 1000.0
+        self.metrics_token = ''
+        self.max_slow_statements = 200
+        self.app = None
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def init_app(self, app):
+        """Initialize with app configuration"""
+        self.enabled = app.config.get('INSTRUMENTATION_ENABLED', True)
+        self.server_timing = app.config.get('SERVER_TIMING_ENABLED', False)
+        self.slow_query_ms = app.config.get('SLOW_QUERY_MS', 100)
+        self.slow_request_ms = app.config.get('SLOW_REQUEST_MS', 1000)
+        self.metrics_token = app.config.get('METRICS_TOKEN', '')
+        self.max_slow_statements = app.config.get('SLOW_QUERY_STATEMENTS', 200)
+        self.app = app
+        self.reset()
+        if self.enabled:
+            app.before_request(_start_request)
+            app.after_request(_finish_request)
+            _register_cursor_events()
+    
+    def reset(self):
+        """Drop every recorded metric"""
+        with self._lock:
+            self.requests = {}
+            self.durations = Histogram(DURATION_BUCKETS)
+            self.query_counts = Histogram(QUERY_BUCKETS)
+            self.sql_durations = Histogram(SQL_DURATION_BUCKETS)
+            self.slow_queries = 0
+            self.slow_requests = 0
+            self.slow_statements = {}
+    
+    def record_query(self, statement, seconds):
+        timing = g.get('request_timing') if has_app_context() else None
+        if timing is not None:
+            timing.queries += 1
+            timing.sql_seconds += seconds
+        if seconds * 1000 < self.slow_query_ms:
+            return
+        
+        normalized = normalize_statement(statement)
+        route = _route() if timing is not None else '(no request)'
+        self.app.logger.warning('Slow query (%.1f ms) in %s: %s', seconds * 1000, route, normalized)
+        with self._lock:
+            self.slow_queries += 1
+            entry = self.slow_statements.get(normalized)
+            if entry is None:
+                if len(self.slow_statements) >= self.max_slow_statements:
+                    return
+                entry = self.slow_statements[normalized] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'route': route}
+            entry['count'] += 1
+            entry['total_ms'] += seconds * 1000
+            entry['max_ms'] = max(entry['max_ms'], seconds * 1000)
+    
+    def record_request(self, response, timing):
+        elapsed = time.perf_counter() - timing.start
+        route = _route()
+        labels = (request.method, route)
+        with self._lock:
+            key = (*labels, str(response.status_code))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.durations.observe(labels, elapsed)
+            self.query_counts.observe(labels, timing.queries)
+            self.sql_durations.observe(labels, timing.sql_seconds)
+            if elapsed * 1000 >= self.slow_request_ms:
+                self.slow_requests += 1
+        if elapsed * 1000 >= self.slow_request_ms:
+            self.app.logger.warning('Slow request (%.1f ms, %d queries, %.1f ms SQL): %s %s',
+                                    elapsed * 1000, timing.queries, timing.sql_seconds * 1000, request.method, redact_query(request.full_path.rstrip('?')))
+        if self.server_timing:
+            response.headers['Server-Timing'] = (
+                f'db;desc="{timing.queries} queries";dur={timing.sql_seconds * 1000:.2f}, '
+                f'app;dur={(elapsed - timing.sql_seconds) * 1000:.2f}, total;dur={elapsed * 1000:.2f}'
+            )
+    
+    def top_slow_queries(self, limit=20):
+        """Slow statements, most total time first"""
+        with self._lock:
+            entries = [{'statement': statement, **entry} for statement, entry in self.slow_statements.items()]
+        entries.sort(key=lambda entry: entry['total_ms'], reverse=True)
+        for entry in entries[:limit]:
+            entry['total_ms'] = round(entry['total_ms'], 3)
+            entry['max_ms'] = round(entry['max_ms'], 3)
+        return {'threshold_ms': self.slow_query_ms, 'slow_queries': self.slow_queries, 'statements': entries[:limit]}
+    
+    def render(self):
+        """This worker's metrics in the Prometheus text exposition format"""
+        from models import db
+        from services.db_pool import pool_stats
+        from services.ratelimit import rate_limiter
+        
+        lines = []
+        
+        def metric(name, kind, description):
+            lines.extend([f'# HELP {name} {description}', f'# TYPE {name} {kind}'])
+        
+        def histogram(name, description, data, label_names):
+            metric(name, 'histogram', description)
+            for labels, (buckets, total, count) in sorted(data.series.items()):
+                for bound, value in zip(data.buckets, buckets):
+                    lines.append(f'{name}_bucket{{{_labels(label_names, labels, le=bound)}}} {value}')
+                lines.append(f'{name}_bucket{{{_labels(label_names, labels, le="+Inf")}}} {count}')
+                lines.append(f'{name}_sum{{{_labels(label_names, labels)}}} {total:.6f}')
+                lines.append(f'{name}_count{{{_labels(label_names, labels)}}} {count}')
+        
+        with self._lock:
+            metric('http_requests_total', 'counter', 'Requests by method, route and status code')
+            for labels, count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{{_labels(("method", "route", "status"), labels)}}} {count}')
+            histogram('http_request_duration_seconds', 'Request wall time until the response headers',
+                      self.durations, ('method', 'route'))
+            histogram('http_request_sql_queries', 'SQL statements executed per request',
+                      self.query_counts, ('method', 'route'))
+            histogram('http_request_sql_duration_seconds', 'Time spent in SQL per request',
+                      self.sql_durations, ('method', 'route'))
+            metric('sql_slow_queries_total', 'counter', f'Statements slower than {self.slow_query_ms} ms')
+            lines.append(f'sql_slow_queries_total {self.slow_queries}')
+            metric('http_slow_requests_total', 'counter', f'Requests slower than {self.slow_request_ms} ms')
+            lines.append(f'http_slow_requests_total {self.slow_requests}')
+        
+        metric('rate_limit_requests_total', 'counter', 'Requests checked against a rate limit policy')
+        for name, policy in sorted(rate_limiter.stats()['policies'].items()):
+            for outcome in ('allowed', 'rejected'):
+                lines.append(f'rate_limit_requests_total{{{_labels(("policy", "outcome"), (name, outcome))}}} {policy[outcome]}')
+        
+        pool = pool_stats(db.engine)
+        metric('db_pool_checkouts_total', 'counter', 'Connections checked out of the pool')
+        lines.append(f'db_pool_checkouts_total {pool["checkouts"]}')
+        metric('db_pool_timeouts_total', 'counter', 'Checkouts that gave up after DB_POOL_TIMEOUT')
+        lines.append(f'db_pool_timeouts_total {pool["timeouts"]}')
+        if 'in_use' in pool:
+            metric('db_pool_connections_in_use', 'gauge', 'Connections currently checked out')
+            lines.append(f'db_pool_connections_in_use {pool["in_use"]}')
+        return '\n'.join(lines) + '\n'
+    
+    def authorize(self):
+        """
+        Abort unless the request may read metrics
+        
+        A Bearer token matching METRICS_TOKEN is required; with no token
+        configured the endpoints are closed (403) except in debug mode.
+        """
+        if not self.metrics_token:
+            if not self.app.debug:
+                abort(403)
+            return
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(supplied.encode(), self.metrics_token.encode()):
+            abort(401)
+    
+    def metrics_view(self):
+        """Response for GET /api/metrics"""
+        self.authorize()
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _route():
+    # The URL rule keeps the label set bounded: /api/products/<int:product_id>, not each id
+    return request.url_rule.rule if request.url_rule is not None else '(unmatched)'
+
+
+def _start_request():
+    g.request_timing = RequestTiming()
+
+
+def _finish_request(response):
+    # g outlives the request when the app context was pushed by the caller
+    timing = g.pop('request_timing', None)
+    if timing is not None:
+        instrumentation.record_request(response, timing)
+    return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context, so a statement that fails leaves no start time behind
+    if instrumentation.enabled and context is not None:
+        context.query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, 'query_start', None)
+    if start is not None:
+        instrumentation.record_query(statement, time.perf_counter() - start)
+
+
+_events_registered = False
+
+
+def _register_cursor_events():
+    global _events_registered
+    if _events_registered:
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    _events_registered = True
+
+
+# Create singleton instance
+instrumentation = Instrumentation()
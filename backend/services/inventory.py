@@ -0,0 +1,227 @@
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case, select
+from models import db, Order, Product, StockReservation
+
+
+class InsufficientStock(Exception):
+    """Raised when one or more order lines cannot be covered by current stock"""
+    
+    def __init__(self, product_ids):
+        self.product_ids = sorted(product_ids)
+        super().__init__(f'Insufficient stock for product(s): {", ".join(map(str, self.product_ids))}')
+
+
+def merge_lines(lines):
+    """
+    Collapse (product_id, quantity) lines into one line per product, ordered by id
+    
+    Raises ValueError for a quantity below 1: a negative one would pass the
+    stock >= quantity guard and put units back instead of taking them.
+    """
+    totals = {}
+    for product_id, quantity in lines:
+        if quantity < 1:
+            raise ValueError(f'quantity must be at least 1 (product {product_id})')
+        totals[product_id] = totals.get(product_id, 0) + quantity
+    return sorted(totals.items())
+
+
+def _supports_returning():
+    return db.session.get_bind().dialect.update_returning
+
+
+def _decrement(lines):
+    """
+    Take stock for every line or raise InsufficientStock
+    
+    One conditional UPDATE covers the whole batch: each row is decremented only
+    if it still holds enough units, so concurrent checkouts never oversell.
+    Its rows are picked by an ORDER BY id ... FOR UPDATE subquery, which locks
+    them in id order before any is written, so two checkouts sharing products
+    cannot deadlock (SQLite has no row locks and renders no FOR UPDATE). The
+    per-line fallback updates lines in id order for the same reason.
+    """
+    table = Product.__table__
+    quantities = dict(lines)
+    needed = case(quantities, value=table.c.id)
+    locked = select(table.c.id).where(table.c.id.in_(quantities)).order_by(table.c.id).with_for_update()
+    stmt = (
+        table.update()
+        .where(table.c.id.in_(locked), table.c.stock >= needed)
+        .values(stock=table.c.stock - needed)
+    )
+    
+    if _supports_returning():
+        taken = {row.id for row in db.session.execute(stmt.returning(table.c.id))}
+        if len(taken) != len(quantities):
+            raise InsufficientStock(set(quantities) - taken)
+        return
+    
+    # Without RETURNING, fall back to one conditional UPDATE per line
+    short = [
+        product_id for product_id, quantity in lines
+        if db.session.execute(
+            table.update()
+            .where(table.c.id == product_id, table.c.stock >= quantity)
+            .values(stock=table.c.stock - quantity)
+        ).rowcount != 1
+    ]
+    if short:
+        raise InsufficientStock(short)
+
+
+def _restock(lines):
+    """Return units to stock (lines must already be merged)"""
+    if not lines:
+        return
+    table = Product.__table__
+    quantities = dict(lines)
+    db.session.execute(
+        table.update()
+        .where(table.c.id.in_(quantities))
+        .values(stock=table.c.stock + case(quantities, value=table.c.id))
+    )
+
+
+def _claim(condition, status):
+    """
+    Move held reservations matching `condition` to `status`
+    
+    Only rows still 'held' are claimed, so a reservation is released or
+    committed exactly once even when the sweep and a payment race.
+    Returns the claimed (id, order_id, product_id, quantity) rows.
+    """
+    table = StockReservation.__table__
+    held = (condition, table.c.status == 'held')
+    columns = (table.c.id, table.c.order_id, table.c.product_id, table.c.quantity)
+    
+    if _supports_returning():
+        return db.session.execute(
+            table.update().where(*held).values(status=status).returning(*columns)
+        ).all()
+    
+    claimed = []
+    for row in db.session.execute(select(*columns).where(*held)).all():
+        result = db.session.execute(
+            table.update().where(table.c.id == row.id, table.c.status == 'held').values(status=status)
+        )
+        if result.rowcount == 1:
+            claimed.append(row)
+    return claimed
+
+
+def reserve_stock(order_id, lines, ttl=None):
+    """
+    Decrement stock for an order's lines and record the reservations
+    
+    Runs in the caller's transaction: commit to keep the reservation, roll
+    back to return the units. Raises InsufficientStock if any line is short,
+    ValueError if a line's quantity is below 1.
+    """
+    lines = merge_lines(lines)
+    if not lines:
+        return []
+    
+    ttl = ttl if ttl is not None else current_app.config['STOCK_RESERVATION_TTL']
+    expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+    
+    _decrement(lines)
+    rows = [
+        {'order_id': order_id, 'product_id': product_id, 'quantity': quantity,
+         'status': 'held', 'expires_at': expires_at}
+        for product_id, quantity in lines
+    ]
+    db.session.execute(StockReservation.__table__.insert(), rows)
+    return rows
+
+
+def extend_reservations(order_id, ttl):
+    """Keep an order's held stock for at least `ttl` more seconds (e.g. while an STK push is pending)"""
+    table = StockReservation.__table__
+    expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+    return db.session.execute(
+        table.update()
+        .where(table.c.order_id == order_id, table.c.status == 'held', table.c.expires_at < expires_at)
+        .values(expires_at=expires_at)
+    ).rowcount
+
+
+def commit_reservations(order_id):
+    """
+    Make an order's reservations permanent once it is paid
+    
+    If the hold expired before the payment arrived the units were returned to
+    stock; they are taken again here, raising InsufficientStock if they have
+    sold out in the meantime.
+    """
+    table = StockReservation.__table__
+    committed = _claim(table.c.order_id == order_id, 'committed')
+    
+    released = db.session.execute(
+        select(table.c.id, table.c.product_id, table.c.quantity)
+        .where(table.c.order_id == order_id, table.c.status == 'released')
+    ).all()
+    if released:
+        _decrement(merge_lines((row.product_id, row.quantity) for row in released))
+        db.session.execute(
+            table.update()
+            .where(table.c.id.in_([row.id for row in released]))
+            .values(status='committed')
+        )
+    return len(committed) + len(released)
+
+
+def release_reservations(order_id):
+    """Return an order's held stock (payment failed or order cancelled)"""
+    table = StockReservation.__table__
+    claimed = _claim(table.c.order_id == order_id, 'released')
+    _restock(merge_lines((row.product_id, row.quantity) for row in claimed))
+    return len(claimed)
+
+
+def release_expired(now=None, limit=500):
+    """
+    Release held reservations past their expiry and cancel their unpaid orders
+    
+    Commits its own transaction. Returns the number of reservations released.
+    """
+    table = StockReservation.__table__
+    now = now or datetime.utcnow()
+    
+    expired_ids = db.session.execute(
+        select(table.c.id)
+        .where(table.c.status == 'held', table.c.expires_at <= now)
+        .order_by(table.c.expires_at)
+        .limit(limit)
+    ).scalars().all()
+    if not expired_ids:
+        return 0
+    
+    claimed = _claim(table.c.id.in_(expired_ids), 'released')
+    _restock(merge_lines((row.product_id, row.quantity) for row in claimed))
+    
+    order_ids = {row.order_id for row in claimed}
+    if order_ids:
+        orders = Order.__table__
+        db.session.execute(
+            orders.update()
+            .where(orders.c.id.in_(order_ids), orders.c.status == 'pending', orders.c.payment_status != 'completed')
+            .values(status='cancelled')
+        )
+    db.session.commit()
+    return len(claimed)
+
+
+_last_sweep = 0.0
+
+
+def sweep_expired_reservations():
+    """Run release_expired() at most once per STOCK_SWEEP_INTERVAL in this process"""
+    global _last_sweep
+    now = time.monotonic()
+    if now - _last_sweep < current_app.config['STOCK_SWEEP_INTERVAL']:
+        return 0
+    _last_sweep = now
+    return release_expired()
@@ -0,0 +1,273 @@
+import os
+import random
+import socket
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select
+from models import db, Job
+
+# Registered task handlers: name -> Task
+TASKS = {}
+
+
+class Task:
+    """A named job handler with its retry policy"""
+    
+    def __init__(self, name, func, max_attempts=5, queue='default', on_dead=None):
+        self.name = name
+        self.func = func
+        self.max_attempts = max_attempts
+        self.queue = queue
+        self.on_dead = on_dead
+
+
+class RetryLater(Exception):
+    """Raise from a handler to run the job again after `delay` seconds (counts as an attempt)"""
+    
+    def __init__(self, message='', delay=None):
+        super().__init__(message)
+        self.delay = delay
+
+
+def task(name, max_attempts=5, queue='default', on_dead=None):
+    """
+    Register a job handler
+    
+    The handler receives the job payload as keyword arguments and runs inside
+    the job's transaction. `on_dead(payload, error)` runs once the job has
+    used all its attempts and is dead-lettered.
+    """
+    def decorator(func):
+        TASKS[name] = Task(name, func, max_attempts, queue, on_dead)
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, delay=0, max_attempts=None, queue=None):
+    """
+    Add a job to the current session
+    
+    Nothing runs until the caller commits, so a job is only ever queued
+    together with the writes that produced it.
+    """
+    registered = TASKS.get(name)
+    job = Job(
+        name=name,
+        payload=payload or {},
+        queue=queue or (registered.queue if registered else 'default'),
+        max_attempts=max_attempts or (registered.max_attempts if registered else 5),
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+        status='queued',
+        attempts=0,
+    )
+    db.session.add(job)
+    return job
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim_jobs(queues=('default',), limit=10, worker=None):
+    """
+    Atomically claim up to `limit` due jobs for this worker
+    
+    Candidate rows are picked with FOR UPDATE SKIP LOCKED on PostgreSQL (a
+    no-op on SQLite, where writers are serialized anyway), then claimed with
+    a conditional UPDATE keyed on status='queued' and stamped with a unique
+    claim token, so two workers can never run the same job.
+    """
+    table = Job.__table__
+    now = datetime.utcnow()
+    candidates = db.session.execute(
+        select(table.c.id)
+        .where(table.c.queue.in_(queues), table.c.status == 'queued', table.c.run_at <= now)
+        .order_by(table.c.run_at, table.c.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not candidates:
+        db.session.rollback()
+        return []
+    
+    token = f'{worker or worker_id()}:{uuid.uuid4().hex[:8]}'
+    db.session.execute(
+        table.update()
+        .where(table.c.id.in_(candidates), table.c.status == 'queued')
+        .values(status='running', locked_by=token, locked_at=now, attempts=table.c.attempts + 1)
+    )
+    db.session.commit()
+    return Job.query.filter_by(locked_by=token, status='running').order_by(Job.run_at, Job.id).all()
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter for the given attempt number"""
+    base = current_app.config.get('JOB_RETRY_BACKOFF', 5)
+    cap = current_app.config.get('JOB_RETRY_MAX_DELAY', 600)
+    return min(cap, base * 2 ** (attempts - 1)) * (0.5 + random.random() / 2)
+
+
+def run_job(job):
+    """
+    Run one claimed job and record the outcome
+    
+    The handler's writes and the job's 'done' status commit together. On an
+    exception the handler's writes are rolled back and the job is either
+    rescheduled with backoff or, after max_attempts, dead-lettered.
+    """
+    registered = TASKS.get(job.name)
+    job_id, payload, attempts, max_attempts = job.id, dict(job.payload or {}), job.attempts, job.max_attempts
+    
+    try:
+        if registered is None:
+            raise LookupError(f'No handler registered for job {job.name!r}')
+        registered.func(**payload)
+        job.status = 'done'
+        job.last_error = None
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        error = f'{type(e).__name__}: {e}'
+        delay = e.delay if isinstance(e, RetryLater) and e.delay is not None else retry_delay(attempts)
+        
+        job = db.session.get(Job, job_id)
+        job.last_error = error if isinstance(e, RetryLater) else traceback.format_exc()[-4000:]
+        job.locked_by = None
+        if attempts >= max_attempts:
+            job.status = 'dead'
+            if registered is not None and registered.on_dead is not None:
+                try:
+                    registered.on_dead(payload, error)
+                except Exception:
+                    current_app.logger.exception('Dead-letter hook for job %s failed', job_id)
+        else:
+            job.status = 'queued'
+            job.run_at = datetime.utcnow() + timedelta(seconds=delay)
+        db.session.commit()
+        return False
+
+
+def requeue_stale(timeout=None):
+    """Return jobs whose worker died mid-run (locked longer than JOB_LOCK_TIMEOUT) to the queue"""
+    timeout = timeout or current_app.config.get('JOB_LOCK_TIMEOUT', 300)
+    table = Job.__table__
+    cutoff = datetime.utcnow() - timedelta(seconds=timeout)
+    count = db.session.execute(
+        table.update()
+        .where(table.c.status == 'running', table.c.locked_at < cutoff)
+        .values(status='queued', locked_by=None, run_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    return count
+
+
+def run_eager(job):
+    """
+    Run a just-committed job in-process when JOBS_EAGER is set
+    
+    Lets development setups work without a worker; production leaves it off.
+    """
+    if not current_app.config.get('JOBS_EAGER', False):
+        return None
+    table = Job.__table__
+    token = f'{worker_id()}:eager:{uuid.uuid4().hex[:8]}'
+    claimed = db.session.execute(
+        table.update()
+        .where(table.c.id == job.id, table.c.status == 'queued')
+        .values(status='running', locked_by=token, locked_at=datetime.utcnow(), attempts=table.c.attempts + 1)
+    ).rowcount
+    db.session.commit()
+    if claimed != 1:
+        return None
+    return run_job(db.session.get(Job, job.id))
+
+
+def work_off(queues=('default',), limit=10, max_jobs=None):
+    """Run due jobs until none are left (or `max_jobs` have run); returns the count"""
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        jobs = claim_jobs(queues, limit)
+        if not jobs:
+            break
+        for job in jobs:
+            run_job(job)
+            processed += 1
+    return processed
+
+
+def queue_stats():
+    """Job counts per queue and status"""
+    rows = db.session.query(Job.queue, Job.status, db.func.count(Job.id)).group_by(Job.queue, Job.status).all()
+    stats = {}
+    for queue, status, count in rows:
+        stats.setdefault(queue, {})[status] = count
+    return stats
+
+
+class Worker:
+    """
+    Polls the job table and runs periodic maintenance
+    
+    `periodic` is a list of (interval seconds, callable) run from the same
+    loop when due, e.g. the payment reconciler and the stock-hold sweep. A
+    failed claim (database down, lock timeout) is logged and the next poll
+    waits twice as long, up to `max_backoff` seconds.
+    """
+    
+    def __init__(self, app, queues=('default',), batch_size=10, poll_interval=1.0, periodic=(), max_backoff=60.0):
+        self.app = app
+        self.queues = tuple(queues)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.periodic = [[interval, func, 0.0] for interval, func in periodic]
+        self.failures = 0  # consecutive failed claims
+        self.running = False
+    
+    def run_periodic(self):
+        now = time.monotonic()
+        for entry in self.periodic:
+            interval, func, last_run = entry
+            if now - last_run >= interval:
+                entry[2] = now
+                try:
+                    func()
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('Periodic task %s failed', func.__name__)
+    
+    def run_once(self):
+        """One poll: periodic tasks, then a batch of due jobs; returns jobs run"""
+        with self.app.app_context():
+            try:
+                self.run_periodic()
+                try:
+                    jobs = claim_jobs(self.queues, self.batch_size)
+                except Exception:
+                    db.session.rollback()
+                    self.failures += 1
+                    self.app.logger.exception('Claiming jobs failed (%d in a row)', self.failures)
+                    return 0
+                self.failures = 0
+                for job in jobs:
+                    run_job(job)
+                return len(jobs)
+            finally:
+                db.session.remove()
+    
+    def idle_delay(self):
+        """Seconds to wait after a poll that ran nothing"""
+        return min(self.max_backoff, self.poll_interval * 2 ** self.failures)
+    
+    def run(self):
+        self.running = True
+        while self.running:
+            if self.run_once() == 0:
+                time.sleep(self.idle_delay())
+    
+    def stop(self, *args):
+        self.running = False
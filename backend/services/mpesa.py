@@ -1,12 +1,71 @@
 import base64
+import threading
+import time
 import requests
-from datetime import datetime
-from flask import current_app
+from datetime import datetime, timedelta, timezone
+from requests.adapters import HTTPAdapter
 import random
-import string
+import uuid
+from urllib.parse import urlencode
+
+# Daraja API hosts per MPESA_ENVIRONMENT (MPESA_BASE_URL overrides, e.g. a local fake)
+BASE_URLS = {
+    'sandbox': 'https://sandbox.safaricom.co.ke',
+    'production': 'https://api.safaricom.co.ke',
+}
+
+TOKEN_PATH = '/oauth/v1/generate?grant_type=client_credentials'
+STK_PUSH_PATH = '/mpesa/stkpush/v1/processrequest'
+STK_QUERY_PATH = '/mpesa/stkpushquery/v1/query'
+
+# Daraja timestamps are East Africa Time
+EAT = timezone(timedelta(hours=3))
+
+# Status codes that mean the request was not processed and is safe to resend
+RETRY_STATUSES = {429, 503}
+
+# STK query answers while the customer has not yet responded to the prompt
+PENDING_QUERY_CODES = {'500.001.1001'}
+
+
+class MpesaError(Exception):
+    """
+    Raised when Daraja cannot be reached or rejects a request
+    
+    `retryable` is True only when the request was certainly not processed
+    (connection refused, 429/503), so resending it cannot duplicate an STK push.
+    """
+    
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def normalize_phone(phone_number):
+    """Phone number in 254XXXXXXXXX format"""
+    phone_number = str(phone_number).strip().replace(' ', '')
+    if phone_number.startswith('0'):
+        phone_number = '254' + phone_number[1:]
+    elif phone_number.startswith('+'):
+        phone_number = phone_number[1:]
+    return phone_number
+
+
+def _transaction_id():
+    """Our own payment reference; never a Daraja request id, which authenticates the callback"""
+    return 'TXN' + uuid.uuid4().hex[:16].upper()
+
 
 class MpesaService:
-    """M-Pesa Daraja API service (Placeholder Implementation)"""
+    """
+    M-Pesa Daraja API service
+    
+    With MPESA_ENABLED off (the default) every call is simulated locally, as
+    the original placeholder did. When enabled, calls go to Daraja over a
+    pooled keep-alive session with connect/read timeouts, bounded retries
+    with exponential backoff, and an access token cached until shortly
+    before it expires and refreshed by a single thread at a time.
+    """
     
     def __init__(self):
         self.consumer_key = None
@@ -16,6 +75,18 @@ class MpesaService:
         self.callback_url = None
         self.environment = None
         self.access_token = None
+        self.enabled = False
+        self.base_url = None
+        self.timeout = (3.05, 10)
+        self.retries = 2
+        self.backoff = 0.5
+        self.token_margin = 60
+        self.pool_size = 10
+        self.session = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+        self._session_lock = threading.Lock()
+        self.token_refreshes = 0
     
     def initialize(self, app):
         """Initialize with app configuration"""
@@ -24,28 +95,124 @@ class MpesaService:
         self.business_shortcode = app.config['MPESA_BUSINESS_SHORTCODE']
         self.passkey = app.config['MPESA_PASSKEY']
         self.callback_url = app.config['MPESA_CALLBACK_URL']
+        secret = app.config.get('MPESA_CALLBACK_SECRET')
+        if secret:
+            # Daraja does not sign callbacks; knowing this URL is what proves one came from it
+            separator = '&' if '?' in self.callback_url else '?'
+            self.callback_url += separator + urlencode({'token': secret})
         self.environment = app.config['MPESA_ENVIRONMENT']
+        self.enabled = app.config.get('MPESA_ENABLED', False)
+        self.base_url = (app.config.get('MPESA_BASE_URL') or BASE_URLS.get(self.environment, BASE_URLS['sandbox'])).rstrip('/')
+        self.timeout = (app.config.get('MPESA_CONNECT_TIMEOUT', 3.05), app.config.get('MPESA_READ_TIMEOUT', 10))
+        self.retries = app.config.get('MPESA_RETRIES', 2)
+        self.backoff = app.config.get('MPESA_RETRY_BACKOFF', 0.5)
+        self.token_margin = app.config.get('MPESA_TOKEN_REFRESH_MARGIN', 60)
+        
+        self.pool_size = app.config.get('MPESA_POOL_SIZE', 10)
+        self.session = None  # built on first use (see _http), so app start-up stays cheap
+        
+        self.access_token = None
+        self._token_expires_at = 0.0
+    
+    def _http(self):
+        """The pooled HTTP session, created on the first Daraja call"""
+        if self.session is None:
+            with self._session_lock:
+                if self.session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self.session = session
+        return self.session
+    
+    def _request(self, method, path, idempotent=True, authenticate=True, **kwargs):
+        """
+        Send a Daraja request and return the decoded JSON body
+        
+        Connection failures and 429/503 responses (request not processed) are
+        retried with exponential backoff and jitter. Read timeouts are only
+        retried for idempotent calls: resending an STK push the server may
+        already have accepted would prompt the customer twice.
+        """
+        url = self.base_url + path
+        for attempt in range(self.retries + 1):
+            if authenticate:
+                kwargs['headers'] = {'Authorization': f'Bearer {self.get_access_token()}'}
+            try:
+                response = self._http().request(method, url, timeout=self.timeout, **kwargs)
+            except requests.ConnectionError as e:
+                error = e
+            except requests.Timeout as e:
+                if not idempotent:
+                    raise MpesaError(f'Daraja timed out: {e}')
+                error = e
+            else:
+                if response.status_code == 401 and authenticate:
+                    self._expire_token()
+                    error = MpesaError('Access token rejected')
+                elif response.status_code in RETRY_STATUSES:
+                    error = MpesaError(f'Daraja returned {response.status_code}')
+                else:
+                    try:
+                        body = response.json()
+                    except ValueError:
+                        raise MpesaError(f'Daraja returned {response.status_code} with a non-JSON body')
+                    if response.status_code >= 400 and 'errorCode' not in body:
+                        raise MpesaError(body.get('errorMessage') or f'Daraja returned {response.status_code}')
+                    return body
+            
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2 ** attempt * (0.5 + random.random() / 2))
+        
+        raise MpesaError(f'Daraja request failed after {self.retries + 1} attempts: {error}', retryable=True)
+    
+    def _expire_token(self):
+        with self._token_lock:
+            self._token_expires_at = 0.0
     
     def get_access_token(self):
         """
-        Generate M-Pesa access token (PLACEHOLDER)
-        In production, this would make a real API call to Safaricom
+        OAuth access token, cached until TOKEN_REFRESH_MARGIN seconds before expiry
+        
+        Concurrent callers that find the token expired wait on one refresh
+        instead of each minting a new token.
         """
-        # PLACEHOLDER: Simulate token generation
-        self.access_token = f"placeholder_token_{datetime.now().timestamp()}"
-        return self.access_token
+        if not self.enabled:
+            # PLACEHOLDER: Simulate token generation
+            self.access_token = f"placeholder_token_{datetime.now().timestamp()}"
+            return self.access_token
+        
+        if self.access_token and time.monotonic() < self._token_expires_at:
+            return self.access_token
+        
+        with self._token_lock:
+            if self.access_token and time.monotonic() < self._token_expires_at:
+                return self.access_token
+            
+            body = self._request(
+                'GET', TOKEN_PATH, authenticate=False,
+                auth=(self.consumer_key, self.consumer_secret)
+            )
+            if 'access_token' not in body:
+                raise MpesaError(body.get('errorMessage') or 'No access token in Daraja response')
+            
+            expires_in = int(body.get('expires_in', 3599))
+            self.access_token = body['access_token']
+            self._token_expires_at = time.monotonic() + max(expires_in - self.token_margin, 0)
+            self.token_refreshes += 1
+            return self.access_token
     
     def generate_password(self):
         """Generate password for STK push"""
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        timestamp = datetime.now(EAT).strftime('%Y%m%d%H%M%S')
         data_to_encode = f"{self.business_shortcode}{self.passkey}{timestamp}"
         encoded = base64.b64encode(data_to_encode.encode()).decode('utf-8')
         return encoded, timestamp
     
     def initiate_stk_push(self, phone_number, amount, account_reference, transaction_desc):
         """
-        Initiate STK push (PLACEHOLDER)
-        In production, this would make a real API call to Safaricom
+        Initiate STK push
         
         Args:
             phone_number: Customer phone number (254XXXXXXXXX format)
@@ -54,122 +221,174 @@ class MpesaService:
             transaction_desc: Description of transaction
         
         Returns:
-            dict: Response with transaction details
+            dict: Response with transaction details ('success' False and an
+            'error' message if Daraja could not be reached or refused)
         """
-        # PLACEHOLDER: Simulate STK push
-        # In production, you would:
-        # 1. Get access token
-        # 2. Generate password and timestamp
-        # 3. Make POST request to https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest
-        
         # Ensure phone number is in correct format
-        if phone_number.startswith('0'):
-            phone_number = '254' + phone_number[1:]
-        elif phone_number.startswith('+'):
-            phone_number = phone_number[1:]
+        phone_number = normalize_phone(phone_number)
         
-        # Generate placeholder transaction ID
-        transaction_id = 'TXN' + ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+        if not self.enabled:
+            return self._placeholder_stk_push(phone_number, amount)
         
+        password, timestamp = self.generate_password()
+        payload = {
+            'BusinessShortCode': self.business_shortcode,
+            'Password': password,
+            'Timestamp': timestamp,
+            'TransactionType': 'CustomerPayBillOnline',
+            'Amount': int(round(amount)),
+            'PartyA': phone_number,
+            'PartyB': self.business_shortcode,
+            'PhoneNumber': phone_number,
+            'CallBackURL': self.callback_url,
+            'AccountReference': account_reference[:12],
+            'TransactionDesc': transaction_desc[:13],
+        }
+        
+        try:
+            body = self._request('POST', STK_PUSH_PATH, idempotent=False, json=payload)
+        except MpesaError as e:
+            return {'success': False, 'error': str(e), 'retryable': e.retryable}
+        
+        if str(body.get('ResponseCode')) != '0':
+            return {
+                'success': False,
+                'error': body.get('errorMessage') or body.get('ResponseDescription') or 'STK push rejected',
+                'response_code': body.get('ResponseCode') or body.get('errorCode'),
+            }
+        
+        return {
+            'success': True,
+            'message': 'STK push initiated successfully',
+            'merchant_request_id': body['MerchantRequestID'],
+            'checkout_request_id': body['CheckoutRequestID'],
+            'response_code': str(body['ResponseCode']),
+            'response_description': body.get('ResponseDescription'),
+            'customer_message': body.get('CustomerMessage'),
+            'transaction_id': _transaction_id(),
+            'phone_number': phone_number,
+            'amount': amount
+        }
+    
+    def _placeholder_stk_push(self, phone_number, amount):
         # Simulate successful STK push initiation
-        response = {
+        return {
             'success': True,
             'message': 'STK push initiated successfully (PLACEHOLDER)',
-            'merchant_request_id': f'MR{random.randint(10000, 99999)}',
-            'checkout_request_id': f'ws_CO_{datetime.now().strftime("%Y%m%d%H%M%S")}_{random.randint(1000, 9999)}',
+            # Both ids are unique in payments, so they must not repeat under load
+            'merchant_request_id': f'MR{uuid.uuid4().hex[:16]}',
+            'checkout_request_id': f'ws_CO_{datetime.now().strftime("%Y%m%d%H%M%S")}_{uuid.uuid4().hex[:12]}',
             'response_code': '0',
             'response_description': 'Success. Request accepted for processing',
             'customer_message': 'Success. Request accepted for processing',
-            'transaction_id': transaction_id,
+            'transaction_id': _transaction_id(),
             'phone_number': phone_number,
             'amount': amount
         }
-        
-        return response
     
     def query_stk_status(self, checkout_request_id):
         """
-        Query STK push status (PLACEHOLDER)
-        In production, this would make a real API call to Safaricom
+        Query STK push status
+        
+        Returns:
+            dict: 'status' is 'success', 'failed' or 'pending' (customer has
+            not answered yet, or Daraja could not be reached)
         """
-        # PLACEHOLDER: Simulate status query
-        # In production, you would make POST request to:
-        # https://sandbox.safaricom.co.ke/mpesa/stkpushquery/v1/query
-        
-        # Simulate successful payment (80% success rate for testing)
-        is_success = random.random() < 0.8
-        
-        if is_success:
-            response = {
-                'success': True,
-                'result_code': '0',
-                'result_desc': 'The service request is processed successfully.',
-                'status': 'success'
-            }
-        else:
-            response = {
+        if not self.enabled:
+            return self._placeholder_stk_status()
+        
+        password, timestamp = self.generate_password()
+        payload = {
+            'BusinessShortCode': self.business_shortcode,
+            'Password': password,
+            'Timestamp': timestamp,
+            'CheckoutRequestID': checkout_request_id,
+        }
+        
+        try:
+            body = self._request('POST', STK_QUERY_PATH, json=payload)
+        except MpesaError as e:
+            return {'success': False, 'status': 'pending', 'result_code': None, 'result_desc': str(e)}
+        
+        if body.get('errorCode') in PENDING_QUERY_CODES or 'ResultCode' not in body:
+            return {
                 'success': False,
-                'result_code': '1032',
-                'result_desc': 'Request cancelled by user',
-                'status': 'failed'
+                'status': 'pending',
+                'result_code': body.get('errorCode'),
+                'result_desc': body.get('errorMessage') or body.get('ResponseDescription'),
             }
         
-        return response
+        result_code = str(body['ResultCode'])
+        return {
+            'success': result_code == '0',
+            'result_code': result_code,
+            'result_desc': body.get('ResultDesc'),
+            'status': 'success' if result_code == '0' else 'failed'
+        }
+    
+    def _placeholder_stk_status(self):
+        # No push reached Daraja, so there is no outcome to report: never settle on a guess
+        return {
+            'success': False,
+            'result_code': None,
+            'result_desc': 'M-Pesa is not enabled (MPESA_ENABLED=false)',
+            'status': 'pending'
+        }
     
     def process_callback(self, callback_data):
         """
-        Process M-Pesa callback (PLACEHOLDER)
-        In production, this would validate and process real callback data
+        Parse an STK callback from Daraja
         
         Args:
             callback_data: Callback data from M-Pesa
         
         Returns:
-            dict: Processed payment information
+            dict: Processed payment information, including the
+            checkout_request_id/merchant_request_id the push was issued with
         """
-        # PLACEHOLDER: Simulate callback processing
-        # In production, you would:
-        # 1. Validate callback data
-        # 2. Extract payment details
-        # 3. Update order status
-        
-        # Simulate extracting payment details
-        result_code = callback_data.get('Body', {}).get('stkCallback', {}).get('ResultCode', 0)
-        
-        if result_code == 0:
-            # Successful payment
-            callback_metadata = callback_data.get('Body', {}).get('stkCallback', {}).get('CallbackMetadata', {}).get('Item', [])
-            
-            payment_info = {
-                'success': True,
-                'result_code': result_code,
-                'result_desc': 'Payment successful',
-                'amount': 0,
+        stk_callback = (callback_data or {}).get('Body', {}).get('stkCallback', {})
+        result_code = stk_callback.get('ResultCode', 0)
+        
+        payment_info = {
+            'success': str(result_code) == '0',
+            'result_code': result_code,
+            'checkout_request_id': stk_callback.get('CheckoutRequestID'),
+            'merchant_request_id': stk_callback.get('MerchantRequestID'),
+        }
+        
+        if not payment_info['success']:
+            payment_info['result_desc'] = stk_callback.get('ResultDesc') or 'Payment failed or cancelled'
+            return payment_info
+        
+        payment_info.update({
+            'result_desc': stk_callback.get('ResultDesc') or 'Payment successful',
+            'amount': 0,
+            'mpesa_receipt_number': None,
+            'transaction_date': None,
+            'phone_number': None,
+        })
+        
+        if not self.enabled:
+            # PLACEHOLDER: fill in details a simulated callback may omit
+            payment_info.update({
                 'mpesa_receipt_number': f'MPESA{random.randint(100000, 999999)}',
                 'transaction_date': datetime.now().isoformat(),
                 'phone_number': '254712345678'
-            }
+            })
+        
+        # Extract metadata if available
+        for item in stk_callback.get('CallbackMetadata', {}).get('Item', []):
+            name = item.get('Name')
+            value = item.get('Value')
             
-            # Extract metadata if available
-            for item in callback_metadata:
-                name = item.get('Name')
-                value = item.get('Value')
-                
-                if name == 'Amount':
-                    payment_info['amount'] = value
-                elif name == 'MpesaReceiptNumber':
-                    payment_info['mpesa_receipt_number'] = value
-                elif name == 'TransactionDate':
-                    payment_info['transaction_date'] = str(value)
-                elif name == 'PhoneNumber':
-                    payment_info['phone_number'] = str(value)
-        else:
-            # Failed payment
-            payment_info = {
-                'success': False,
-                'result_code': result_code,
-                'result_desc': 'Payment failed or cancelled'
-            }
+            if name == 'Amount':
+                payment_info['amount'] = value
+            elif name == 'MpesaReceiptNumber':
+                payment_info['mpesa_receipt_number'] = value
+            elif name == 'TransactionDate':
+                payment_info['transaction_date'] = str(value)
+            elif name == 'PhoneNumber':
+                payment_info['phone_number'] = str(value)
         
         return payment_info
 
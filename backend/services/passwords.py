@@ -0,0 +1,126 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+class HasherBusy(Exception):
+    """Every hashing process is busy and PASSWORD_HASH_MAX_PENDING calls are already waiting"""
+
+
+def hash_parameters(method):
+    """
+    A Werkzeug method string with its defaults filled in, exactly as it
+    prefixes the hashes it produces ('scrypt' -> 'scrypt:32768:8:1')
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        n, r, p = args + ['32768', '8', '1'][len(args):]
+        return f'scrypt:{int(n)}:{int(r)}:{int(p)}'
+    if name == 'pbkdf2':
+        hash_name, iterations = args + ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)][len(args):]
+        return f'pbkdf2:{hash_name}:{int(iterations)}'
+    raise ValueError(f'Unsupported password hash method {method!r}; use scrypt[:n:r:p] or pbkdf2[:hash:iterations]')
+
+
+def _lower_priority(nice):
+    if nice:
+        os.nice(nice)
+
+
+class PasswordHasher:
+    """
+    Password hashing with configurable KDF parameters, off the request thread
+    
+    PASSWORD_HASH_METHOD takes Werkzeug's method strings; a stored hash made
+    with other parameters is upgraded on the user's next successful login
+    (see `needs_rehash`). With PASSWORD_HASH_PROCESSES > 0 the KDF runs in a
+    per-worker pool of that many processes, started on first use (so each
+    forked gunicorn worker gets its own) at PASSWORD_HASH_NICE lower
+    priority: a login burst then uses at most that many cores per worker
+    and yields the CPU to other requests, and gthread/gevent workers keep
+    serving while a login waits. At most PASSWORD_HASH_MAX_PENDING calls may
+    queue for the pool; beyond that, or after PASSWORD_HASH_TIMEOUT seconds,
+    HasherBusy sheds the request with a 503. With 0 processes the KDF runs
+    inline on the request thread.
+    """
+    
+    def __init__(self):
+        self.method = DEFAULT_METHOD
+        self.processes = 0
+        self.timeout = 10.0
+        self.nice = 0
+        self._slots = None
+        self._executor = None
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        """Initialize with app configuration"""
+        from flask import jsonify
+        
+        self.method = hash_parameters(app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD))
+        self.processes = app.config.get('PASSWORD_HASH_PROCESSES', 0)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', 10.0)
+        self.nice = app.config.get('PASSWORD_HASH_NICE', 0)
+        max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', 16)
+        self._slots = threading.BoundedSemaphore(self.processes + max_pending) if self.processes else None
+        self.reset()
+        
+        @app.errorhandler(HasherBusy)
+        def hasher_busy(error):
+            response = jsonify({'error': 'Too many sign-ins at once, please retry'})
+            response.headers['Retry-After'] = '1'
+            return response, 503
+    
+    def reset(self):
+        """Forget the process pool (a forked worker must not use its parent's)"""
+        with self._lock:
+            self._executor = None
+    
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the worker may already be running threads or greenlets
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_lower_priority,
+                    initargs=(self.nice,),
+                )
+            return self._executor
+    
+    def _run(self, function, *args):
+        if not self.processes:
+            return function(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            return self._pool().submit(function, *args).result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HasherBusy()
+        except BrokenProcessPool:
+            # a hashing process died (OOM kill); start a fresh pool on the next call
+            self.reset()
+            raise HasherBusy()
+        finally:
+            self._slots.release()
+    
+    def hash(self, password):
+        """Hash `password` with the configured parameters"""
+        return self._run(generate_password_hash, password, self.method)
+    
+    def verify(self, password_hash, password):
+        """Check `password` against a stored hash of any supported parameters"""
+        return self._run(check_password_hash, password_hash, password)
+    
+    def needs_rehash(self, password_hash):
+        """True when `password_hash` was made with other parameters than the configured ones"""
+        return password_hash.split('$', 1)[0] != self.method
+
+
+# Create singleton instance
+password_hasher = PasswordHasher()
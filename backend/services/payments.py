@@ -0,0 +1,291 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from models import db, MpesaCallback, Order, Payment
+from services.events import event_broker
+from services.inventory import InsufficientStock, commit_reservations, release_reservations
+from services.jobs import RetryLater, task
+from services.mpesa import mpesa_service
+
+STK_PUSH_JOB = 'payments.stk_push'
+
+
+def publish_status(order_id, payment_status, order_status, payment=None):
+    """Announce an order's payment outcome to its status stream once the transaction commits"""
+    event_broker.publish(f'order:{order_id}', {
+        'order_id': order_id,
+        'payment_status': payment_status,
+        'order_status': order_status,
+        'payment': payment,
+    })
+
+
+def _settle(condition, success, receipt=None, result_desc=None):
+    """
+    Move one pending payment to its final status and update its order (caller commits)
+    
+    The payment is claimed with a single conditional UPDATE ... WHERE
+    status='pending', so whichever of the callback, a duplicate callback or
+    the reconciler gets there first settles it and the others change nothing.
+    Returns the payment id, or None if no pending payment matched.
+    """
+    table = Payment.__table__
+    values = {'status': 'success' if success else 'failed', 'result_desc': result_desc, 'updated_at': datetime.utcnow()}
+    if success:
+        values['mpesa_receipt_number'] = receipt
+    pending = (condition, table.c.status == 'pending')
+    stmt = table.update().where(*pending).values(**values)
+    
+    if db.session.get_bind().dialect.update_returning:
+        row = db.session.execute(stmt.returning(table.c.id, table.c.order_id)).first()
+    else:
+        row = db.session.execute(select(table.c.id, table.c.order_id).where(*pending)).first()
+        if row is not None and db.session.execute(stmt.where(table.c.id == row.id)).rowcount != 1:
+            row = None
+    if row is None:
+        return None
+    
+    orders = Order.__table__
+    if not success:
+        # A later failed attempt never undoes an order that is already paid
+        failed = db.session.execute(
+            orders.update()
+            .where(orders.c.id == row.order_id, orders.c.payment_status != 'completed')
+            .values(payment_status='failed')
+        ).rowcount
+        if failed:
+            release_reservations(row.order_id)
+            order_status = db.session.execute(select(orders.c.status).where(orders.c.id == row.order_id)).scalar()
+            publish_status(row.order_id, 'failed', order_status, {'id': row.id, 'status': 'failed', 'result_desc': result_desc})
+        return row.id
+    
+    # A successful payment commits the order's stock reservations
+    order_status = 'processing'
+    try:
+        with db.session.begin_nested():
+            commit_reservations(row.order_id)
+    except InsufficientStock as e:
+        # Paid after the hold expired and the stock sold out: needs a refund
+        order_status = 'on_hold'
+        db.session.execute(table.update().where(table.c.id == row.id).values(result_desc=f'Paid but {e}'[:255]))
+    db.session.execute(
+        orders.update()
+        .where(orders.c.id == row.order_id)
+        .values(payment_status='completed', status=order_status)
+    )
+    publish_status(row.order_id, 'completed', order_status, {
+        'id': row.id, 'status': 'success', 'mpesa_receipt_number': receipt, 'result_desc': result_desc
+    })
+    return row.id
+
+
+def settle_payment(payment_id, success, receipt=None, result_desc=None):
+    """Settle a pending payment by id; returns False if it was already settled"""
+    return _settle(Payment.__table__.c.id == payment_id, success, receipt, result_desc) is not None
+
+
+def _insert_ignoring_duplicates(table, values):
+    """INSERT a row unless it conflicts with a unique key; returns True if inserted"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql_insert if dialect == 'postgresql' else sqlite_insert
+        return db.session.execute(insert(table).values(**values).on_conflict_do_nothing()).rowcount == 1
+    try:
+        with db.session.begin_nested():
+            db.session.execute(table.insert().values(**values))
+        return True
+    except IntegrityError:
+        return False
+
+
+def _amount_matches(expected, paid):
+    """Whether a callback's Amount is what the STK push charged (whole shillings)"""
+    try:
+        return round(float(paid)) == round(expected)
+    except (TypeError, ValueError):
+        return False
+
+
+def apply_callback(payment_info):
+    """
+    Settle the payment a parsed callback refers to and link it in the ledger; returns the payment id
+    
+    A success whose Amount differs from the payment's is not applied: the
+    payment stays pending for the reconciler, which asks Daraja directly.
+    """
+    checkout_request_id = payment_info['checkout_request_id']
+    table = Payment.__table__
+    if payment_info['success']:
+        amount = db.session.execute(
+            select(table.c.amount).where(table.c.checkout_request_id == checkout_request_id)
+        ).scalar()
+        if amount is not None and not _amount_matches(amount, payment_info.get('amount')):
+            current_app.logger.warning('M-Pesa callback for %s paid %r, expected %s; not applied',
+                                       checkout_request_id, payment_info.get('amount'), amount)
+            return None
+    payment_id = _settle(
+        table.c.checkout_request_id == checkout_request_id,
+        payment_info['success'],
+        receipt=payment_info.get('mpesa_receipt_number'),
+        result_desc=(payment_info.get('result_desc') or '')[:255] or None
+    )
+    if payment_id is not None:
+        ledger = MpesaCallback.__table__
+        db.session.execute(
+            ledger.update().where(ledger.c.checkout_request_id == checkout_request_id).values(payment_id=payment_id)
+        )
+    return payment_id
+
+
+def _confirmed(payment_info):
+    """Whether Daraja's STK status query reports the same outcome as a callback"""
+    status = mpesa_service.query_stk_status(payment_info['checkout_request_id'])['status']
+    return status == ('success' if payment_info['success'] else 'failed')
+
+
+def handle_callback(callback_data, verified=False):
+    """
+    Record and apply an STK callback exactly once (caller commits)
+    
+    `verified` callbacks came through the secret callback URL. Any other
+    callback is only recorded once an STK status query confirms its
+    outcome, so knowing a CheckoutRequestID is not enough to settle an
+    order. Returns 'settled', 'duplicate' (already in the ledger),
+    'unmatched' (no pending payment with its CheckoutRequestID yet, already
+    settled by the reconciler, or a success for the wrong amount),
+    'unconfirmed' or 'invalid'.
+    """
+    payment_info = mpesa_service.process_callback(callback_data)
+    checkout_request_id = payment_info['checkout_request_id']
+    if not checkout_request_id:
+        return 'invalid'
+    if not verified and not _confirmed(payment_info):
+        return 'unconfirmed'
+    
+    try:
+        result_code = int(payment_info['result_code'])
+    except (TypeError, ValueError):
+        result_code = None
+    recorded = _insert_ignoring_duplicates(MpesaCallback.__table__, {
+        'checkout_request_id': checkout_request_id,
+        'merchant_request_id': payment_info['merchant_request_id'],
+        'result_code': result_code,
+        'payload': callback_data,
+        'received_at': datetime.utcnow(),
+    })
+    if not recorded:
+        return 'duplicate'
+    return 'settled' if apply_callback(payment_info) is not None else 'unmatched'
+
+
+def _stk_push_dead(payload, error):
+    """Fail the payment once its STK push job is dead-lettered"""
+    payment = db.session.get(Payment, payload['payment_id'])
+    if payment is not None and not payment.checkout_request_id:
+        settle_payment(payment.id, False, result_desc=f'STK push failed: {error}'[:255])
+
+
+@task(STK_PUSH_JOB, max_attempts=3, on_dead=_stk_push_dead)
+def send_stk_push(payment_id):
+    """
+    Send the STK push for a pending payment
+    
+    Only failures where Daraja certainly did not receive the request are
+    retried; after an ambiguous failure (e.g. a read timeout) the push may
+    already be on the customer's phone, so the payment is failed instead of
+    prompting twice.
+    """
+    payment = db.session.get(Payment, payment_id)
+    if payment is None or payment.status != 'pending' or payment.checkout_request_id:
+        return
+    
+    response = mpesa_service.initiate_stk_push(
+        phone_number=payment.phone_number,
+        amount=payment.amount,
+        account_reference=f'ORDER{payment.order_id}',
+        transaction_desc=f'Payment for Order #{payment.order_id}'
+    )
+    
+    if response['success']:
+        payment.checkout_request_id = response['checkout_request_id']
+        payment.merchant_request_id = response['merchant_request_id']
+        payment.transaction_id = response['transaction_id']
+        
+        # The callback can beat this commit; it waits in the ledger until now
+        recorded = MpesaCallback.query.filter_by(checkout_request_id=payment.checkout_request_id).first()
+        if recorded is not None:
+            apply_callback(mpesa_service.process_callback(recorded.payload))
+        return
+    
+    if response.get('retryable'):
+        raise RetryLater(response.get('error', 'STK push not accepted'))
+    settle_payment(payment.id, False, result_desc=(response.get('error') or 'STK push rejected')[:255])
+
+
+def stale_pending_payments(now=None, limit=None):
+    """Pending payments past the callback grace period that are due for a status query"""
+    config = current_app.config
+    now = now or datetime.utcnow()
+    limit = limit or config.get('MPESA_RECONCILE_BATCH', 50)
+    grace = now - timedelta(seconds=config.get('MPESA_RECONCILE_AFTER', 60))
+    recheck = now - timedelta(seconds=config.get('MPESA_RECONCILE_INTERVAL', 60))
+    
+    return (
+        Payment.query
+        .filter(
+            Payment.status == 'pending',
+            Payment.checkout_request_id.isnot(None),
+            Payment.created_at <= grace,
+            or_(Payment.checked_at.is_(None), Payment.checked_at <= recheck)
+        )
+        .order_by(Payment.created_at)
+        .limit(limit)
+        .all()
+    )
+
+
+def reconcile_pending_payments(now=None):
+    """
+    Settle pending payments whose callback never arrived
+    
+    Queries Daraja for a batch of stale pending payments concurrently over
+    the client's pooled connections, then applies every result in one
+    transaction. Payments still pending after MPESA_PAYMENT_TIMEOUT are
+    failed. Returns {'checked', 'success', 'failed', 'pending'} counts.
+    
+    Does nothing while the client is simulated (MPESA_ENABLED=false): no
+    push reached Daraja, so there is nothing to ask and payments stay pending.
+    """
+    if not mpesa_service.enabled:
+        return {'checked': 0, 'success': 0, 'failed': 0, 'pending': 0}
+    
+    now = now or datetime.utcnow()
+    payments = stale_pending_payments(now)
+    counts = {'checked': len(payments), 'success': 0, 'failed': 0, 'pending': 0}
+    if not payments:
+        return counts
+    
+    workers = min(len(payments), current_app.config.get('MPESA_POOL_SIZE', 10))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(mpesa_service.query_stk_status, [p.checkout_request_id for p in payments]))
+    
+    table = Payment.__table__
+    db.session.execute(table.update().where(table.c.id.in_([p.id for p in payments])).values(checked_at=now))
+    
+    timeout = now - timedelta(seconds=current_app.config.get('MPESA_PAYMENT_TIMEOUT', 600))
+    for payment, result in zip(payments, results):
+        if result['status'] == 'success':
+            settle_payment(payment.id, True, result_desc=result.get('result_desc'))
+        elif result['status'] == 'failed':
+            settle_payment(payment.id, False, result_desc=result.get('result_desc'))
+        elif payment.created_at <= timeout:
+            settle_payment(payment.id, False, result_desc='Timed out waiting for payment')
+            result = {'status': 'failed'}
+        counts[result['status']] += 1
+    
+    db.session.commit()
+    return counts
@@ -0,0 +1,205 @@
+import math
+import threading
+import time
+from flask import jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from services.cache import create_store
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+class RateLimited(Exception):
+    """A client went over a rate limit policy"""
+    
+    def __init__(self, policy, retry_after):
+        super().__init__(f'Rate limit {policy.rate} exceeded')
+        self.policy = policy
+        self.retry_after = retry_after
+
+
+def parse_rate(rate):
+    """'10/minute' -> (10, 60)"""
+    try:
+        limit, period = rate.split('/')
+        return int(limit), PERIODS[period.strip().rstrip('s')]
+    except (KeyError, ValueError):
+        raise ValueError(f'Invalid rate {rate!r}; use <count>/second|minute|hour|day')
+
+
+class Policy:
+    """One RATE_LIMIT_POLICIES entry"""
+    
+    def __init__(self, name, rate, burst=None, key='user', shared=False):
+        if key not in ('user', 'ip'):
+            raise ValueError(f"Rate limit key for {name!r} must be 'user' or 'ip'")
+        self.name = name
+        self.rate = rate
+        self.limit, self.period = parse_rate(rate)
+        self.burst = burst or self.limit
+        self.key = key
+        self.shared = shared
+        self.interval = self.period / self.limit  # seconds per token
+        self.allowed = 0
+        self.rejected = 0
+
+
+class RateLimiter:
+    """
+    Per-endpoint and per-blueprint request rate limits
+    
+    Policies (RATE_LIMIT_POLICIES) are looked up by endpoint, then by
+    blueprint, and count requests per signed-in user or per client IP.
+    Unshared policies use a token bucket in this worker (GCRA: one
+    "theoretical arrival time" per client, so a check is a dict read and
+    write, without a lock; racing requests of one client can let one extra
+    through). Shared policies count in a fixed window in
+    RATE_LIMIT_STORAGE_URL so the limit holds across gunicorn workers; with
+    no store configured, or while it is failing, they fall back to the
+    per-worker bucket. A shared window admits `count` requests per period
+    (`burst` only shapes the per-worker bucket). Requests over a limit get a
+    429 with Retry-After.
+    """
+    
+    def __init__(self):
+        self.enabled = False
+        self.policies = {}
+        self.storage_url = ''
+        self.shared = None
+        self.trusted_proxies = 0
+        self.max_buckets = 100000
+        self.store_errors = 0
+        self.app = None
+        self._arrivals = {}
+        self._prune_lock = threading.Lock()
+    
+    def init_app(self, app):
+        """Initialize with app configuration"""
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', True)
+        self.policies = {
+            name: Policy(name, **spec) for name, spec in (app.config.get('RATE_LIMIT_POLICIES') or {}).items()
+        }
+        self.storage_url = app.config.get('RATE_LIMIT_STORAGE_URL')
+        self.trusted_proxies = app.config.get('RATE_LIMIT_TRUSTED_PROXIES', 0)
+        self.max_buckets = app.config.get('RATE_LIMIT_MAX_BUCKETS', 100000)
+        self.app = app
+        self.reset()
+        app.before_request(_enforce_rate_limit)
+        
+        @app.errorhandler(RateLimited)
+        def rate_limited(error):
+            response = jsonify({'error': 'Too many requests, please retry later'})
+            response.headers['Retry-After'] = str(max(1, math.ceil(error.retry_after)))
+            return response, 429
+    
+    def policy_for(self, endpoint):
+        """The policy covering `endpoint` ('blueprint.view'), or None"""
+        if not endpoint:
+            return None
+        policy = self.policies.get(endpoint)
+        if policy is None and '.' in endpoint:
+            policy = self.policies.get(endpoint.rsplit('.', 1)[0])
+        return policy
+    
+    def client_ip(self):
+        """The client address, read from X-Forwarded-For behind RATE_LIMIT_TRUSTED_PROXIES proxies"""
+        if self.trusted_proxies:
+            forwarded = [part.strip() for part in request.headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+            if len(forwarded) >= self.trusted_proxies:
+                return forwarded[-self.trusted_proxies]
+        return request.remote_addr or 'unknown'
+    
+    def client_key(self, policy):
+        if policy.key == 'user':
+            try:
+                if verify_jwt_in_request(optional=True):
+                    return f'user:{get_jwt_identity()}'
+            except Exception:  # expired or invalid token: the view rejects it, count it by IP
+                pass
+        return f'ip:{self.client_ip()}'
+    
+    def hit(self, policy, key):
+        """Count one request; returns 0 if allowed, else seconds until the client may retry"""
+        wait = None
+        if policy.shared and self.shared is not None:
+            try:
+                wait = self._hit_shared(policy, key)
+            except Exception:
+                self.store_errors += 1
+                self.app.logger.warning('Rate limit store unavailable; limiting per worker', exc_info=True)
+        if wait is None:
+            wait = self._hit_local(policy, key)
+        if wait:
+            policy.rejected += 1
+        else:
+            policy.allowed += 1
+        return wait
+    
+    def _hit_local(self, policy, key):
+        bucket = f'{policy.name}:{key}'
+        now = time.monotonic()
+        arrival = max(self._arrivals.get(bucket, now), now) + policy.interval
+        wait = arrival - now - policy.burst * policy.interval
+        if wait > 0:
+            return wait
+        if len(self._arrivals) >= self.max_buckets:
+            self._prune(now)
+        self._arrivals[bucket] = arrival
+        return 0
+    
+    def _hit_shared(self, policy, key):
+        now = time.time()
+        window_end = (now // policy.period + 1) * policy.period
+        count = int(self.shared.incr(f'ratelimit:{policy.name}:{key}', window_end - now))
+        return window_end - now if count > policy.limit else 0
+    
+    def _prune(self, now):
+        # Buckets whose arrival time has passed are full again, the same as absent
+        if not self._prune_lock.acquire(blocking=False):
+            return
+        try:
+            self._arrivals = {bucket: arrival for bucket, arrival in self._arrivals.copy().items() if arrival > now}
+        finally:
+            self._prune_lock.release()
+    
+    def reset(self):
+        """Reconnect the shared store and forget this worker's buckets and counters"""
+        self.shared = create_store(self.storage_url)
+        self.store_errors = 0
+        self._arrivals = {}
+        for policy in self.policies.values():
+            policy.allowed = policy.rejected = 0
+    
+    def stats(self):
+        """Policies with allowed/rejected counters for this worker"""
+        return {
+            'enabled': self.enabled,
+            'backend': type(self.shared).__name__ if self.shared is not None else None,
+            'buckets': len(self._arrivals),
+            'store_errors': self.store_errors,
+            'policies': {
+                name: {
+                    'rate': policy.rate,
+                    'burst': policy.burst,
+                    'key': policy.key,
+                    'shared': policy.shared,
+                    'allowed': policy.allowed,
+                    'rejected': policy.rejected,
+                }
+                for name, policy in self.policies.items()
+            },
+        }
+
+
+def _enforce_rate_limit():
+    if not rate_limiter.enabled or request.method == 'OPTIONS':
+        return
+    policy = rate_limiter.policy_for(request.endpoint)
+    if policy is None:
+        return
+    wait = rate_limiter.hit(policy, rate_limiter.client_key(policy))
+    if wait:
+        raise RateLimited(policy, wait)
+
+
+# Create singleton instance
+rate_limiter = RateLimiter()
@@ -0,0 +1,246 @@
+import itertools
+import threading
+import time
+from datetime import datetime, timezone
+from flask import has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.selectable import GenerativeSelect, TextualSelect
+from services.cache import CATALOG_TABLES, MemoryStore, create_store
+
+
+class RoutingSession(FlaskSession):
+    """
+    Session that sends a read-only request's SELECTs to a read replica
+    
+    The replica is picked once per request by `replica_router` (only for
+    endpoints listed in READ_REPLICA_ENDPOINTS) on the first SELECT, including
+    raw SQL declared as one with text().columns(). Writes,
+    SELECT ... FOR UPDATE and every statement after the session's first
+    write go to the primary, so a request always reads its own writes.
+    """
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and isinstance(clause, (GenerativeSelect, TextualSelect))
+            and getattr(clause, '_for_update_arg', None) is None
+            and not self.info.get('replica_wrote')
+        ):
+            if 'replica_route' not in self.info:
+                self.info['replica_route'] = replica_router.route_for_request()
+            key = self.info['replica_route']
+            if key is not None:
+                return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+    
+    def use_primary(self):
+        """Read from the primary for the rest of this session (e.g. before a read that guards a write)"""
+        self.info['replica_wrote'] = True
+
+
+def _current_identity():
+    try:
+        return get_jwt_identity() if has_request_context() else None
+    except RuntimeError:  # no JWT verified for this request
+        return None
+
+
+class ReplicaRouter:
+    """
+    Picks a read replica for read-only requests, falling back to the primary
+    
+    How far each replica has got is read from its copy of the heartbeat row
+    the worker stamps on the primary (see `beat`), and cached for
+    REPLICA_CHECK_INTERVAL seconds. A replica is used only when it is
+    reachable, no more than REPLICA_MAX_LAG seconds behind, and has already
+    replayed the last write in the request's scope: the catalog, or the
+    signed-in user's cart and orders. Those write times ("watermarks") are
+    kept in REPLICA_WATERMARK_URL so every worker sees them; they expire after
+    REPLICA_MAX_LAG, when the lag bound alone guarantees the replica has them.
+    """
+    
+    WATERMARK_KEY = 'replica:watermark:{}'
+    
+    def __init__(self):
+        self.replicas = []
+        self.endpoints = {}
+        self.max_lag = 5.0
+        self.check_interval = 0.5
+        self.retry_after = 5.0
+        self.watermarks = MemoryStore()
+        self.app = None
+        self._positions = {}
+        self._rotation = itertools.count()
+        self._lock = threading.Lock()
+        self.routed = {'replica': 0, 'primary': 0}
+        self.fallbacks = {'down': 0, 'lagging': 0, 'behind': 0}
+    
+    def init_app(self, app):
+        """Initialize with app configuration"""
+        self.replicas = sorted(key for key in app.config.get('SQLALCHEMY_BINDS') or {} if key.startswith('replica'))
+        self.endpoints = dict(app.config.get('READ_REPLICA_ENDPOINTS') or {})
+        self.max_lag = app.config.get('REPLICA_MAX_LAG', 5.0)
+        self.check_interval = app.config.get('REPLICA_CHECK_INTERVAL', 0.5)
+        self.retry_after = app.config.get('REPLICA_RETRY_AFTER', 5.0)
+        self.watermarks = create_store(app.config.get('REPLICA_WATERMARK_URL')) or MemoryStore()
+        self._positions = {}
+        self.app = app
+        app.before_request(_reset_route)
+        _register_session_events()
+    
+    def position(self, key):
+        """Epoch seconds up to which `key` has replayed the primary, or None if unreachable"""
+        from models import db, ReplicaHeartbeat
+        
+        now = time.monotonic()
+        with self._lock:
+            cached = self._positions.get(key)
+        if cached is not None and now < cached[0]:
+            return cached[1]
+        
+        heartbeat = ReplicaHeartbeat.__table__
+        try:
+            with db.engines[key].connect() as connection:
+                beat_at = connection.execute(select(heartbeat.c.beat_at).where(heartbeat.c.id == 1)).scalar()
+            position = beat_at.replace(tzinfo=timezone.utc).timestamp() if beat_at is not None else 0.0
+            expires_at = now + self.check_interval
+        except Exception:
+            self.app.logger.warning('Read replica %s unreachable; using the primary', key, exc_info=True)
+            position, expires_at = None, now + self.retry_after
+        with self._lock:
+            self._positions[key] = (expires_at, position)
+        return position
+    
+    def watermark(self, scope):
+        value = self.watermarks.get(self.WATERMARK_KEY.format(scope))
+        return float(value) if value is not None else 0.0
+    
+    def mark_written(self, scopes):
+        """Record that `scopes` were just written on the primary"""
+        now = repr(time.time())
+        for scope in scopes:
+            self.watermarks.set(self.WATERMARK_KEY.format(scope), now, int(self.max_lag) + 1)
+    
+    def choose(self, scopes):
+        """A replica that can serve reads of `scopes`, or None for the primary"""
+        if not self.replicas:
+            return None
+        needed = max((self.watermark(scope) for scope in scopes), default=0.0)
+        now = time.time()
+        start = next(self._rotation)
+        reason = None
+        for i in range(len(self.replicas)):
+            key = self.replicas[(start + i) % len(self.replicas)]
+            position = self.position(key)
+            if position is None:
+                reason = reason or 'down'
+            elif now - position > self.max_lag:
+                reason = 'lagging'
+            elif position < needed:
+                reason = 'behind'
+            else:
+                return key
+        self.fallbacks[reason] += 1
+        return None
+    
+    def route_for_request(self):
+        """Bind key for the current request's reads (None = primary)"""
+        scope = self.endpoints.get(request.endpoint) if has_request_context() and self.replicas else None
+        if scope == 'user':
+            identity = _current_identity()
+            scope = f'user:{identity}' if identity is not None else None
+        key = self.choose((scope,)) if scope is not None else None
+        self.routed['replica' if key is not None else 'primary'] += 1
+        return key
+    
+    def stats(self):
+        """Replica positions and routing counters for this worker"""
+        now = time.time()
+        replicas = {}
+        for key in self.replicas:
+            position = self.position(key)
+            replicas[key] = {
+                'healthy': position is not None,
+                'lag_seconds': round(now - position, 3) if position is not None else None,
+            }
+        return {
+            'replicas': replicas,
+            'max_lag': self.max_lag,
+            'routed': dict(self.routed),
+            'fallbacks': dict(self.fallbacks),
+        }
+
+
+def beat(now=None):
+    """Stamp the heartbeat row on the primary (the worker runs this every REPLICA_HEARTBEAT_INTERVAL)"""
+    from models import db, ReplicaHeartbeat
+    
+    db.session.merge(ReplicaHeartbeat(id=1, beat_at=now or datetime.utcnow()))
+    db.session.commit()
+
+
+def _reset_route():
+    # The session outlives the request when the app context was pushed by the caller
+    from models import db
+    
+    db.session.info.pop('replica_route', None)
+    db.session.info.pop('replica_wrote', None)
+
+
+def _note_write(session, tables):
+    session.info['replica_wrote'] = True
+    scopes = session.info.setdefault('replica_scopes', set())
+    scopes.add('user')
+    if tables & CATALOG_TABLES:
+        scopes.add('catalog')
+
+
+def _on_after_flush(session, flush_context):
+    tables = {getattr(instance, '__tablename__', None) for instance in (*session.new, *session.dirty, *session.deleted)}
+    _note_write(session, tables)
+
+
+def _on_orm_execute(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        _note_write(orm_execute_state.session, {getattr(table, 'name', None)})
+
+
+def _on_after_commit(session):
+    if session.in_nested_transaction():
+        return
+    scopes = session.info.pop('replica_scopes', None)
+    if not scopes or not replica_router.replicas:
+        return
+    identity = _current_identity() if 'user' in scopes else None
+    scopes.discard('user')
+    if identity is not None:
+        scopes.add(f'user:{identity}')
+    if scopes:
+        replica_router.mark_written(scopes)
+
+
+def _on_after_soft_rollback(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop('replica_scopes', None)
+
+
+_events_registered = False
+
+
+def _register_session_events():
+    global _events_registered
+    if _events_registered:
+        return
+    event.listen(Session, 'after_flush', _on_after_flush)
+    event.listen(Session, 'do_orm_execute', _on_orm_execute)
+    event.listen(Session, 'after_commit', _on_after_commit)
+    event.listen(Session, 'after_soft_rollback', _on_after_soft_rollback)
+    _events_registered = True
+
+
+# Create singleton instance
+replica_router = ReplicaRouter()
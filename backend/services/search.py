@@ -0,0 +1,314 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+from flask import current_app
+from sqlalchemy import inspect, text
+from models import db, Product
+from services.cache import catalog_cache
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Relative weight of a term found in the product name vs. its description
+NAME_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def tokenize(value):
+    """Lowercased word tokens"""
+    return TOKEN_RE.findall(value.lower()) if value else []
+
+
+def parse_query(q):
+    """
+    Split a search string into (terms, prefix_term)
+    
+    For type-ahead the last term is matched as a prefix unless the query ends
+    with whitespace (the user finished typing that word).
+    """
+    terms = tokenize(q)
+    if not terms:
+        return [], None
+    if q[-1:].isspace():
+        return terms, None
+    return terms[:-1], terms[-1]
+
+
+class InvertedIndex:
+    """
+    Pure-Python inverted index over product names and descriptions
+    
+    Used when the database has no full-text index (fresh SQLite files created
+    by db.create_all(), other dialects) and in benchmarks. Postings map a
+    term to {product_id: weighted term frequency}; prefix lookups bisect a
+    sorted vocabulary.
+    """
+    
+    def __init__(self, featured_boost=1.25):
+        self.featured_boost = featured_boost
+        self.postings = {}
+        self.featured = set()
+        self.categories = {}
+        self.vocabulary = []
+        self.size = 0
+    
+    def add(self, product_id, name, description, is_featured=False, category_id=None):
+        for term in tokenize(name):
+            postings = self.postings.setdefault(term, {})
+            postings[product_id] = postings.get(product_id, 0.0) + NAME_WEIGHT
+        for term in tokenize(description):
+            postings = self.postings.setdefault(term, {})
+            postings[product_id] = postings.get(product_id, 0.0) + DESCRIPTION_WEIGHT
+        if is_featured:
+            self.featured.add(product_id)
+        self.categories[product_id] = category_id
+        self.size += 1
+    
+    def finalize(self):
+        """Sort the vocabulary for prefix lookups; call after bulk add()"""
+        self.vocabulary = sorted(self.postings)
+        return self
+    
+    def _idf(self, postings):
+        return math.log(1 + self.size / len(postings))
+    
+    def _term_scores(self, term):
+        postings = self.postings.get(term)
+        if not postings:
+            return {}
+        idf = self._idf(postings)
+        return {product_id: tf * idf for product_id, tf in postings.items()}
+    
+    def _prefix_scores(self, prefix):
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        scores = {}
+        for term in self.vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            postings = self.postings[term]
+            idf = self._idf(postings)
+            for product_id, tf in postings.items():
+                score = tf * idf
+                if score > scores.get(product_id, 0.0):
+                    scores[product_id] = score
+        return scores
+    
+    def search(self, q, limit=20, category_id=None):
+        """Return [(product_id, score)] best first; every term must match"""
+        terms, prefix = parse_query(q)
+        term_scores = [self._term_scores(term) for term in terms]
+        if prefix:
+            term_scores.append(self._prefix_scores(prefix))
+        if not term_scores or not all(term_scores):
+            return []
+        
+        # Intersect starting from the rarest term
+        term_scores.sort(key=len)
+        totals = dict(term_scores[0])
+        for scores in term_scores[1:]:
+            totals = {pid: total + scores[pid] for pid, total in totals.items() if pid in scores}
+            if not totals:
+                return []
+        
+        if category_id is not None:
+            totals = {pid: score for pid, score in totals.items() if self.categories.get(pid) == category_id}
+        
+        boost = self.featured_boost
+        featured = self.featured
+        return heapq.nlargest(
+            limit,
+            ((pid, score * boost if pid in featured else score) for pid, score in totals.items()),
+            key=lambda item: item[1]
+        )
+
+
+class MemorySearchBackend:
+    """InvertedIndex built from the products table, rebuilt after catalog writes"""
+    
+    name = 'memory'
+    
+    def __init__(self):
+        self._index = None
+        self._version = None
+        self._lock = threading.Lock()
+    
+    def _current_index(self):
+        version = catalog_cache.version()
+        if self._index is None or self._version != version:
+            with self._lock:
+                if self._index is None or self._version != version:
+                    index = InvertedIndex(current_app.config.get('SEARCH_FEATURED_BOOST', 1.25))
+                    rows = db.session.query(
+                        Product.id, Product.name, Product.description, Product.is_featured, Product.category_id
+                    ).yield_per(2000)
+                    for row in rows:
+                        index.add(*row)
+                    self._index, self._version = index.finalize(), version
+        return self._index
+    
+    def search(self, q, limit=20, category_id=None):
+        return self._current_index().search(q, limit, category_id)
+
+
+def _rank_window():
+    return current_app.config.get('SEARCH_RANK_WINDOW', 2000)
+
+
+class SQLiteSearchBackend:
+    """
+    FTS5 virtual table (products_fts) ranked with bm25
+    
+    bm25() costs O(matches), and short type-ahead prefixes can match a large
+    share of the catalog, so ranking is limited to the newest
+    SEARCH_RANK_WINDOW matches (found cheaply in rowid order). Selective
+    queries are ranked exactly.
+    """
+    
+    name = 'sqlite-fts5'
+    
+    def search(self, q, limit=20, category_id=None):
+        terms, prefix = parse_query(q)
+        if not terms and not prefix:
+            return []
+        
+        match = ' '.join([f'"{term}"' for term in terms] + ([f'"{prefix}"*'] if prefix else []))
+        category_join = ' JOIN products c ON c.id = products_fts.rowid AND c.category_id = :category_id' if category_id is not None else ''
+        sql = (
+            'SELECT p.id, bm25(products_fts, :name_weight, :description_weight) '
+            '       * CASE WHEN p.is_featured THEN :boost ELSE 1.0 END AS score '
+            'FROM products_fts JOIN products p ON p.id = products_fts.rowid '
+            'WHERE products_fts MATCH :match AND products_fts.rowid >= ('
+            '    SELECT coalesce(min(rowid), 0) FROM ('
+            '        SELECT products_fts.rowid AS rowid FROM products_fts' + category_join +
+            '        WHERE products_fts MATCH :match ORDER BY products_fts.rowid DESC LIMIT :window))'
+            + (' AND p.category_id = :category_id' if category_id is not None else '')
+            + ' ORDER BY score LIMIT :limit'
+        )
+        rows = db.session.execute(text(sql).columns(id=db.Integer, score=db.Float), {
+            'match': match,
+            'name_weight': NAME_WEIGHT,
+            'description_weight': DESCRIPTION_WEIGHT,
+            'boost': current_app.config.get('SEARCH_FEATURED_BOOST', 1.25),
+            'category_id': category_id,
+            'window': _rank_window(),
+            'limit': limit,
+        })
+        # bm25() is lower-is-better; flip the sign so scores read best-first
+        return [(row.id, -row.score) for row in rows]
+
+
+class PostgresSearchBackend:
+    """
+    Generated tsvector column (products.search_vector) with a GIN index
+    
+    As with FTS5, ts_rank() runs over at most the newest SEARCH_RANK_WINDOW
+    matches so broad prefixes stay cheap.
+    """
+    
+    name = 'postgres-tsvector'
+    
+    def search(self, q, limit=20, category_id=None):
+        terms, prefix = parse_query(q)
+        if not terms and not prefix:
+            return []
+        
+        tsquery = ' & '.join(terms + ([f'{prefix}:*'] if prefix else []))
+        sql = (
+            "SELECT id, ts_rank(search_vector, query) "
+            "       * CASE WHEN is_featured THEN :boost ELSE 1.0 END AS score "
+            "FROM ("
+            "    SELECT p.id, p.search_vector, p.is_featured, query "
+            "    FROM products p, to_tsquery('simple', :tsquery) query "
+            "    WHERE p.search_vector @@ query"
+            + (' AND p.category_id = :category_id' if category_id is not None else '')
+            + "    ORDER BY p.id DESC LIMIT :window"
+            ") candidates ORDER BY score DESC LIMIT :limit"
+        )
+        rows = db.session.execute(text(sql).columns(id=db.Integer, score=db.Float), {
+            'tsquery': tsquery,
+            'boost': current_app.config.get('SEARCH_FEATURED_BOOST', 1.25),
+            'category_id': category_id,
+            'window': _rank_window(),
+            'limit': limit,
+        })
+        return [(row.id, row.score) for row in rows]
+
+
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+    "name, description, content='products', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN "
+    "INSERT INTO products_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); "
+    "INSERT INTO products_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    "INSERT INTO products_fts(products_fts) VALUES ('rebuild')",
+]
+
+POSTGRES_SEARCH_DDL = [
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING GIN (search_vector)",
+]
+
+
+def ensure_search_schema(engine):
+    """Create the dialect's full-text index over products (idempotent)"""
+    statements = {
+        'sqlite': SQLITE_SEARCH_DDL,
+        'postgresql': POSTGRES_SEARCH_DDL,
+    }.get(engine.dialect.name)
+    if not statements:
+        return False
+    
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+    _backends.pop(engine, None)
+    return True
+
+
+def _has_search_schema(engine):
+    inspector = inspect(engine)
+    if engine.dialect.name == 'sqlite':
+        return 'products_fts' in inspector.get_table_names()
+    if engine.dialect.name == 'postgresql':
+        return 'search_vector' in {col['name'] for col in inspector.get_columns('products')}
+    return False
+
+
+_backends = {}
+
+
+def search_backend():
+    """
+    Search backend for the current database
+    
+    SEARCH_BACKEND='auto' uses the database index when it exists and falls
+    back to the in-memory index; 'memory' forces the fallback.
+    """
+    engine = db.engine
+    backend = _backends.get(engine)
+    if backend is not None:
+        return backend
+    
+    mode = current_app.config.get('SEARCH_BACKEND', 'auto')
+    if mode != 'memory' and _has_search_schema(engine):
+        backend = SQLiteSearchBackend() if engine.dialect.name == 'sqlite' else PostgresSearchBackend()
+    else:
+        backend = MemorySearchBackend()
+    
+    _backends[engine] = backend
+    return backend
+
+
+def ranked_product_ids(q, limit=20, category_id=None):
+    """Product ids matching `q`, most relevant first"""
+    return [product_id for product_id, _ in search_backend().search(q, limit, category_id)]
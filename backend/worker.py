@@ -0,0 +1,58 @@
+"""
+Background worker: runs queued jobs (STK pushes) and periodic maintenance
+
+    python worker.py                  # poll forever
+    python worker.py --once           # drain due jobs and run maintenance once
+    python worker.py --queues default
+"""
+import argparse
+import signal
+from app import create_app
+from services import payments  # noqa: F401  (registers the payment tasks)
+from services.inventory import release_expired
+from services.jobs import Worker, requeue_stale, work_off
+from services.replicas import beat
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run background jobs')
+    parser.add_argument('--queues', default='default', help='comma-separated queue names')
+    parser.add_argument('--once', action='store_true', help='run due jobs and maintenance once, then exit')
+    args = parser.parse_args()
+    
+    app = create_app(blueprints=())
+    config = app.config
+    queues = [q.strip() for q in args.queues.split(',') if q.strip()]
+    
+    periodic = [
+        (config['MPESA_RECONCILE_INTERVAL'], payments.reconcile_pending_payments),
+        (config['STOCK_SWEEP_INTERVAL'], release_expired),
+        (config['JOB_LOCK_TIMEOUT'], requeue_stale),
+    ]
+    if config['SQLALCHEMY_BINDS']:
+        # Replicas are only read while this heartbeat keeps arriving
+        periodic.append((config['REPLICA_HEARTBEAT_INTERVAL'], beat))
+    
+    worker = Worker(
+        app,
+        queues=queues,
+        batch_size=config['JOB_BATCH_SIZE'],
+        poll_interval=config['JOB_POLL_INTERVAL'],
+        periodic=periodic
+    )
+    
+    if args.once:
+        with app.app_context():
+            worker.run_periodic()
+            processed = work_off(queues, config['JOB_BATCH_SIZE'])
+        print(f'Processed {processed} job(s)')
+        return
+    
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    app.logger.info('Worker polling queues: %s', ', '.join(queues))
+    worker.run()
+
+
+if __name__ == '__main__':
+    main()